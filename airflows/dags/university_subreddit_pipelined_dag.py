@@ -0,0 +1,238 @@
+import uuid
+from datetime import datetime
+
+from airflow import DAG
+from airflow.decorators import task, task_group
+from airflow.operators.python import PythonOperator
+from airflow.providers.ssh.operators.ssh import SSHOperator
+
+import sys
+sys.path.append("/opt/airflow/scripts/")
+
+from etl.pipeline_config import (load_pipeline_config, run_etl,
+    DATA_META_COMBINED_PATH, IMAGE_CAPTION_PATH, IMAGE_TEXT_DIR, IMAGE_TEXT_FILENAME,
+    IMAGE_TEXT_SENTIMENT_PATH, META_TEXT_DIR, META_TEXT_FILENAME, COMPACTION_MIN_FILE_AGE_SECONDS,
+    IMAGE_CAPTION_TEXT_SQL, META_TEXT_SQL)
+from etl.dag_helpers import (var, reddit_client_args, run_ssh_command, proj_init_wrapper, generate_ssh_hooks, image_ssh_connection_ids, vm_pull_commands,
+    report_tasks, SSH_CONNECTION_ID_FOR_STR, GPU_SSH_CONNECTION_ID, TERRAFORM_STORAGES, BIGQUERY_TABLE_ID)
+from etl.segment_log import IDLE_TIMEOUT_SECONDS
+from etl.tracing import docker_env
+from etl.warm_worker import submit_command
+
+# Idea(pipelined execution mode):
+# The global DAG waits for every subreddit at each stage, the slowest subreddit delays all the others
+# Here every subreddit runs through its own stages under {directory}/{subreddit}/ in a mapped task group
+#   scrape -> compact + merge(meta, text, image) -> caption -> merge caption/text -> sentiment -> merge meta/text
+#   image scrape -> runs next to the scrape on the image log of the subreddit(etl/segment_log.py), the caption waits for both
+# The map index of a subreddit only waits for its own upstream tasks, so a subreddit moves on as soon as its scrape finishes
+# The gpu stages run one subreddit at a time(max_active_tis_per_dag) since they share the single gpu vm
+# At the end the union(etl/union_subreddit_outputs.py) commits {directory}/meta_text_merge/ with the files of every subreddit
+# and the reports run the same way as in the global DAG
+# The DAG is not scheduled, trigger it instead of the global DAG
+
+# the image scraping waits on the image log up to its idle timeout, then scrapes the images of the last segment
+IMAGE_STREAM_TIMEOUT = int(IDLE_TIMEOUT_SECONDS) + 1000
+
+def ssh_stage(ssh_conn_id : str, command : str, timeout : int, client_idx : int = None) -> dict:
+    """An ssh command of a plan, client_idx is the reddit client whose secret run_ssh_command fills in"""
+    return {"ssh_conn_id" : ssh_conn_id, "command" : command, "timeout" : timeout, "client_idx" : client_idx}
+
+def etl_stage(module_name : str, function_name : str, etl_kwargs : dict) -> dict:
+    return {"module_name" : module_name, "function_name" : function_name, "etl_kwargs" : etl_kwargs}
+
+def subreddit_plan(config : dict, conn_idx : int, image_ssh_conn_id : str, subreddit : str, stream_token : str) -> dict:
+    """The commands and the etl calls of every stage of a subreddit
+    Args:
+        config (dict): the pipeline config
+        conn_idx (int): the VM and the reddit client of the subreddit
+        image_ssh_conn_id (str): the VM that scrapes the images of the subreddit
+        subreddit (str): the subreddit name
+        stream_token (str): the token of the run shared by the scraping and the image scraping of the image log
+    Returns:
+        dict: {"subreddit", "ssh" : {stage : ssh command}, "etl" : {stage : etl call}}
+    """
+    from etl.union_subreddit_outputs import subreddit_directory
+    ssh_conn_id = SSH_CONNECTION_ID_FOR_STR.format(id = conn_idx)
+    directory = subreddit_directory(config["directory"], subreddit)
+    docker_username = config["docker_username"]
+    # the containers export their spans into the run
+    trace_env = docker_env(config["spark_bucket"], config["directory"])
+    ssh_stages = {
+        # the jobs of the warm workers of the VM
+        "scraping" : ssh_stage(ssh_conn_id, submit_command(docker_username, "scrape-reddit", trace_env, f"""{reddit_client_args(config, conn_idx)} \
+                --start_date {config["start_date"]} \
+                --end_date {config["end_date"]} \
+                --subreddit {subreddit} \
+                --directory {directory} \
+                --image_bucket {config["image_bucket"]} \
+                --text_bucket {config["text_bucket"]} \
+                --meta_bucket {config["meta_bucket"]} \
+                --image_stream \
+                --stream_token {stream_token}"""), 1000, client_idx = conn_idx),
+        # the images of the subreddit are scraped by a single VM, from the image chunks the scraper appends to the image log
+        "image_scraping" : ssh_stage(image_ssh_conn_id, submit_command(docker_username, "scrape-image", trace_env, f"""--n_vm_instances 1 \
+            --vm_idx 0 \
+            --storage_bucket {config["image_bucket"]} \
+            --directory {directory} \
+            --stream \
+            --stream_token {stream_token}"""), IMAGE_STREAM_TIMEOUT),
+        "generate_image_caption" : ssh_stage(GPU_SSH_CONNECTION_ID, f"""sudo docker run --gpus all {trace_env} {docker_username}/reddit-image-caption:latest \
+            --image_bucket_name {config["image_bucket"]} \
+            --date_directory {directory} \
+            --image_meta_path {DATA_META_COMBINED_PATH}
+        """, 10000),
+        "sentiment_analysis" : ssh_stage(GPU_SSH_CONNECTION_ID, f"""
+            sudo docker run --gpus all {trace_env} {docker_username}/reddit-sentiment-analysis:latest --text_bucket_name {config["text_bucket"]} --date_directory {directory} --image_text_path {IMAGE_TEXT_DIR}/{IMAGE_TEXT_FILENAME} --output_bucket_name {config["text_bucket"]} --output_path {IMAGE_TEXT_SENTIMENT_PATH}
+        """, 10000)
+    }
+    etl_stages = {}
+    for bucket_name_key in TERRAFORM_STORAGES:
+        etl_stages[f"compact_{bucket_name_key}"] = etl_stage("compact_small_files", "compact_small_files_main", {
+            "bucket_name" : config[bucket_name_key],
+            "directory" : directory,
+            "min_file_age_seconds" : COMPACTION_MIN_FILE_AGE_SECONDS
+        })
+        etl_stages[f"merge_{bucket_name_key}"] = etl_stage("dataproc_single_directory", "dataproc_single_directory_main", {
+            "cluster_name" : config["cluster_name"],
+            "region" : config["region"],
+            "storage_bucket_name" : config[bucket_name_key],
+            "storage_directory" : directory,
+            "job_bucket_name" : config["spark_bucket"],
+            "job_file_path" : "dataproc_merge_files.py", #Hard code
+            "image_bucket_name" : config["image_bucket"]
+        })
+    etl_stages["merge_image_caption_text"] = etl_stage("dataproc_merge_two_files_submit", "dataproc_merge_two_files_submit_main", {
+        "cluster_name" : config["cluster_name"],
+        "region" : config["region"],
+        "bucket1" : config["text_bucket"],
+        "bucket2" : config["image_bucket"],
+        "date_directory" : directory,
+        "file1_path" : DATA_META_COMBINED_PATH,
+        "file2_path" : IMAGE_CAPTION_PATH,
+        "job_bucket_name" : config["spark_bucket"],
+        "job_file_path" : "dataproc_merge_two_files.py", # hard code
+        "output_bucket" : config["text_bucket"],
+        "output_directory" : IMAGE_TEXT_DIR,
+        "output_filename" : IMAGE_TEXT_FILENAME,
+        "sql_statement" : IMAGE_CAPTION_TEXT_SQL
+    })
+    etl_stages["merge_meta_text"] = etl_stage("dataproc_merge_two_files_submit", "dataproc_merge_two_files_submit_main", {
+        "cluster_name" : config["cluster_name"],
+        "region" : config["region"],
+        "bucket1" : config["meta_bucket"],
+        "bucket2" : config["text_bucket"],
+        "date_directory" : directory,
+        "file1_path" : DATA_META_COMBINED_PATH,
+        "file2_path" : IMAGE_TEXT_SENTIMENT_PATH,
+        "job_bucket_name" : config["spark_bucket"],
+        "job_file_path" : "dataproc_merge_two_files.py", # hard code
+        "output_bucket" : config["meta_bucket"],
+        "output_directory" : META_TEXT_DIR,
+        "output_filename" : META_TEXT_FILENAME,
+        "sql_statement" : META_TEXT_SQL
+    })
+    return {"subreddit" : subreddit, "ssh" : ssh_stages, "etl" : etl_stages}
+
+def subreddit_plans() -> list[dict]:
+    """The plan of every subreddit, the expansion of the subreddit pipeline"""
+    from etl.scrape_scheduler import lpt_schedule, scrape_schedule
+    config = load_pipeline_config()
+    schedule = scrape_schedule(config, BIGQUERY_TABLE_ID)
+    # the image VMs are balanced by the same expected volumes
+    image_ssh_conn_ids = image_ssh_connection_ids(config)
+    image_assignments = lpt_schedule(config["subreddits"], schedule["volumes"], len(image_ssh_conn_ids))["assignments"]
+    # a new token every time the plan runs(a new run or a cleared run), the retries of a stage keep it
+    stream_token = uuid.uuid4().hex
+    return [subreddit_plan(config, schedule["assignments"][subreddit], image_ssh_conn_ids[image_assignments[subreddit]], subreddit, stream_token)
+            for subreddit in config["subreddits"]]
+
+def union_meta_text_outputs():
+    """Commit the merged meta text of every subreddit as the merged meta text of the run"""
+    config = load_pipeline_config()
+    run_etl("union_subreddit_outputs", "union_subreddit_outputs_main", {
+        "bucket_name" : config["meta_bucket"],
+        "directory" : config["directory"],
+        "subreddits" : config["subreddits"],
+        "output_directory" : META_TEXT_DIR
+    }, "union_meta_text")
+
+@task
+def run_ssh_stage(plan : dict, stage : str):
+    """Run the docker command of the stage of a subreddit on its ssh connection"""
+    run_ssh_command(**plan["ssh"][stage], description = f"{stage} of {plan['subreddit']}")
+
+@task
+def run_etl_stage(plan : dict, stage : str):
+    """Run the etl function of the stage of a subreddit"""
+    stage_dict = plan["etl"][stage]
+    run_etl(stage_dict["module_name"], stage_dict["function_name"], stage_dict["etl_kwargs"], stage, plan["subreddit"])
+
+@task_group(group_id = "subreddit_pipeline")
+def subreddit_pipeline(plan : dict):
+    """The stages of a single subreddit, every task waits only for the tasks of the same subreddit"""
+    scraping = run_ssh_stage.override(task_id = "scraping")(plan, "scraping")
+    merge_ops = {}
+    for bucket_name_key in TERRAFORM_STORAGES:
+        compact_op = run_etl_stage.override(task_id = f"compact_{bucket_name_key}")(plan, f"compact_{bucket_name_key}")
+        merge_ops[bucket_name_key] = run_etl_stage.override(task_id = f"merge_{bucket_name_key}")(plan, f"merge_{bucket_name_key}")
+        scraping >> compact_op >> merge_ops[bucket_name_key]
+    image_scraping = run_ssh_stage.override(task_id = "image_scraping")(plan, "image_scraping")
+    image_caption = run_ssh_stage.override(task_id = "generate_image_caption", max_active_tis_per_dag = 1)(plan, "generate_image_caption")
+    image_text_merge = run_etl_stage.override(task_id = "merge_image_caption_text")(plan, "merge_image_caption_text")
+    sentiment_analysis = run_ssh_stage.override(task_id = "sentiment_analysis", max_active_tis_per_dag = 1)(plan, "sentiment_analysis")
+    meta_text_merge = run_etl_stage.override(task_id = "merge_meta_text")(plan, "merge_meta_text")
+    # the image scraping consumes the image log while the scraping appends to it
+    [image_scraping, merge_ops["image_bucket"]] >> image_caption
+    [image_caption, merge_ops["text_bucket"]] >> image_text_merge >> sentiment_analysis
+    [merge_ops["meta_bucket"], sentiment_analysis] >> meta_text_merge
+
+with DAG(
+    dag_id="university-subreddit-data-dashboard-pipelined",
+    start_date=datetime(year=2024, month=1, day=1, hour=0, minute=0, second=1),
+    schedule_interval=None,
+    tags=["reddit"]
+) as dag:
+    proj_init = PythonOperator(
+        task_id = "project_init",
+        python_callable = proj_init_wrapper,
+    )
+    ssh_hook_generation = PythonOperator(
+        task_id = "ssh_hook_generation",
+        python_callable = generate_ssh_hooks,
+    )
+    vm_connections = PythonOperator(
+        task_id = "plan_vm_connections",
+        python_callable = vm_pull_commands,
+    )
+    plans = PythonOperator(
+        task_id = "plan_subreddits",
+        python_callable = subreddit_plans,
+    )
+    proj_init >> ssh_hook_generation >> [vm_connections, plans]
+    # Pull the docker images and start the warm workers of the VMs
+    vm_docker_pull = SSHOperator.partial(
+        task_id = "pull_docker_vm_images",
+        conn_timeout = 100,
+        cmd_timeout = 100
+    ).expand_kwargs(vm_connections.output)
+    gpu_docker_pull = SSHOperator(
+        task_id = "gpu_pull_docker_images",
+        ssh_conn_id = GPU_SSH_CONNECTION_ID,
+        command = f"""
+                    sudo docker pull {var("docker_username")}/reddit-image-caption:latest &&
+                    sudo docker pull {var("docker_username")}/reddit-sentiment-analysis:latest
+        """,
+        conn_timeout = 1000,
+        cmd_timeout = 1000
+    )
+    ssh_hook_generation >> gpu_docker_pull
+
+    pipelines = subreddit_pipeline.expand(plan = plans.output)
+    [vm_docker_pull, gpu_docker_pull] >> pipelines
+
+    union_op = PythonOperator(
+        task_id = "union_meta_text",
+        python_callable = union_meta_text_outputs,
+    )
+    pipelines >> union_op
+    union_op >> report_tasks()
@@ -0,0 +1,151 @@
+import argparse
+import json
+import math
+from pathlib import Path
+
+from etl.scrape_scheduler import directory_days, estimate_volumes, history_volumes, lpt_schedule, read_history, read_manifest_volumes
+
+# Idea:
+# The number of VMs is fixed when the infrastructure is created, one per reddit client, and the image scraping
+# re-uses them. Size every stage from its pending work instead
+#   scrape       -> the expected rows of the subreddits(scrape scheduler), packed onto k clients with the lpt heuristic,
+#                   the smallest k whose makespan fits the target, at most one worker per reddit client
+#   image scrape -> the image rows of combined.parquet(its footer only), estimated from the scrape rows before it exists,
+#                   split evenly onto dedicated image VMs, they need no reddit client so they scale on their own
+#   caption      -> one caption per image row on the GPU machine(a single one in terraform), only reported
+# The plan is written as terraform variables(capacity.auto.tfvars.json, loaded after terraform.tfvars),
+# a stage that cannot fit the target with its limit is flagged instead of silently planned
+# Plan from an explicit backlog before `make terraform-init`(from airflows/scripts):
+#   python -m etl.capacity_planner --volumes_json volumes.json --reddit_credential reddit.json --output_path ../../terraform/capacity.auto.tfvars.json
+# The rates are measured per worker, re-measure them from the stage spans of the trace(trace_summary) when they drift
+
+# rows(posts and comments) a reddit client scrapes per minute, the reddit api rate limit dominates it
+SCRAPE_ROWS_PER_MINUTE = 600
+# images an e2-small downloads and uploads per minute
+IMAGES_PER_WORKER_MINUTE = 240
+# captions per minute of the T4 GPU
+CAPTIONS_PER_GPU_MINUTE = 300
+# the share of the scraped rows with an image, used before combined.parquet exists
+IMAGE_ROW_SHARE = 0.05
+DEFAULT_TARGET_MINUTES = 60
+MAX_IMAGE_WORKERS = 32
+GPU_WORKERS = 1
+IMAGE_META_PATH = "{directory}/combined/combined.parquet"
+CAPACITY_PLAN_PATH = "runs/{directory}/capacity.auto.tfvars.json"
+
+
+def stage_plan(backlog : float, rate_per_minute : float, workers : int, limit : int, target_minutes : float) -> dict:
+    """The plan of a stage whose backlog is split evenly onto its workers"""
+    expected_minutes = backlog / (rate_per_minute * workers) if workers > 0 else 0.0
+    return {"backlog" : backlog, "workers" : workers, "limit" : limit,
+            "expected_minutes" : round(expected_minutes, 1), "over_target" : expected_minutes > target_minutes}
+
+
+def scrape_workers(volumes : dict, n_reddit_clients : int, target_minutes : float) -> (int, float):
+    """The fewest reddit clients whose lpt makespan fits the target
+    Returns:
+        (int, float): the number of workers and the rows of its makespan, all the clients if none fits
+    """
+    subreddits = list(volumes)
+    limit = max(1, min(n_reddit_clients, len(subreddits)))
+    for n_workers in range(1, limit + 1):
+        makespan = max(lpt_schedule(subreddits, volumes, n_workers)["loads"], default=0.0)
+        if makespan <= SCRAPE_ROWS_PER_MINUTE * target_minutes:
+            break
+    return n_workers, makespan
+
+
+def plan_capacity(volumes : dict, image_rows : int, n_reddit_clients : int, target_minutes : float = DEFAULT_TARGET_MINUTES) -> dict:
+    """Size the workers of every stage from its pending work
+    Args:
+        volumes (dict): subreddit -> the rows expected in the run
+        image_rows (int): the image rows to scrape(and caption)
+        n_reddit_clients (int): the reddit clients, the limit of the scrape workers
+        target_minutes (float, optional): the wall minutes of a stage. Defaults to DEFAULT_TARGET_MINUTES.
+    Returns:
+        dict: {"target_minutes", "stages" : {stage : {"backlog", "workers", "limit", "expected_minutes", "over_target"}}}
+    """
+    n_scrape, makespan = scrape_workers(volumes, n_reddit_clients, target_minutes)
+    scrape = stage_plan(sum(volumes.values()), SCRAPE_ROWS_PER_MINUTE, n_scrape, n_reddit_clients, target_minutes)
+    # the slowest client decides the stage, not the average
+    scrape["expected_minutes"] = round(makespan / SCRAPE_ROWS_PER_MINUTE, 1)
+    scrape["over_target"] = scrape["expected_minutes"] > target_minutes
+    n_image = min(MAX_IMAGE_WORKERS, math.ceil(image_rows / (IMAGES_PER_WORKER_MINUTE * target_minutes)))
+    stages = {
+        "scrape" : scrape,
+        "image_scrape" : stage_plan(image_rows, IMAGES_PER_WORKER_MINUTE, n_image, MAX_IMAGE_WORKERS, target_minutes),
+        "caption" : stage_plan(image_rows, CAPTIONS_PER_GPU_MINUTE, GPU_WORKERS, GPU_WORKERS, target_minutes)
+    }
+    return {"target_minutes" : target_minutes, "stages" : stages}
+
+
+def terraform_variables(plan : dict) -> dict:
+    """The machine counts of the plan, image_machine_count 0 keeps the image scraping on the scrape VMs"""
+    return {"scrape_machine_count" : plan["stages"]["scrape"]["workers"],
+            "image_machine_count" : plan["stages"]["image_scrape"]["workers"]}
+
+
+def print_plan(plan : dict):
+    print(f"{'stage':<14}{'backlog':>10}{'workers':>9}{'limit':>7}{'minutes':>9}")
+    for stage, stage_values in plan["stages"].items():
+        flag = f"  over the {plan['target_minutes']} minute target" if stage_values["over_target"] else ""
+        print(f"{stage:<14}{stage_values['backlog']:>10.0f}{stage_values['workers']:>9}{stage_values['limit']:>7}"
+              f"{stage_values['expected_minutes']:>9.1f}{flag}")
+
+
+def image_backlog(storage_client, image_bucket : str, directory : str):
+    """The rows of the image meta of the run from its parquet footer, None before the merge wrote it"""
+    import pyarrow.parquet as pq
+    blob = storage_client.bucket(image_bucket).blob(IMAGE_META_PATH.format(directory = directory))
+    if not blob.exists():
+        return None
+    with blob.open("rb") as f:
+        return pq.ParquetFile(f).metadata.num_rows
+
+
+def pending_backlog(config : dict, table_id : str, storage_client) -> dict:
+    """The pending work of the run in the pipeline config
+    Returns:
+        dict: {"volumes" : subreddit -> expected rows of the run, "image_rows"}
+    """
+    volumes = estimate_volumes(config["subreddits"], read_manifest_volumes(config), history_volumes(read_history(config, table_id)))
+    n_days = directory_days(config["directory"])
+    volumes = {subreddit : rows_per_day * n_days for subreddit, rows_per_day in volumes.items()}
+    image_rows = image_backlog(storage_client, config["image_bucket"], config["directory"])
+    if image_rows is None:
+        image_rows = round(sum(volumes.values()) * IMAGE_ROW_SHARE)
+    return {"volumes" : volumes, "image_rows" : image_rows}
+
+
+def capacity_plan_main(config : dict, table_id : str, target_minutes : float = DEFAULT_TARGET_MINUTES, storage_client = None) -> dict:
+    """Plan the workers of the run and write the terraform variables into the spark bucket
+    Returns:
+        dict: the terraform variables
+    """
+    if storage_client is None:
+        from etl.generate_data_for_report import initialize_storage_client, GCP_PATH
+        storage_client = initialize_storage_client(GCP_PATH)
+    backlog = pending_backlog(config, table_id, storage_client)
+    plan = plan_capacity(backlog["volumes"], backlog["image_rows"], len(config["client_id"]), target_minutes)
+    print_plan(plan)
+    variables = terraform_variables(plan)
+    blob = storage_client.bucket(config["spark_bucket"]).blob(CAPACITY_PLAN_PATH.format(directory = config["directory"]))
+    blob.upload_from_string(json.dumps(variables, indent=2), content_type="application/json")
+    return variables
+
+
+if __name__ == "__main__":
+    # plan from an explicit backlog, e.g. before `make terraform-init`
+    parser = argparse.ArgumentParser("size the scrape and image workers from the pending work")
+    parser.add_argument("--volumes_json", type=str, required=True, help="a json file of subreddit -> expected rows of the run")
+    parser.add_argument("--image_rows", type=int, default=None, help="the image rows, estimated from the rows by default")
+    parser.add_argument("--reddit_credential", type=str, required=True, help="the reddit credential json, one scrape worker per client id")
+    parser.add_argument("--target_minutes", type=float, default=DEFAULT_TARGET_MINUTES, help="the wall minutes of a stage")
+    parser.add_argument("--output_path", type=str, default="terraform/capacity.auto.tfvars.json", help="the terraform variables file")
+    args = parser.parse_args()
+    volumes = json.loads(Path(args.volumes_json).read_text())
+    image_rows = args.image_rows if args.image_rows is not None else round(sum(volumes.values()) * IMAGE_ROW_SHARE)
+    n_reddit_clients = len(json.loads(Path(args.reddit_credential).read_text())["client_id"])
+    plan = plan_capacity(volumes, image_rows, n_reddit_clients, args.target_minutes)
+    print_plan(plan)
+    Path(args.output_path).write_text(json.dumps(terraform_variables(plan), indent=2))
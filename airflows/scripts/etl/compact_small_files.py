@@ -0,0 +1,282 @@
+import argparse
+import json
+import tempfile
+from collections import Counter
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+import pyarrow as pa
+import pyarrow.parquet as pq
+from google.cloud import storage
+from google.oauth2 import service_account
+from google.api_core.exceptions import NotFound, PreconditionFailed
+
+from etl.parquet_config import write_table
+
+# Idea:
+# The scrapers write 50 rows parquet chunks into {bucket}/{directory}/
+# 1. list the small chunk files directly under the directory, skip the files that are still young(may be written right now)
+# 2. bin-pack the files(first fit decreasing) into bins of about one row group
+# 3. for every bin: read the chunks, write a single row group file `compacted-*.parquet`
+#    record the bin as pending in `_compaction_manifest.json`, upload the file, delete the sources with generation match,
+#    then mark the bin as committed
+# A source rewritten during the compaction(a re-scraped chunk) fails its delete and stays, so its old rows are cut out of
+# the compacted file again, otherwise they would be kept twice. write_table sorts the rows(parquet_config), so the rows
+# of a source are found by their ids, recorded in the bin until it is committed
+# A pending bin left by a crash is finished(or dropped) at the next run, so the rows are never lost or kept twice
+
+GCP_PATH = "./gcp_key.json"
+
+PARQUET_EXTENSION_STR = ".parquet"
+COMPACTED_FILE_PREFIX = "compacted"
+COMPACTION_MANIFEST_FILENAME = "_compaction_manifest.json"
+TARGET_FILE_BYTES = 128 * 1024 * 1024
+SMALL_FILE_BYTES = 32 * 1024 * 1024
+MIN_FILE_AGE_SECONDS = 600
+# every chunk of the scrapers has an id column
+SOURCE_KEY_COLUMN = "id"
+
+
+def initialize_storage_client(gcp_path : str = GCP_PATH):
+    """Initialize the storage client"""
+    credentials = service_account.Credentials.from_service_account_file(gcp_path)
+    return storage.Client(credentials=credentials)
+
+
+def list_small_files(storage_client, bucket_name : str, directory : str,
+                     small_file_bytes : int = SMALL_FILE_BYTES, min_file_age_seconds : int = MIN_FILE_AGE_SECONDS):
+    """List the parquet files directly under the directory
+    Returns:
+        (list, list): the compaction candidates and all of the parquet files
+    """
+    youngest_time = datetime.now(timezone.utc) - timedelta(seconds=min_file_age_seconds)
+    candidates, parquet_blobs = [], []
+    for blob in storage_client.list_blobs(bucket_name, prefix = f"{directory}/", delimiter = "/"):
+        if not blob.name.endswith(PARQUET_EXTENSION_STR):
+            continue
+        parquet_blobs.append(blob)
+        if blob.size < small_file_bytes and blob.updated < youngest_time:
+            candidates.append(blob)
+    return candidates, parquet_blobs
+
+
+def bin_pack(blobs : list, target_file_bytes : int = TARGET_FILE_BYTES) -> list[list]:
+    """Bin-pack the blobs by size with first fit decreasing
+    Returns:
+        list[list]: the bins that hold more than one file
+    """
+    bins, bin_sizes = [], []
+    for blob in sorted(blobs, key = lambda x: x.size, reverse = True):
+        for idx in range(len(bins)):
+            if bin_sizes[idx] + blob.size <= target_file_bytes:
+                bins[idx].append(blob)
+                bin_sizes[idx] += blob.size
+                break
+        else:
+            bins.append([blob])
+            bin_sizes.append(blob.size)
+    return [cur_bin for cur_bin in bins if len(cur_bin) > 1]
+
+
+def load_compaction_manifest(bucket, directory : str):
+    """Load the compaction manifest with its generation(0 if it does not exist)"""
+    blob = bucket.blob(f"{directory}/{COMPACTION_MANIFEST_FILENAME}")
+    try:
+        blob.reload()
+        return json.loads(blob.download_as_text(if_generation_match = blob.generation)), blob.generation
+    except NotFound:
+        return {"directory" : directory, "bins" : []}, 0
+
+
+def save_compaction_manifest(bucket, directory : str, manifest : dict, generation : int) -> int:
+    """Save the compaction manifest, fail if another compaction changed it in between
+    Returns:
+        int: the new generation of the manifest
+    """
+    blob = bucket.blob(f"{directory}/{COMPACTION_MANIFEST_FILENAME}")
+    blob.upload_from_string(json.dumps(manifest), content_type = "application/json",
+                            if_generation_match = generation)
+    return blob.generation
+
+
+def delete_sources(bucket, sources : list[dict]) -> list[dict]:
+    """Delete the compacted source files, a source rewritten after compaction is kept
+    Returns:
+        list[dict]: the rewritten sources, their rows must leave the compacted file
+    """
+    rewritten = []
+    for source in sources:
+        try:
+            bucket.blob(source["name"]).delete(if_generation_match = source["generation"])
+        except NotFound:
+            continue
+        except PreconditionFailed:
+            print(f"{source['name']} was rewritten during compaction, keep it")
+            rewritten.append(source)
+    return rewritten
+
+
+def drop_rewritten_sources(bucket, bin_dict : dict, rewritten : list[dict]):
+    """Cut the rows of the rewritten sources out of the compacted file of the bin, the file is deleted when nothing is left
+    The cut is skipped when the file no longer has the rows of the bin(a crash after the cut), so it can be repeated
+    """
+    rewritten_names = {source["name"] for source in rewritten}
+    kept_sources = [source for source in bin_dict["sources"] if source["name"] not in rewritten_names]
+    output_blob = bucket.blob(bin_dict["output"])
+    output_blob.reload()
+    with tempfile.TemporaryDirectory() as local_dir:
+        local_path = Path(local_dir) / Path(bin_dict["output"]).name
+        output_blob.download_to_filename(str(local_path), if_generation_match = output_blob.generation)
+        table = pq.read_table(local_path)
+        if table.num_rows == bin_dict["rows"]:
+            # the rows are sorted, drop one row per id of a rewritten source(an id of two sources keeps its other row)
+            drop_counts = Counter(row_id for source in rewritten for row_id in source["ids"])
+            keep_mask = []
+            for row_id in table.column(SOURCE_KEY_COLUMN).to_pylist():
+                keep_mask.append(drop_counts[row_id] == 0)
+                if drop_counts[row_id] > 0:
+                    drop_counts[row_id] -= 1
+            table = table.filter(pa.array(keep_mask, type = pa.bool_()))
+            if kept_sources:
+                write_table(table, str(local_path), row_group_size = max(table.num_rows, 1))
+                output_blob.upload_from_filename(str(local_path), if_generation_match = output_blob.generation)
+            else:
+                output_blob.delete(if_generation_match = output_blob.generation)
+            print(f"dropped the rows of {len(rewritten)} rewritten sources from {bin_dict['output']}")
+    bin_dict["sources"] = kept_sources
+    bin_dict["rows"] = table.num_rows
+
+
+def commit_bin(bin_dict : dict):
+    """Mark the bin as committed, the ids of its sources are no longer needed"""
+    for source in bin_dict["sources"]:
+        source.pop("ids", None)
+    bin_dict["status"] = "committed"
+
+
+def recover_pending_bins(bucket, manifest : dict) -> bool:
+    """Finish the bins that were uploaded before a crash and drop the bins that were not
+    Returns:
+        bool: whether any pending bin was found
+    """
+    recovered = False
+    for bin_dict in manifest["bins"]:
+        if bin_dict["status"] != "pending":
+            continue
+        recovered = True
+        if bucket.blob(bin_dict["output"]).exists():
+            rewritten = delete_sources(bucket, bin_dict["sources"])
+            if rewritten:
+                drop_rewritten_sources(bucket, bin_dict, rewritten)
+            commit_bin(bin_dict)
+        else:
+            bin_dict["status"] = "aborted"
+    return recovered
+
+
+def compact_bin(bucket, directory : str, cur_bin : list, local_dir : str, output_name : str) -> dict:
+    """Read the files of a bin and write them into a single row group file locally
+    Returns:
+        dict: the bin record of the compaction manifest
+    """
+    tables = []
+    for idx, blob in enumerate(cur_bin):
+        local_path = Path(local_dir) / f"source-{idx}{PARQUET_EXTENSION_STR}"
+        blob.download_to_filename(str(local_path), if_generation_match = blob.generation)
+        tables.append(pq.read_table(local_path))
+    # chunks written from pandas may have a null typed column, promote it to the type of the other chunks
+    table = pa.concat_tables(tables, promote_options = "default")
+    local_output_path = Path(local_dir) / output_name
+    write_table(table, str(local_output_path), row_group_size = max(table.num_rows, 1))
+    return {
+        "output" : f"{directory}/{output_name}",
+        "local_path" : str(local_output_path),
+        "rows" : table.num_rows,
+        "sources" : [{"name" : blob.name, "generation" : blob.generation, "size" : blob.size,
+                      "ids" : cur_table.column(SOURCE_KEY_COLUMN).to_pylist()}
+                     for blob, cur_table in zip(cur_bin, tables)],
+        "status" : "pending"
+    }
+
+
+def compact_small_files_main(bucket_name : str, directory : str,
+                             target_file_bytes : int = TARGET_FILE_BYTES,
+                             small_file_bytes : int = SMALL_FILE_BYTES,
+                             min_file_age_seconds : int = MIN_FILE_AGE_SECONDS,
+                             dry_run : bool = False,
+                             storage_client = None) -> dict:
+    """Compact the small parquet files under the bucket directory
+    Args:
+        bucket_name (str): the bucket of the scraped chunks
+        directory (str): the date directory under the bucket
+        target_file_bytes (int, optional): the size of a compacted file. Defaults to TARGET_FILE_BYTES.
+        small_file_bytes (int, optional): files below this size are compacted. Defaults to SMALL_FILE_BYTES.
+        min_file_age_seconds (int, optional): younger files may still be written and are skipped. Defaults to MIN_FILE_AGE_SECONDS.
+        dry_run (bool, optional): only report the plan. Defaults to False.
+    Returns:
+        dict: the file counts and bytes before and after the compaction
+    """
+    if storage_client is None:
+        storage_client = initialize_storage_client()
+    bucket = storage_client.bucket(bucket_name)
+    manifest, generation = load_compaction_manifest(bucket, directory)
+    if recover_pending_bins(bucket, manifest):
+        generation = save_compaction_manifest(bucket, directory, manifest, generation)
+
+    candidates, parquet_blobs = list_small_files(storage_client, bucket_name, directory, small_file_bytes, min_file_age_seconds)
+    bins = bin_pack(candidates, target_file_bytes)
+    report = {
+        "bucket" : bucket_name,
+        "directory" : directory,
+        "files_before" : len(parquet_blobs),
+        "bytes_before" : sum(blob.size for blob in parquet_blobs),
+        "bins" : len(bins),
+        "files_compacted" : sum(len(cur_bin) for cur_bin in bins)
+    }
+    if dry_run:
+        print(json.dumps(report))
+        return report
+
+    files_after, bytes_after = report["files_before"], report["bytes_before"]
+    run_stamp = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
+    with tempfile.TemporaryDirectory() as local_dir:
+        for bin_idx, cur_bin in enumerate(bins):
+            output_name = f"{COMPACTED_FILE_PREFIX}-{run_stamp}-{bin_idx}{PARQUET_EXTENSION_STR}"
+            try:
+                bin_dict = compact_bin(bucket, directory, cur_bin, local_dir, output_name)
+            except PreconditionFailed:
+                print(f"a source of bin {bin_idx} changed while reading, skip the bin")
+                continue
+            local_output_path = bin_dict.pop("local_path")
+            # record the bin before the upload so a crash can be recovered
+            manifest["bins"].append(bin_dict)
+            generation = save_compaction_manifest(bucket, directory, manifest, generation)
+            output_blob = bucket.blob(bin_dict["output"])
+            output_blob.upload_from_filename(local_output_path, if_generation_match = 0)
+            rewritten = delete_sources(bucket, bin_dict["sources"])
+            output_size = output_blob.size
+            if rewritten:
+                drop_rewritten_sources(bucket, bin_dict, rewritten)
+                output_size = bucket.get_blob(bin_dict["output"]).size if bin_dict["sources"] else 0
+            commit_bin(bin_dict)
+            generation = save_compaction_manifest(bucket, directory, manifest, generation)
+            n_compacted = len(bin_dict["sources"])
+            files_after += (1 if n_compacted else 0) - n_compacted
+            bytes_after += output_size - sum(source["size"] for source in bin_dict["sources"])
+            print(f"compacted {n_compacted} files into {bin_dict['output']} with {bin_dict['rows']} rows")
+    report["files_after"] = files_after
+    report["bytes_after"] = bytes_after
+    print(json.dumps(report))
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("compact the small parquet files under a bucket directory")
+    parser.add_argument("--bucket_name", type=str, required=True, help="the bucket of the scraped files")
+    parser.add_argument("--directory", type=str, required=True, help="the directory with format start_date-end_date")
+    parser.add_argument("--target_file_bytes", type=int, default=TARGET_FILE_BYTES, help="the size of a compacted file")
+    parser.add_argument("--small_file_bytes", type=int, default=SMALL_FILE_BYTES, help="files below this size are compacted")
+    parser.add_argument("--min_file_age_seconds", type=int, default=MIN_FILE_AGE_SECONDS, help="skip the files younger than this")
+    parser.add_argument("--dry_run", action="store_true", help="only report the compaction plan")
+    args = parser.parse_args()
+    compact_small_files_main(args.bucket_name, args.directory, args.target_file_bytes,
+                             args.small_file_bytes, args.min_file_age_seconds, args.dry_run)
@@ -0,0 +1,158 @@
+from etl.pipeline_config import load_pipeline_config, run_etl, META_TEXT_DIR, META_TEXT_FILENAME
+from etl.warm_worker import pull_command
+
+# Idea:
+# The global DAG and the pipelined DAG share their connections, their setup tasks and their report tasks
+#   constants   -> the ssh connection ids, the buckets of the scrapers, the bigquery table and the sql directory
+#   setup       -> project init, the ssh connection registration, the docker pulls of the VMs
+#   reports     -> the report backend branch and the report tasks of both backends
+#   secrets     -> the scrape plans(XCom) carry the index of the reddit client and a placeholder instead of its secret,
+#                  the ssh task reads the secret from the Variables and fills it in when it runs
+# Like pipeline_config, the DAG modules import this at parse time, so it only imports pipeline_config and warm_worker
+# (standard library only) at the top, airflow and the etl modules are imported inside the functions
+
+SSH_CONNECTION_ID_FOR_STR = "ssh_{id}"
+IMAGE_SSH_CONNECTION_ID_FOR_STR = "ssh_image_{id}"
+GPU_SSH_CONNECTION_ID = "ssh_gpu"
+
+TERRAFORM_STORAGES = [
+    "image_bucket",
+    "text_bucket",
+    "meta_bucket"
+]
+
+BIGQUERY_TABLE_ID = "subreddit_activity"
+# the placeholder of the reddit client secret in the scrape commands of the plans
+CLIENT_SECRET_PLACEHOLDER = "__CLIENT_SECRET__"
+SQL_PARENT_PROJECT = "/opt/airflow/scripts/etl/sql_queries"
+
+
+def var(key : str) -> str:
+    """The template of an airflow Variable, rendered when the task runs"""
+    return "{{ var.value." + key + " }}"
+
+
+def etl_operator(task_id : str, module_name : str, function_name : str, etl_kwargs : dict):
+    """Generate the python operator of an etl function, the templates in etl_kwargs are rendered at run time"""
+    from airflow.operators.python import PythonOperator
+    return PythonOperator(
+        task_id = task_id,
+        python_callable = run_etl,
+        op_kwargs = {
+            "module_name" : module_name,
+            "function_name" : function_name,
+            "etl_kwargs" : etl_kwargs,
+            "stage" : task_id
+        }
+    )
+
+
+def reddit_client_args(config : dict, conn_idx : int) -> str:
+    """The reddit client arguments of a scrape command, the secret stays a placeholder until run_ssh_command"""
+    return f'''--client_id "{config["client_id"][conn_idx]}" --client_secret "{CLIENT_SECRET_PLACEHOLDER}"'''
+
+
+def run_ssh_command(ssh_conn_id : str, command : str, timeout : int, client_idx : int = None, description : str = "command"):
+    """Run a shell command on an ssh connection, fail the task on a nonzero exit status
+    Args:
+        client_idx (int, optional): the reddit client of the command, its secret replaces the placeholder. Defaults to None.
+    """
+    from airflow.exceptions import AirflowException
+    from airflow.providers.ssh.hooks.ssh import SSHHook
+    if client_idx is not None:
+        command = command.replace(CLIENT_SECRET_PLACEHOLDER, load_pipeline_config()["client_secret"][client_idx])
+    ssh_hook = SSHHook(ssh_conn_id = ssh_conn_id, conn_timeout = timeout, cmd_timeout = timeout)
+    with ssh_hook.get_conn() as ssh_client:
+        exit_status, _, stderr = ssh_hook.exec_ssh_client_command(ssh_client, command, get_pty = False, environment = None)
+    if exit_status != 0:
+        raise AirflowException(f"{description} exited with {exit_status}: {stderr.decode(errors='replace')}")
+
+
+def proj_init_wrapper():
+    from airflow.models import Variable
+    from etl.proj_init import project_init
+    proj_init_result = project_init()
+    for key, value in proj_init_result.items():
+        if key != "n_ssh_connections" and key != "internal_ip_addresses":
+           Variable.set(key, value)
+
+
+def generate_ssh_hooks():
+    """Register the ssh connections of the VMs(ssh_{id}), the image VMs(ssh_image_{id}) and the GPU(ssh_gpu) in one transaction"""
+    from etl.ssh_connections import register_ssh_connections, ssh_extra
+    config = load_pipeline_config()
+    hosts = {SSH_CONNECTION_ID_FOR_STR.format(id = idx) : ip for idx, ip in enumerate(config["internal_ip_addresses"])}
+    hosts.update({IMAGE_SSH_CONNECTION_ID_FOR_STR.format(id = idx) : ip for idx, ip in enumerate(config["image_internal_ip_addresses"])})
+    hosts[GPU_SSH_CONNECTION_ID] = config["gpu_ip_address"]
+    register_ssh_connections(hosts, ssh_extra(config))
+
+
+def image_ssh_connection_ids(config : dict) -> list[str]:
+    """The ssh connection ids of the image scraping, the scrape VMs when no image VM is planned"""
+    if config["n_image_connections"] > 0:
+        return [IMAGE_SSH_CONNECTION_ID_FOR_STR.format(id = idx) for idx in range(config["n_image_connections"])]
+    return [SSH_CONNECTION_ID_FOR_STR.format(id = idx) for idx in range(config["n_ssh_connections"])]
+
+
+def vm_pull_commands() -> list[dict]:
+    """The ssh connection and the docker pull of every VM, the expansion of the per VM pulls
+    The image VMs only pull(and keep a worker of) the image scraper
+    """
+    config = load_pipeline_config()
+    docker_username = config["docker_username"]
+    pull_kwargs = [{"ssh_conn_id" : SSH_CONNECTION_ID_FOR_STR.format(id = idx),
+                    "command" : pull_command(docker_username, ["scrape-reddit", "scrape-image"])}
+                   for idx in range(config["n_ssh_connections"])]
+    pull_kwargs += [{"ssh_conn_id" : IMAGE_SSH_CONNECTION_ID_FOR_STR.format(id = idx),
+                     "command" : pull_command(docker_username, ["scrape-image"])}
+                    for idx in range(config["n_image_connections"])]
+    return pull_kwargs
+
+
+def choose_report_backend() -> str:
+    """"bigquery" loads the merged output into bigquery, "duckdb" runs the reports on the airflow vm"""
+    if load_pipeline_config()["report_backend"] == "duckdb":
+        return "generate_data_report_duckdb"
+    return "GCS_to_Bigquery"
+
+
+def report_tasks():
+    """The report backend branch and the report tasks of both backends over the merged meta text of the run
+    Returns:
+        the branch task, the first task after the merge
+    """
+    from airflow.operators.python import BranchPythonOperator
+    report_backend_branch = BranchPythonOperator(
+        task_id = "choose_report_backend",
+        python_callable = choose_report_backend,
+    )
+    duckdb_sqls = etl_operator("generate_data_report_duckdb", "generate_data_for_report", "generate_data_duckdb_main", {
+        "storage_bucket" : var("report_bucket"),
+        "storage_directory" : var("directory"),
+        "sql_parent_project" : SQL_PARENT_PROJECT,
+        "source_bucket" : var("meta_bucket"),
+        "source_directory" : var("directory"),
+        "source_path" : f"{META_TEXT_DIR}/{META_TEXT_FILENAME}",
+        "start_date" : var("start_date"),
+        "end_date" : var("end_date")
+    })
+    gcs_to_bigquery_op = etl_operator("GCS_to_Bigquery", "gcs_to_bigquery", "gcs_to_bigquery_main", {
+        "dataset_id" : var("bigquery_dataset_id"),
+        "table_id" : BIGQUERY_TABLE_ID,
+        "source_table_bucket" : var("meta_bucket"),
+        "source_table_directory" : var("directory"),
+        "source_table_path" : f"{META_TEXT_DIR}/{META_TEXT_FILENAME}"
+    })
+    bigquery_sqls = etl_operator("generate_data_report", "generate_data_for_report", "generate_data_main", {
+        "storage_bucket" : var("report_bucket"),
+        "storage_directory" : var("directory"),
+        "sql_parent_project" : SQL_PARENT_PROJECT,
+        "project_id" : var("project_id"),
+        "dataset_id" : var("bigquery_dataset_id"),
+        "table_id" : BIGQUERY_TABLE_ID,
+        "start_date" : var("start_date"),
+        "end_date" : var("end_date")
+    })
+    report_backend_branch >> duckdb_sqls
+    report_backend_branch >> gcs_to_bigquery_op >> bigquery_sqls
+    return report_backend_branch
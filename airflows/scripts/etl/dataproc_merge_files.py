@@ -4,6 +4,8 @@ import os
 from pathlib import Path
 import argparse
 
+from parquet_config import spark_write_parquet
+
 PARQUET_EXTENSION_STR = ".parquet"
 
 def initialize_spark():
@@ -12,13 +14,14 @@ def initialize_spark():
         .appName("Combine Files under single directory") \
         .getOrCreate()
 
-def combine_file(spark, bucket_name : str, directory : str, image_bucket_name : str) -> str:
+def combine_file(spark, bucket_name : str, directory : str, image_bucket_name : str, storage_root : str = "gs://") -> str:
     """Combine all of the files in the input directory.
     All of the files exists in the bucketname and directory, which are checked in previous steps
+    The buckets are under storage_root, a local directory(with the trailing /) for the local runner
     """
     
-    gcs_input_path = f"gs://{bucket_name}/{directory}"
-    gcs_output_path = f"gs://{bucket_name}/{directory}/combined"
+    gcs_input_path = f"{storage_root}{bucket_name}/{directory}"
+    gcs_output_path = f"{storage_root}{bucket_name}/{directory}/combined"
     df = spark.read.parquet(gcs_input_path)
     if image_bucket_name == bucket_name:
         prefix = f"{directory}/images/"
@@ -26,7 +29,7 @@ def combine_file(spark, bucket_name : str, directory : str, image_bucket_name :
         image_path_col = concat(lit(prefix), element_at(split_strs, size(split_strs)))
         df = df.withColumn("image_path", image_path_col)
     single_part_df = df.repartition(1)
-    single_part_df.write.mode("overwrite").parquet(gcs_output_path)
+    spark_write_parquet(single_part_df, gcs_output_path)
 
     
 def main():
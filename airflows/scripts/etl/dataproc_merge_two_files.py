@@ -1,5 +1,26 @@
 from pyspark.sql import SparkSession
+from pyspark.sql.functions import col, lit, rand, floor, when, explode, array
 import argparse
+import json
+import re
+import time
+
+from parquet_config import spark_write_parquet
+
+# Idea:
+# Look at the input sizes and the key distribution before running the merge sql
+#   small df2               -> broadcast df2(the right side of the left join)
+#   hot keys in df1         -> salt the hot keys of df1 and replicate them in df2 over every salt value
+#   otherwise               -> shuffle join, adaptive query execution splits the skewed partitions
+# The chosen plan, the seconds of the analysis and of the write and the task counts of the spark stages are written
+# as json to --plan_path(the submitter records it in the run manifest and the trace) and logged as a `JOIN_PLAN` line
+
+BROADCAST_THRESHOLD_BYTES = 64 * 1024 * 1024
+SAMPLE_FRACTION = 0.1
+HOT_KEY_FRACTION = 0.05
+MAX_HOT_KEYS = 20
+SALT_BUCKETS = 16
+SALT_COLUMN = "__salt"
 
 def format_file_name(bucket_name : str, date_directory : str, file_path : str) -> str:
     """Format the file name for google storage"""
@@ -9,19 +30,135 @@ def initialize_spark():
     """Initialize the spark"""
     return SparkSession.builder \
         .appName("Combine two files") \
+        .config("spark.sql.adaptive.enabled", "true") \
+        .config("spark.sql.adaptive.coalescePartitions.enabled", "true") \
+        .config("spark.sql.adaptive.skewJoin.enabled", "true") \
+        .config("spark.sql.autoBroadcastJoinThreshold", str(BROADCAST_THRESHOLD_BYTES)) \
         .getOrCreate()
 
+def input_size_bytes(spark, file_path : str) -> int:
+    """The size of the input file(or directory) on the storage"""
+    hadoop_path = spark._jvm.org.apache.hadoop.fs.Path(file_path)
+    file_system = hadoop_path.getFileSystem(spark._jsc.hadoopConfiguration())
+    return file_system.getContentSummary(hadoop_path).getLength()
+
+def find_hot_keys(df, join_key : str) -> list:
+    """Find the keys holding more than HOT_KEY_FRACTION of the rows in a sample of the dataframe"""
+    sample_df = df.select(join_key).sample(fraction=SAMPLE_FRACTION, seed=0)
+    n_sample = sample_df.count()
+    if n_sample == 0:
+        return []
+    key_counts = sample_df.groupBy(join_key).count() \
+        .filter(col("count") > n_sample * HOT_KEY_FRACTION) \
+        .orderBy(col("count").desc()) \
+        .limit(MAX_HOT_KEYS) \
+        .collect()
+    return [row[join_key] for row in key_counts if row[join_key] is not None]
+
+def salt_join_condition(sql_statement : str, join_key : str):
+    """Add the salt column to the `on a.key = b.key` condition
+    Returns:
+        Return None if the join condition is not found
+    """
+    pattern = re.compile(rf"(\bon\s+(\w+)\.{join_key}\s*=\s*(\w+)\.{join_key}\b)", re.IGNORECASE)
+    match = pattern.search(sql_statement)
+    if match is None:
+        return None
+    left_alias, right_alias = match.group(2), match.group(3)
+    salted_condition = f"{match.group(1)} and {left_alias}.{SALT_COLUMN} = {right_alias}.{SALT_COLUMN}"
+    return sql_statement[:match.start()] + salted_condition + sql_statement[match.end():]
+
+def salt_dataframes(df1, df2, join_key : str, hot_keys : list):
+    """Spread the hot keys of df1 over SALT_BUCKETS and replicate the matching df2 rows for every salt"""
+    is_hot_df1 = col(join_key).isin(hot_keys)
+    df1 = df1.withColumn(SALT_COLUMN, when(is_hot_df1, floor(rand(seed=0) * SALT_BUCKETS)).otherwise(lit(0)).cast("int"))
+    all_salts = array(*[lit(salt) for salt in range(SALT_BUCKETS)])
+    is_hot_df2 = col(join_key).isin(hot_keys)
+    df2 = df2.withColumn(SALT_COLUMN, explode(when(is_hot_df2, all_salts).otherwise(array(lit(0)))))
+    return df1, df2
 
-def merge_two_files(spark, file_path1 : str, file_path2 : str, output_path : str, sql_statement : str):
-    """Merge two files assume the table for file-path1 is at df1 and table for file-path2 is at df2"""
+def choose_join_plan(spark, df1, df2, file_path1 : str, file_path2 : str, join_key : str, sql_statement : str) -> dict:
+    """Choose the join strategy from the input sizes and the key distribution of df1"""
+    plan = {
+        "df1_bytes" : input_size_bytes(spark, file_path1),
+        "df2_bytes" : input_size_bytes(spark, file_path2),
+        "hot_keys" : []
+    }
+    # df1 is the preserved side of the left join, only df2 can be broadcast
+    if plan["df2_bytes"] <= BROADCAST_THRESHOLD_BYTES:
+        plan["strategy"] = "broadcast"
+        return plan
+    plan["hot_keys"] = find_hot_keys(df1, join_key)
+    if len(plan["hot_keys"]) > 0 and salt_join_condition(sql_statement, join_key) is not None:
+        plan["strategy"] = "salted"
+    else:
+        plan["strategy"] = "shuffle"
+    return plan
+
+def stage_summary(spark, job_group : str) -> list[dict]:
+    """Summarize the spark stages that ran for the job group"""
+    status_tracker = spark.sparkContext.statusTracker()
+    stages = []
+    for job_id in status_tracker.getJobIdsForGroup(job_group):
+        job_info = status_tracker.getJobInfo(job_id)
+        if job_info is None:
+            continue
+        for stage_id in job_info.stageIds:
+            stage_info = status_tracker.getStageInfo(stage_id)
+            if stage_info is None:
+                continue
+            stages.append({
+                "job_id" : job_id,
+                "stage_id" : stage_id,
+                "name" : stage_info.name,
+                "num_tasks" : stage_info.numTasks,
+                "num_failed_tasks" : stage_info.numFailedTasks
+            })
+    return stages
+
+def write_plan(spark, plan_path : str, plan : dict):
+    """Write the join plan as json to a gs:// or local path through the hadoop file system of the job"""
+    hadoop_path = spark._jvm.org.apache.hadoop.fs.Path(plan_path)
+    output_stream = hadoop_path.getFileSystem(spark._jsc.hadoopConfiguration()).create(hadoop_path, True)
+    try:
+        output_stream.write(bytearray(json.dumps(plan, default=str).encode()))
+    finally:
+        output_stream.close()
+
+def merge_two_files(spark, file_path1 : str, file_path2 : str, output_path : str, sql_statement : str, join_key : str = "id",
+                    plan_path : str = None):
+    """Merge two files assume the table for file-path1 is at df1 and table for file-path2 is at df2
+    The join plan is written to plan_path when it is given"""
+    timings = {}
+    start_time = time.time()
     df1 = spark.read.parquet(file_path1)
     df2 = spark.read.parquet(file_path2)
+    spark.sparkContext.setJobGroup("join_analysis", "choose the join strategy")
+    plan = choose_join_plan(spark, df1, df2, file_path1, file_path2, join_key, sql_statement)
+    timings["analysis_seconds"] = time.time() - start_time
+
+    if plan["strategy"] == "broadcast":
+        df2 = df2.hint("broadcast")
+    if plan["strategy"] == "salted":
+        df1, df2 = salt_dataframes(df1, df2, join_key, plan["hot_keys"])
+        sql_statement = salt_join_condition(sql_statement, join_key)
     df1.createOrReplaceTempView("df1")
     df2.createOrReplaceTempView("df2")
     ret_df = spark.sql(sql_statement)
     ret_df = ret_df.repartition(1)
-    ret_df.write.mode("overwrite").parquet(output_path)
-    
+
+    start_time = time.time()
+    spark.sparkContext.setJobGroup("join_write", "merge and write the output")
+    spark_write_parquet(ret_df, output_path)
+    timings["write_seconds"] = time.time() - start_time
+    plan["timings"] = timings
+    plan["stages"] = stage_summary(spark, "join_analysis") + stage_summary(spark, "join_write")
+    plan["executed_plan"] = ret_df._jdf.queryExecution().executedPlan().toString()
+    print("JOIN_PLAN " + json.dumps(plan, default=str))
+    if plan_path is not None:
+        write_plan(spark, plan_path, plan)
+    return plan
+
 if __name__ == "__main__":
     spark = initialize_spark()
     parser = argparse.ArgumentParser(description="merge two files")
@@ -33,8 +170,10 @@ if __name__ == "__main__":
     parser.add_argument("--output_bucket", type=str, required=True, help="the output bucket")
     parser.add_argument("--output_directory", type=str, required=True, help="the output directory")
     parser.add_argument("--sql_statement", type=str, required=True, help="the sql statement")
+    parser.add_argument("--join_key", type=str, default="id", help="the join key of df1 and df2")
+    parser.add_argument("--plan_path", type=str, default=None, help="the gs:// path of the join plan json")
     args = parser.parse_args()
     file_path1 = format_file_name(args.bucket1, args.date_directory, args.file1_path)
     file_path2 = format_file_name(args.bucket2, args.date_directory, args.file2_path)
     output_path = format_file_name(args.output_bucket, args.date_directory, args.output_directory)
-    merge_two_files(spark, file_path1, file_path2, output_path, args.sql_statement)
\ No newline at end of file
+    merge_two_files(spark, file_path1, file_path2, output_path, args.sql_statement, args.join_key, args.plan_path)
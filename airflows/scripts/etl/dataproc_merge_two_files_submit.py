@@ -7,11 +7,16 @@ from google.cloud.dataproc_v1.types import JobStatus
 from google.cloud import storage
 from google.oauth2 import service_account
 from google.api_core.exceptions import NotFound
-from pathlib import Path
+
+from etl import tracing
+from etl.output_commit import commit_output, manifest_path
+from etl.run_manifest import (blob_exists, fingerprint_blob, fingerprint_content,
+    load_run_manifest, stage_is_complete, record_stage, describe_outputs, join_plan_attributes, JOIN_PLAN_PATH)
 
 # This file is run on the vm machine with airflow
 
 GCP_JSON = "gcp_key.json"
+PARQUET_CONFIG_FILE = "parquet_config.py"
 
 def get_project_id():
     "Get the project id from GCP JSON file"
@@ -42,39 +47,27 @@ def initialize_storage(credential):
 
 def check_blob_exists(storage_client, bucket_name, *args):
     file_path = "/".join(args)
-    print(f"Check the storage: \nbucketname {bucket_name}\nfilepath {file_path}")
-    blobs = list(storage_client.list_blobs(bucket_name, prefix = file_path))
-    return len(blobs) > 0
+    return blob_exists(storage_client, bucket_name, file_path)
 
 def file_clean_up(storage_client, output_bucket_name : str, date_directory : str, output_directory : str, output_filename :str):
-    """Remove the _SUCCESS and _Failure in the output_directory. Rename the parquet file in the output_directory to output_filename 
+    """Remove the _SUCCESS and _Failure in the output_directory. Commit the parquet file in the output_directory as output_filename 
 
     Args:
         storage_client (_type_): the storage client 
         storage_bucket_name (str): the bucket name 
         direcotry (str): the directory under the file 
     """
-    output_bucket = storage_client.bucket(output_bucket_name)
-    prefixes = f"{date_directory}/{output_directory}"
-    for blob in storage_client.list_blobs(output_bucket_name, prefix = prefixes):
-        file_names = blob.name.split("/")
-        file_name = file_names[-1]
-        file_names.pop()
-        print(file_name)
-        if len(file_name) == 0:
-            continue
-        if file_name[0] == "_":
-            blob.delete()
-        else:
-            file_names.append(output_filename)
-            destination_blob_name = "/".join(file_names) 
-            print("the destination file name is ", destination_blob_name)
-            blob_copy = output_bucket.copy_blob(
-                blob, output_bucket, destination_blob_name
-            )
-            blob.delete() 
+    return commit_output(storage_client, output_bucket_name, f"{date_directory}/{output_directory}", output_filename)
         
 
+def read_join_plan(plan_blob):
+    """The join plan the spark job wrote, None if the job did not write it"""
+    try:
+        return json.loads(plan_blob.download_as_text())
+    except NotFound:
+        print(f"no join plan at {plan_blob.name}")
+        return None
+
 def dataproc_merge_two_files_submit_main(region : str, cluster_name : str,
     bucket1 : str, bucket2 : str, file1_path : str, file2_path : str, date_directory : str,
     job_bucket_name : str, job_file_path : str,
@@ -87,17 +80,36 @@ def dataproc_merge_two_files_submit_main(region : str, cluster_name : str,
     storage_client = initialize_storage(credential)
     project_id = get_project_id()
 
-    if not check_blob_exists(storage_client, bucket1, date_directory, file1_path):
+    # the inputs are single files, their metadata is the fingerprint
+    inputs = {
+        "file1" : fingerprint_blob(storage_client, bucket1, f"{date_directory}/{file1_path}"),
+        "file2" : fingerprint_blob(storage_client, bucket2, f"{date_directory}/{file2_path}"),
+        "job_file" : fingerprint_content(storage_client, job_bucket_name, job_file_path),
+        "sql_statement" : sql_statement
+    }
+    if inputs["file1"] is None:
         raise FileNotFoundError("the storage file at bucket1 is not found")
-    if not check_blob_exists(storage_client, bucket2, date_directory, file2_path):
+    if inputs["file2"] is None:
         raise FileNotFoundError("the storage files at bucket2 is not found")
-    if not check_blob_exists(storage_client, job_bucket_name, job_file_path):
+    if inputs["job_file"] is None:
         raise FileNotFoundError("the job file is not found")
+    tracing.current_span().set(bytes_in = (inputs["file1"]["size"] or 0) + (inputs["file2"]["size"] or 0))
     
-    # if the combine directory exists, simply return
-    if check_blob_exists(storage_client, output_bucket, output_directory):
+    # if the merged file is recorded with the same inputs, simply return
+    stage = f"merge_{output_directory}"
+    output_prefix = f"{date_directory}/{output_directory}"
+    run_manifest = load_run_manifest(storage_client, job_bucket_name, date_directory)
+    if stage_is_complete(run_manifest, stage, inputs):
+        print("The combined file is up to date with its inputs. Stop the job")
+        tracing.current_span().set(skipped = True)
+        return None
+    if stage not in run_manifest["stages"] and check_blob_exists(storage_client, output_bucket, manifest_path(output_prefix)):
+        # committed before the run manifest existed, adopt it
         print("The combined file has already exists. Stop the job")
+        record_stage(storage_client, job_bucket_name, date_directory, stage, inputs, [])
         return None
+    # the spark job writes its join plan next to the run manifest
+    plan_blob = storage_client.bucket(job_bucket_name).blob(JOIN_PLAN_PATH.format(directory = date_directory, stage = stage))
     # submit the job
     job = {
         'placement': {
@@ -105,6 +117,7 @@ def dataproc_merge_two_files_submit_main(region : str, cluster_name : str,
         },
         'pyspark_job': {
             'main_python_file_uri': f"gs://{job_bucket_name}/{job_file_path}",
+            'python_file_uris': [f"gs://{job_bucket_name}/{PARQUET_CONFIG_FILE}"],
             'args' : [  "--bucket1",  bucket1,
                         "--bucket2", bucket2,
                         "--date_directory", date_directory,
@@ -112,7 +125,8 @@ def dataproc_merge_two_files_submit_main(region : str, cluster_name : str,
                         "--file2_path", file2_path,
                         "--output_bucket", output_bucket,
                         "--output_directory", output_directory,
-                        "--sql_statement", sql_statement
+                        "--sql_statement", sql_statement,
+                        "--plan_path", f"gs://{job_bucket_name}/{plan_blob.name}"
                     ]
         }
     }
@@ -121,21 +135,29 @@ def dataproc_merge_two_files_submit_main(region : str, cluster_name : str,
     job_id = result.reference.job_id
     print(f"Submitted job ID {job_id}")
     # Wait for the job to complete
-    while True:
-        job_request = dataproc_v1.GetJobRequest(project_id=project_id, region=region, job_id=job_id)
-        job_status = dataproc_client.get_job(request=job_request)
-        if job_status.status.state in [JobStatus.State.ERROR, JobStatus.State.CANCELLED, JobStatus.State.DONE]:
-            print(f"Job {job_id} finished with state: {job_status.status.state.name}")
-            break
-        else:
-            print(f"Job {job_id} is in state: {job_status.status.state.name}")
-            time.sleep(5)
+    with tracing.span("dataproc_job", job_id = job_id):
+        while True:
+            job_request = dataproc_v1.GetJobRequest(project_id=project_id, region=region, job_id=job_id)
+            job_status = dataproc_client.get_job(request=job_request)
+            if job_status.status.state in [JobStatus.State.ERROR, JobStatus.State.CANCELLED, JobStatus.State.DONE]:
+                print(f"Job {job_id} finished with state: {job_status.status.state.name}")
+                break
+            else:
+                print(f"Job {job_id} is in state: {job_status.status.state.name}")
+                time.sleep(5)
     
     if job_status.status.state == JobStatus.State.ERROR:
         raise NotImplementedError("PySpark did not work properly")
     # clean up the file inside the combined 
 
-    file_clean_up(storage_client, output_bucket, date_directory, output_directory, output_filename)
+    output_manifest = file_clean_up(storage_client, output_bucket, date_directory, output_directory, output_filename)
+    outputs = describe_outputs(storage_client, output_bucket, output_manifest)
+    join_plan = read_join_plan(plan_blob)
+    if join_plan is not None:
+        tracing.current_span().set(**join_plan_attributes(join_plan))
+    record_stage(storage_client, job_bucket_name, date_directory, stage, inputs, outputs, {"join_plan" : join_plan})
+    tracing.current_span().set(rows_out = sum(output["rows"] or 0 for output in outputs),
+                               bytes_out = sum(output["size"] or 0 for output in outputs))
        
 
 
@@ -182,4 +204,4 @@ if __name__ == "__main__":
 
 # Idea:
 # the datproc two files will output a the combined file into the directory at `output_directory`
-# use file cleanup to rename the combined filename
\ No newline at end of file
+# use file cleanup to commit the combined filename and write the `_manifest.json` of the output
\ No newline at end of file
@@ -7,11 +7,16 @@ from google.cloud.dataproc_v1.types import JobStatus
 from google.cloud import storage
 from google.oauth2 import service_account
 from google.api_core.exceptions import NotFound
-from pathlib import Path
+
+from etl import tracing
+from etl.output_commit import commit_output, manifest_path
+from etl.run_manifest import (blob_exists, fingerprint_content, fingerprint_prefix,
+    load_run_manifest, stage_is_complete, record_stage, describe_outputs)
 
 # This file is run on the vm machine with airflow
 
 GCP_JSON = "gcp_key.json"
+PARQUET_CONFIG_FILE = "parquet_config.py"
 
 def get_project_id():
     "Get the project id from GCP JSON file"
@@ -41,51 +46,45 @@ def initialize_storage(credential):
     return storage_client 
 
 def check_blob_exists(storage_client, bucket_name, file_path):
-    print(f"Check the storage: \nbucketname {bucket_name}\nfilepath {file_path}")
-    blobs = list(storage_client.list_blobs(bucket_name, prefix = file_path))
-    return len(blobs) > 0
+    return blob_exists(storage_client, bucket_name, file_path)
 
 def file_clean_up(storage_client, storage_bucket_name, direcotry, combine_file_dir = "combined"):
-    """Remove the 
+    """Remove the spark marker files and commit the combined parquet file
 
     Args:
         storage_client (_type_): the storage client 
         storage_bucket_name (str): the bucket name 
         direcotry (str): the directory under the file 
     """
-    bucket = storage_client.bucket(storage_bucket_name)
-    prefixes = f"{direcotry}/{combine_file_dir}"
-    for blob in storage_client.list_blobs(storage_bucket_name, prefix = prefixes):
-        file_names = blob.name.split("/")
-        file_name = file_names[-1]
-        file_names.pop()
-        print(file_name)
-        if len(file_name) == 0:
-            continue
-        if file_name[0] == "_":
-            blob.delete()
-        else:
-            file_names.append("combined.parquet")
-            destination_blob_name = "/".join(file_names) 
-            print("the destination file name is ", destination_blob_name)
-            blob_copy = bucket.copy_blob(
-                blob, bucket, destination_blob_name
-            )
-            blob.delete() 
+    return commit_output(storage_client, storage_bucket_name, f"{direcotry}/{combine_file_dir}", "combined.parquet")
         
 
 def submit_dataproc(dataproc_client, storage_client, project_id : str, region : str, cluster_name : str, 
                     storage_bucket_name : str, storage_directory : str, 
                     job_bucket_name : str, job_file_path : str, image_bucket_name : str):
-    if not check_blob_exists(storage_client, storage_bucket_name, storage_directory):
+    # one listing of the chunk files both checks the input and fingerprints it
+    inputs = {
+        "source" : fingerprint_prefix(storage_client, storage_bucket_name, storage_directory),
+        "job_file" : fingerprint_content(storage_client, job_bucket_name, job_file_path)
+    }
+    if inputs["source"] is None:
         raise FileNotFoundError("the storage file is not found")
-    if not check_blob_exists(storage_client, job_bucket_name, job_file_path):
+    if inputs["job_file"] is None:
         raise FileNotFoundError("the job file is not found")
+    tracing.current_span().set(files_in = inputs["source"]["n_files"], bytes_in = inputs["source"]["size"])
     
-    # if the combine directory exists, simply return
-    combined_blob_path = str(Path(storage_directory) / "combined")
-    if check_blob_exists(storage_client, storage_bucket_name, str(combined_blob_path)):
+    # if the combined file is recorded with the same inputs, simply return
+    stage = f"merge_{storage_bucket_name}"
+    combined_blob_path = f"{storage_directory}/combined"
+    run_manifest = load_run_manifest(storage_client, job_bucket_name, storage_directory)
+    if stage_is_complete(run_manifest, stage, inputs):
+        print("Combined file is up to date with its inputs, stop the job")
+        tracing.current_span().set(skipped = True)
+        return None
+    if stage not in run_manifest["stages"] and check_blob_exists(storage_client, storage_bucket_name, manifest_path(combined_blob_path)):
+        # committed before the run manifest existed, adopt it
         print("Combined directory exists stop the job")
+        record_stage(storage_client, job_bucket_name, storage_directory, stage, inputs, [])
         return None
     # submit the job
     job = {
@@ -94,6 +93,7 @@ def submit_dataproc(dataproc_client, storage_client, project_id : str, region :
         },
         'pyspark_job': {
             'main_python_file_uri': f"gs://{job_bucket_name}/{job_file_path}",
+            'python_file_uris': [f"gs://{job_bucket_name}/{PARQUET_CONFIG_FILE}"],
             'args' : ["--bucket_name", storage_bucket_name, 
                       "--directory", storage_directory,
                       "--image_bucket_name", image_bucket_name]
@@ -104,20 +104,25 @@ def submit_dataproc(dataproc_client, storage_client, project_id : str, region :
     job_id = result.reference.job_id
     print(f"Submitted job ID {job_id}")
     # Wait for the job to complete
-    while True:
-        job_request = dataproc_v1.GetJobRequest(project_id=project_id, region=region, job_id=job_id)
-        job_status = dataproc_client.get_job(request=job_request)
-        if job_status.status.state in [JobStatus.State.ERROR, JobStatus.State.CANCELLED, JobStatus.State.DONE]:
-            print(f"Job {job_id} finished with state: {job_status.status.state.name}")
-            break
-        else:
-            print(f"Job {job_id} is in state: {job_status.status.state.name}")
-            time.sleep(5)
+    with tracing.span("dataproc_job", job_id = job_id):
+        while True:
+            job_request = dataproc_v1.GetJobRequest(project_id=project_id, region=region, job_id=job_id)
+            job_status = dataproc_client.get_job(request=job_request)
+            if job_status.status.state in [JobStatus.State.ERROR, JobStatus.State.CANCELLED, JobStatus.State.DONE]:
+                print(f"Job {job_id} finished with state: {job_status.status.state.name}")
+                break
+            else:
+                print(f"Job {job_id} is in state: {job_status.status.state.name}")
+                time.sleep(5)
     
     if job_status.status.state == JobStatus.State.ERROR:
         raise NotImplemented("PySpark did not work properly")
     # clean up the file inside the combined 
-    file_clean_up(storage_client, storage_bucket_name, storage_directory) 
+    output_manifest = file_clean_up(storage_client, storage_bucket_name, storage_directory) 
+    outputs = describe_outputs(storage_client, storage_bucket_name, output_manifest)
+    record_stage(storage_client, job_bucket_name, storage_directory, stage, inputs, outputs)
+    tracing.current_span().set(rows_out = sum(output["rows"] or 0 for output in outputs),
+                               bytes_out = sum(output["size"] or 0 for output in outputs))
        
 
 def dataproc_single_directory_main(cluster_name : str, region : str, storage_bucket_name : str, 
@@ -1,40 +1,120 @@
 from google.cloud import storage
 from google.oauth2 import service_account
 from google.cloud import bigquery
+from google.api_core.exceptions import NotFound
 import argparse
+from pathlib import PurePosixPath
+
+from etl.output_commit import read_manifest, manifest_uris
+
+# Idea:
+# Every run appends into one table partitioned by create_date and clustered by subreddit
+# 1. load the merged parquet file into `{table_id}_staging` with the explicit schema(no autodetect)
+# 2. find the create dates in the staging table
+# 3. overwrite only those partitions(`{table_id}$YYYYMMDD` with WRITE_TRUNCATE), so a re-run is idempotent
+# The report sql filters on create_date, bigquery prunes the partitions out of the requested window
+
 GCP_PATH = "./gcp_key.json"
+STAGING_TABLE_SUFFIX = "_staging"
+PARTITION_FIELD = "create_date"
+CLUSTERING_FIELDS = ["subreddit"]
+
+TABLE_SCHEMA = [
+    bigquery.SchemaField("id", "STRING"),
+    bigquery.SchemaField("url", "STRING"),
+    bigquery.SchemaField("score", "INT64"),
+    bigquery.SchemaField("author_url", "STRING"),
+    bigquery.SchemaField("authorname", "STRING"),
+    bigquery.SchemaField("parent", "STRING"),
+    bigquery.SchemaField("create_date", "DATE"),
+    bigquery.SchemaField("subreddit", "STRING"),
+    bigquery.SchemaField("text", "STRING"),
+    bigquery.SchemaField("sentiment", "INT64"),
+]
+
+def ensure_partitioned_table(bigquery_client, table_ref):
+    """Create the partitioned and clustered table if it does not exist"""
+    try:
+        return bigquery_client.get_table(table_ref)
+    except NotFound:
+        table = bigquery.Table(table_ref, schema=TABLE_SCHEMA)
+        table.time_partitioning = bigquery.TimePartitioning(
+            type_=bigquery.TimePartitioningType.DAY,
+            field=PARTITION_FIELD
+        )
+        table.clustering_fields = CLUSTERING_FIELDS
+        print(f"create the partitioned table {table_ref}")
+        return bigquery_client.create_table(table)
+
+def load_staging_table(bigquery_client, gcs_uri, staging_table_ref):
+    """Load the parquet files into the staging table with the explicit schema"""
+    job_config = bigquery.LoadJobConfig(
+        source_format=bigquery.SourceFormat.PARQUET,
+        schema=TABLE_SCHEMA,
+        write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE
+    )
+    load_job = bigquery_client.load_table_from_uri(gcs_uri, staging_table_ref, job_config=job_config)
+    load_job.result()
+
+def staging_partitions(bigquery_client, staging_table_id : str) -> list:
+    """The create dates present in the staging table"""
+    query_job = bigquery_client.query(
+        f"SELECT DISTINCT {PARTITION_FIELD} FROM `{staging_table_id}` WHERE {PARTITION_FIELD} IS NOT NULL"
+    )
+    return [row[PARTITION_FIELD] for row in query_job.result()]
 
-def gcs_to_bigquery_main(dataset_id : str, table_id : str, 
+def overwrite_partitions(bigquery_client, staging_table_id : str, table_id_full : str, partition_dates : list):
+    """Overwrite every affected partition of the table with the rows of the staging table
+    The query jobs of the partitions are submitted together and waited at the end
+    """
+    query_jobs = []
+    for partition_date in partition_dates:
+        job_config = bigquery.QueryJobConfig(
+            destination=f"{table_id_full}${partition_date.strftime('%Y%m%d')}",
+            write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE,
+            query_parameters=[bigquery.ScalarQueryParameter("partition_date", "DATE", partition_date)]
+        )
+        query_jobs.append(bigquery_client.query(
+            f"SELECT * FROM `{staging_table_id}` WHERE {PARTITION_FIELD} = @partition_date",
+            job_config=job_config
+        ))
+    for query_job in query_jobs:
+        query_job.result()
+
+def gcs_to_bigquery_main(dataset_id : str, table_id : str,
                          source_table_bucket : str, source_table_directory : str, source_table_path : str):
-    """After generating the parquet table, upload the parquet table into bigquery for query execution
+    """After generating the parquet table, load the parquet table into the partitioned bigquery table for query execution
     Args:
         dataset_id (str): the dataset id at bigquery(pre-created on terraform)
-        table_id (str): the table id specified on the DAG
+        table_id (str): the partitioned table id specified on the DAG
         source_table_bucket (str): the source table bucket defined on DAG
         source_table_directory (str): the source table directory defined on DAG
         source_table_path (str): the source table directory defined on DAG
     """
     credential = service_account.Credentials.from_service_account_file(GCP_PATH)
     storage_client = storage.Client(credentials=credential)
-    bigquery_client = bigquery.Client(credentials=credential) 
-    # the job configuration
-    job_config = bigquery.LoadJobConfig()
-    job_config.source_format = bigquery.SourceFormat.PARQUET
-    job_config.autodetect = True
-    # check whether the file exists or not
-    file_blob = storage_client.bucket(source_table_bucket).blob(f"{source_table_directory}/{source_table_path}")
-    if not file_blob.exists():
-        raise FileNotFoundError(f"the file gs://{source_table_bucket}/{source_table_directory}/{source_table_path} on gcp cloud is not found")
-    # the parquet source file 
-    gcs_uri = f"gs://{source_table_bucket}/{source_table_directory}/{source_table_path}"
+    bigquery_client = bigquery.Client(credentials=credential)
+    # the committed output lists its data files in the manifest, otherwise fall back to the single file
+    output_prefix = f"{source_table_directory}/{PurePosixPath(source_table_path).parent}"
+    manifest = read_manifest(storage_client, source_table_bucket, output_prefix)
+    if manifest is not None:
+        gcs_uri = manifest_uris(manifest, source_table_bucket)
+    else:
+        # check whether the file exists or not
+        file_blob = storage_client.bucket(source_table_bucket).blob(f"{source_table_directory}/{source_table_path}")
+        if not file_blob.exists():
+            raise FileNotFoundError(f"the file gs://{source_table_bucket}/{source_table_directory}/{source_table_path} on gcp cloud is not found")
+        # the parquet source file
+        gcs_uri = f"gs://{source_table_bucket}/{source_table_directory}/{source_table_path}"
     table_ref = bigquery_client.dataset(dataset_id).table(table_id)
-    # load the parquet file into the bigquery 
-    load_job = bigquery_client.load_table_from_uri(
-        gcs_uri,
-        table_ref,
-        job_config=job_config
-    )
-    load_job.result()
+    staging_table_ref = bigquery_client.dataset(dataset_id).table(f"{table_id}{STAGING_TABLE_SUFFIX}")
+    ensure_partitioned_table(bigquery_client, table_ref)
+    # load the parquet file into the staging table, then replace the partitions of this run
+    load_staging_table(bigquery_client, gcs_uri, staging_table_ref)
+    staging_table_id = f"{bigquery_client.project}.{dataset_id}.{table_id}{STAGING_TABLE_SUFFIX}"
+    partition_dates = staging_partitions(bigquery_client, staging_table_id)
+    print(f"overwrite the partitions {[str(partition_date) for partition_date in partition_dates]}")
+    overwrite_partitions(bigquery_client, staging_table_id, f"{bigquery_client.project}.{dataset_id}.{table_id}", partition_dates)
 
 if __name__ == "__main__":
    parser = argparse.ArgumentParser()
@@ -45,5 +125,5 @@ if __name__ == "__main__":
    parser.add_argument("--source_table_path", type=str, required=True, help="the source table path")
    args = parser.parse_args()
    # pass the arguments
-   gcs_to_bigquery_main(args.dataset_id, args.table_id, 
-                        args.source_table_bucket, args.source_table_directory, args.source_table_path) 
\ No newline at end of file
+   gcs_to_bigquery_main(args.dataset_id, args.table_id,
+                        args.source_table_bucket, args.source_table_directory, args.source_table_path)
@@ -1,25 +1,97 @@
 import argparse
+import io
+import json
 import os
-import numpy as np 
-import pandas as pd 
-from google.cloud import bigquery
-from google.oauth2 import service_account
-from pathlib import Path
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+import pandas as pd
+from pathlib import Path, PurePosixPath
+
+from etl import report_cache
+from etl import tracing
+from etl import sketches
+
+# Idea:
+# The rollup query(sql_queries/rollup/rollup.sql) scans the source table once and materializes
+# the (subreddit, create_date, authorname) aggregates into `{table_id}_rollup`
+# Every sql file under sql_queries/ is one report, the reports read the small rollup table instead of the source table
+# The reports are independent, so they run concurrently with at most `max_in_flight_jobs` reports at a time
+# and each report chains its extract job as soon as its own query job finishes
+# The bigquery backend writes the csv files into the report bucket,
+# the duckdb backend runs the same sql(rewritten by the dialect shim) with embedded duckdb over the merged parquet file:
+#   local       -> read a local parquet file, write the csv files into a local directory
+#   duckdb      -> download the committed merge output, run locally, upload the csv files into the report bucket
+# The reports of an unchanged source are restored from the report cache(report_cache.py), only the missed reports run
+# After the rollup the history query(sql_queries/history/history.sql) merges the per (subreddit, date) aggregates
+# of the run into `{table_id}_history`(a parquet file for duckdb), so the trends span every run
+# At the end the csv files are reshaped into `dashboard_bundle.json`(typed, windowed, series grouped by subreddit),
+# with the 7/30/90 day ranges of the history precomputed, the dashboard loads this single file
+# The rollup also updates the author sketches(sketches.py) of its partitions, the distinct and top authors
+# of the ranges come from merging the sketches instead of rescanning the rows
+# A report with a candidate query(sql_queries/top_k/) runs top-k first:
+#   1. the candidate query ranks the posts with the narrow columns only(subreddit, create_date, url, score)
+#   2. `top_k_filter` of the report is replaced with the partitions and the lowest score of the candidates,
+#      so the wide columns(text, author_url, ...) are read only from the partitions(row groups) holding the candidates
+# Every timing records the scanned bytes, bigquery reports the processed bytes of its jobs,
+# duckdb estimates the compressed column chunks its parquet scans read after the row group statistics
 
 GCP_PATH = "./gcp_key.json"
+MAX_IN_FLIGHT_JOBS = 4
+LOCAL_TABLE_REF = "project_id.dataset_id.table_id"
+ROLLUP_DIR = "rollup"
+ROLLUP_TABLE_SUFFIX = "_rollup"
+# the long-lived (subreddit, date) history, every run merges the dates of its rollup into it
+HISTORY_DIR = "history"
+HISTORY_TABLE_SUFFIX = "_history"
+HISTORY_BLOB_PATH = "history/history.parquet"
+# the author sketches of every (subreddit, date), next to the history
+SKETCH_STORE_FILENAME = "sketches.parquet"
+SKETCH_STORE_BLOB_PATH = "history/sketches.parquet"
+HISTORY_WINDOWS = [7, 30, 90]
+TOP_K_DIR = "top_k"
+TOP_K_FILTER = "top_k_filter"
+# the column-literal comparisons of the duckdb parquet scan filters, checked against the row group statistics
+SCAN_FILTER_IN = re.compile(r"^\(?(\w+) IN \((.*)\)\)?$")
+SCAN_FILTER_COMPARISON = re.compile(r"^\(?(\w+)\s*(>=|<=|=|>|<)\s*(.+?)\)?$")
+SCAN_FILTER_LITERAL = re.compile(r"'((?:[^']|'')*)'(?:::\w+)?|(-?\d+(?:\.\d+)?)")
+# the source table is partitioned by create_date, the reports only scan the partitions of the requested window
+MIN_DATE = "0001-01-01"
+MAX_DATE = "9999-12-31"
+DASHBOARD_BUNDLE_FILENAME = "dashboard_bundle.json"
+DASHBOARD_DAY_WINDOW = 7
+DASHBOARD_REPORTS = ["basic_statistics", "post_breakdown", "comments_breakdown", "sentiment_score", "top_score_posts", "top_author"]
+# the line chart reports -> their value column
+DASHBOARD_SERIES = {"post_breakdown" : "n_posts", "comments_breakdown" : "n_comments", "sentiment_score" : "Mean Sentiment Score"}
+DASHBOARD_TABLES = ["top_score_posts", "top_author"]
+DASHBOARD_TABLE_ROWS = 100
+DASHBOARD_CELL_CHARS = 45
+# bigquery -> duckdb dialect differences of the report sql
+DUCKDB_REWRITES = [
+    # bigquery treats the position 0 of SUBSTR as 1, duckdb counts it as a character before the string
+    (re.compile(r"\bSUBSTR\(([^,()]+),\s*0\s*,", re.IGNORECASE), r"SUBSTR(\1, 1,"),
+    # duckdb tables have no partitioning or clustering clause
+    (re.compile(r"^\s*(PARTITION|CLUSTER) BY [^;\n]*", re.IGNORECASE | re.MULTILINE), ""),
+]
 
 def initialize_bigquery_client(credential_path : str = GCP_PATH):
+    from google.cloud import bigquery
+    from google.oauth2 import service_account
     credentials = service_account.Credentials.from_service_account_file(credential_path)
     bigquery_client = bigquery.Client(credentials=credentials)
     return bigquery_client
 
-def generate_sql_queries(parent_dir_path : str, project_id : str, dataset_id : str, table_id :str) -> dict:
-    """Generate the sql queries 
+def generate_sql_queries(parent_dir_path : str, project_id : str, dataset_id : str, table_id :str,
+                         start_date : str = MIN_DATE, end_date : str = MAX_DATE) -> dict:
+    """Generate the sql queries
     Args:
         parent_dir_path (str): the parent directory of SQL
-        project_id (str) : the project id 
+        project_id (str) : the project id
         dataset_id (str) : the dataset id
         table_id (str) : the table id
+        start_date (str, optional) : the first create date of the report(inclusive)
+        end_date (str, optional) : the last create date of the report(inclusive)
     Returns:
 
     """
@@ -33,48 +105,727 @@ def generate_sql_queries(parent_dir_path : str, project_id : str, dataset_id : s
             sql_query = sql_query_format_str \
                 .replace("project_id", project_id) \
                 .replace("dataset_id", dataset_id) \
-                .replace("table_id", table_id)
-            return_dict[sql_file_path.stem] = sql_query 
+                .replace("table_id", table_id) \
+                .replace("start_date", start_date) \
+                .replace("end_date", end_date)
+            return_dict[sql_file_path.stem] = sql_query
     return return_dict
 
+def generate_rollup_query(parent_dir_path : str, project_id : str, dataset_id : str, table_id :str,
+                          start_date : str = MIN_DATE, end_date : str = MAX_DATE) -> str:
+    """Generate the rollup query from the rollup directory under the sql parent directory"""
+    rollup_dir_path = os.path.join(parent_dir_path, ROLLUP_DIR)
+    return generate_sql_queries(rollup_dir_path, project_id, dataset_id, table_id, start_date, end_date)[ROLLUP_DIR]
+
+def generate_history_query(parent_dir_path : str, project_id : str, dataset_id : str, table_id :str) -> str:
+    """Generate the history merge query from the history directory under the sql parent directory"""
+    history_dir_path = os.path.join(parent_dir_path, HISTORY_DIR)
+    return generate_sql_queries(history_dir_path, project_id, dataset_id, table_id)[HISTORY_DIR]
+
+def generate_top_k_queries(parent_dir_path : str, project_id : str, dataset_id : str, table_id :str,
+                           start_date : str = MIN_DATE, end_date : str = MAX_DATE) -> dict:
+    """Generate the candidate queries of the top-k-first reports from the top_k directory under the sql parent directory"""
+    top_k_dir_path = os.path.join(parent_dir_path, TOP_K_DIR)
+    return generate_sql_queries(top_k_dir_path, project_id, dataset_id, table_id, start_date, end_date)
+
+def top_k_filter(candidates_df : pd.DataFrame) -> str:
+    """The filter of a report keeping only the rows that can rank with the candidates
+    A row outside the partitions of the candidates or below their lowest score cannot be in the top k
+    Args:
+        candidates_df (pd.DataFrame): the candidates with subreddit, create_date and score
+    """
+    candidates_df = candidates_df.dropna(subset=["subreddit", "create_date", "score"])
+    if len(candidates_df) == 0:
+        return "FALSE"
+    dates = sorted(set(pd.to_datetime(candidates_df["create_date"]).dt.strftime("%Y-%m-%d")))
+    subreddits = sorted(set(candidates_df["subreddit"]))
+    return " AND ".join([
+        "create_date IN (" + ", ".join(f'DATE "{date}"' for date in dates) + ")",
+        "subreddit IN (" + ", ".join(f'"{subreddit}"' for subreddit in subreddits) + ")",
+        f"score >= {int(candidates_df['score'].min())}"
+    ])
+
+def report_dependency_sql(sql_queries : dict, rollup_sql : str, top_k_queries : dict) -> dict:
+    """The sql every report depends on besides its own, part of its cache key
+    A report reading the rollup table depends on the rollup sql(with its date range), a top-k-first report on its candidate query
+    """
+    return {
+        file_name : (rollup_sql if ROLLUP_TABLE_SUFFIX in sql_str else "") + top_k_queries.get(file_name, "")
+        for file_name, sql_str in sql_queries.items()
+    }
+
+def run_top_k_first(run_report, run_candidates, top_k_queries : dict, file_name : str, sql_str : str) -> dict:
+    """Run a report, a report with a candidate query reads its wide columns only for the candidates
+    Args:
+        run_report : the function running a single report with (file_name, sql_str)
+        run_candidates : the function running a candidate query with (sql_str), returns the candidates and the scanned bytes
+        top_k_queries (dict): the candidate query of every top-k-first report
+    Returns:
+        dict: the timing of the report, the scanned bytes include the candidate query
+    """
+    candidate_bytes = 0
+    filter_str = "TRUE"
+    if file_name in top_k_queries:
+        candidates_df, candidate_bytes = run_candidates(top_k_queries[file_name])
+        filter_str = top_k_filter(candidates_df)
+    timing = run_report(file_name, sql_str.replace(TOP_K_FILTER, filter_str))
+    timing["bytes_processed"] = (timing["bytes_processed"] or 0) + candidate_bytes
+    return timing
+
+def merge_bigquery_history(bigquery_client, history_sql : str):
+    """Merge the rollup of the run into the history table(the table is created at the first run)"""
+    history_job = bigquery_client.query(history_sql)
+    history_job.result()
+    print(f"merged the rollup into the history, processed {history_job.total_bytes_processed} bytes")
+
+def read_bigquery_history(bigquery_client, project_id : str, dataset_id : str, table_id : str) -> pd.DataFrame:
+    """Read the last max(HISTORY_WINDOWS) days of the history table"""
+    history_table = f"{project_id}.{dataset_id}.{table_id}{HISTORY_TABLE_SUFFIX}"
+    sql_str = f"""SELECT * FROM `{history_table}`
+        WHERE `date` > DATE_SUB((SELECT MAX(`date`) FROM `{history_table}`), INTERVAL {max(HISTORY_WINDOWS)} DAY)"""
+    return pd.DataFrame([dict(row.items()) for row in bigquery_client.query(sql_str).result()])
+
+def read_bigquery_rollup(bigquery_client, project_id : str, dataset_id : str, table_id : str) -> pd.DataFrame:
+    """Read the columns of the rollup table the author sketches are built from"""
+    rollup_table = f"{project_id}.{dataset_id}.{table_id}{ROLLUP_TABLE_SUFFIX}"
+    sql_str = f"SELECT subreddit, create_date, authorname, post_rows, comment_rows FROM `{rollup_table}`"
+    return pd.DataFrame([dict(row.items()) for row in bigquery_client.query(sql_str).result()])
+
+def update_sketch_store(rollup_df : pd.DataFrame, sketch_path : str):
+    """Replace the sketches of the rollup partitions in the local sketch store"""
+    store_df = pd.read_parquet(sketch_path) if Path(sketch_path).exists() else None
+    store_df = sketches.merge_sketch_store(store_df, sketches.partition_sketches(rollup_df))
+    tmp_sketch_path = f"{sketch_path}.tmp"
+    store_df.to_parquet(tmp_sketch_path, index=False)
+    os.replace(tmp_sketch_path, sketch_path)
+
+def update_gcs_sketch_store(storage_client, storage_bucket : str, rollup_df : pd.DataFrame):
+    """Replace the sketches of the rollup partitions in the sketch store of the report bucket"""
+    import tempfile
+    with tempfile.TemporaryDirectory() as local_dir:
+        sketch_path = str(Path(local_dir) / SKETCH_STORE_FILENAME)
+        generation = download_history(storage_client, storage_bucket, sketch_path, SKETCH_STORE_BLOB_PATH)
+        update_sketch_store(rollup_df, sketch_path)
+        upload_history(storage_client, storage_bucket, sketch_path, generation, SKETCH_STORE_BLOB_PATH)
+
+def materialize_bigquery_rollup(bigquery_client, rollup_sql : str, project_id : str, dataset_id : str, table_id : str) -> dict:
+    """Materialize the rollup table with a single scan of the source table
+    Returns:
+        dict: the timing of the rollup
+    """
+    from google.cloud import bigquery
+    timing = {"report" : ROLLUP_DIR, "submitted_at" : time.time()}
+    rollup_job_config = bigquery.QueryJobConfig(
+        destination=f"{project_id}.{dataset_id}.{table_id}{ROLLUP_TABLE_SUFFIX}",
+        write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE
+    )
+    rollup_job = bigquery_client.query(rollup_sql, job_config=rollup_job_config)
+    rollup_job.result()
+    timing["query_seconds"] = time.time() - timing["submitted_at"]
+    timing["bytes_processed"] = rollup_job.total_bytes_processed
+    tracing.record_span(ROLLUP_DIR, timing["submitted_at"], timing["submitted_at"] + timing["query_seconds"],
+                        bytes_in = timing["bytes_processed"] or 0)
+    print(f"materialized the rollup in {timing['query_seconds']:.2f}s, processed {timing['bytes_processed']} bytes")
+    return timing
+
+def run_bigquery_report(bigquery_client, file_name : str, sql_str : str,
+                        project_id : str, dataset_id : str, storage_bucket : str, storage_directory : str) -> dict:
+    """Run the query job of a report, then extract its destination table into the report bucket
+    Returns:
+        dict: the timing of the report
+    """
+    from google.cloud import bigquery
+    timing = {"report" : file_name, "submitted_at" : time.time()}
+    destination_table = f"{project_id}.{dataset_id}.{file_name}"
+    sql_job_config = bigquery.QueryJobConfig(
+        destination=destination_table,
+        write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE
+    )
+    query_job = bigquery_client.query(sql_str, job_config=sql_job_config)
+    query_job.result()
+    timing["query_seconds"] = time.time() - timing["submitted_at"]
+    timing["bytes_processed"] = query_job.total_bytes_processed
+    extract_start = time.time()
+    destination_uri = f"gs://{storage_bucket}/{storage_directory}/{file_name}.csv"
+    extract_job = bigquery_client.extract_table(
+        destination_table,
+        destination_uri,
+        job_config=bigquery.job.ExtractJobConfig(destination_format="CSV")
+    )
+    extract_job.result()
+    timing["extract_seconds"] = time.time() - extract_start
+    return timing
+
+def run_bigquery_candidates(bigquery_client, sql_str : str) -> (pd.DataFrame, int):
+    """Run the candidate query of a top-k-first report
+    Returns:
+        (pd.DataFrame, int): the candidates and the processed bytes
+    """
+    query_job = bigquery_client.query(sql_str)
+    rows = query_job.result()
+    candidates_df = pd.DataFrame([dict(row.items()) for row in rows], columns=[field.name for field in rows.schema])
+    return candidates_df, query_job.total_bytes_processed or 0
+
+def bigquery_to_duckdb(sql_str : str, table_sources : dict) -> str:
+    """Rewrite the bigquery sql of a report for duckdb
+    Args:
+        sql_str (str): the bigquery sql
+        table_sources (dict): the bigquery table reference -> the duckdb table expression
+    """
+    for table_ref, table_source in table_sources.items():
+        sql_str = sql_str.replace(f"`{table_ref}`", table_source)
+    for pattern, replacement in DUCKDB_REWRITES:
+        sql_str = pattern.sub(replacement, sql_str)
+    # bigquery strings may use double quotes, duckdb uses them for identifiers
+    sql_str = re.sub(r'"([^"]*)"', r"'\1'", sql_str)
+    return sql_str.replace("`", '"')
+
+def local_table_sources(parquet_path : str) -> dict:
+    """The duckdb sources of the source table and the rollup table"""
+    rollup_table = LOCAL_TABLE_REF.split(".")[-1] + ROLLUP_TABLE_SUFFIX
+    return {
+        LOCAL_TABLE_REF : f"read_parquet('{parquet_path}')",
+        LOCAL_TABLE_REF + ROLLUP_TABLE_SUFFIX : rollup_table,
+        LOCAL_TABLE_REF + HISTORY_TABLE_SUFFIX : LOCAL_TABLE_REF.split(".")[-1] + HISTORY_TABLE_SUFFIX
+    }
+
+def materialize_duckdb_rollup(connection, rollup_sql : str, parquet_path : str, output_dir : str) -> dict:
+    """Materialize the rollup table in duckdb and keep a copy in the output directory
+    Returns:
+        dict: the timing of the rollup
+    """
+    timing = {"report" : ROLLUP_DIR, "submitted_at" : time.time()}
+    table_sources = local_table_sources(parquet_path)
+    rollup_table = table_sources[LOCAL_TABLE_REF + ROLLUP_TABLE_SUFFIX]
+    duckdb_sql = bigquery_to_duckdb(rollup_sql, table_sources)
+    connection.execute(f"CREATE OR REPLACE TABLE {rollup_table} AS {duckdb_sql}")
+    connection.execute(f"COPY {rollup_table} TO '{Path(output_dir) / ROLLUP_DIR}.parquet' (FORMAT PARQUET)")
+    timing["query_seconds"] = time.time() - timing["submitted_at"]
+    timing["bytes_processed"] = parquet_scanned_bytes(connection, duckdb_sql, parquet_path)
+    tracing.record_span(ROLLUP_DIR, timing["submitted_at"], timing["submitted_at"] + timing["query_seconds"],
+                        bytes_in = timing["bytes_processed"] or 0)
+    print(f"materialized the rollup in {timing['query_seconds']:.2f}s, scanned {timing['bytes_processed']} bytes")
+    return timing
+
+def merge_duckdb_history(connection, history_sql : str, parquet_path : str, history_path : str):
+    """Merge the rollup of the run into the local history parquet file"""
+    table_sources = local_table_sources(parquet_path)
+    history_table = table_sources[LOCAL_TABLE_REF + HISTORY_TABLE_SUFFIX]
+    if Path(history_path).exists():
+        connection.execute(f"CREATE OR REPLACE TABLE {history_table} AS SELECT * FROM read_parquet('{history_path}')")
+    connection.execute(bigquery_to_duckdb(history_sql, table_sources))
+    # replace the history file at once, a failed run keeps the old history
+    tmp_history_path = f"{history_path}.tmp"
+    connection.execute(f"COPY (SELECT * FROM {history_table} ORDER BY subreddit, \"date\") TO '{tmp_history_path}' (FORMAT PARQUET)")
+    os.replace(tmp_history_path, history_path)
+
+def read_local_history(history_path : str):
+    """Read the local history(or sketch store) parquet file, None before the first merge"""
+    if not Path(history_path).exists():
+        return None
+    return pd.read_parquet(history_path)
+
+def parquet_scans(connection, duckdb_sql : str) -> list[dict]:
+    """The projected columns and the filters of every parquet scan in the physical plan of the query"""
+    explain = connection.execute(f"EXPLAIN (FORMAT JSON) {duckdb_sql}").fetchall()
+    nodes, scans = json.loads(explain[0][1]), []
+    while len(nodes) > 0:
+        node = nodes.pop()
+        extra_info = node.get("extra_info", {})
+        if extra_info.get("Function") == "READ_PARQUET":
+            projections, filters = extra_info.get("Projections", []), extra_info.get("Filters", [])
+            scans.append({
+                "projections" : [projections] if isinstance(projections, str) else projections,
+                "filters" : [filters] if isinstance(filters, str) else filters
+            })
+        nodes.extend(node.get("children", []))
+    return scans
+
+def scan_filter_conditions(filters : list[str]) -> list[tuple]:
+    """The (column, operator, literals) comparisons of the scan filters, the other filters never skip a row group"""
+    conditions = []
+    for filter_str in filters:
+        for part in filter_str.split(" AND "):
+            part = part.strip().removeprefix("optional: ")
+            in_match, comparison_match = SCAN_FILTER_IN.match(part), SCAN_FILTER_COMPARISON.match(part)
+            if in_match is not None:
+                column, operator, literal_str = in_match[1], "IN", in_match[2]
+            elif comparison_match is not None:
+                column, operator, literal_str = comparison_match.groups()
+            else:
+                continue
+            literals = [float(number) if number else string.replace("''", "'")
+                        for string, number in SCAN_FILTER_LITERAL.findall(literal_str)]
+            if len(literals) > 0:
+                conditions.append((column, operator, literals))
+    return conditions
+
+def row_group_may_match(stats : dict, conditions : list[tuple]) -> bool:
+    """Whether the row group statistics {column : (min, max)} can satisfy every condition"""
+    for column, operator, literals in conditions:
+        min_value, max_value = stats.get(column, (None, None))
+        if pd.isna(min_value) or pd.isna(max_value):
+            continue
+        try:
+            if isinstance(literals[0], float):
+                min_value, max_value = float(min_value), float(max_value)
+            in_range = [min_value <= literal <= max_value for literal in literals]
+            skip = {
+                "IN" : not any(in_range), "=" : not in_range[0],
+                ">=" : max_value < literals[0], ">" : max_value <= literals[0],
+                "<=" : min_value > literals[0], "<" : min_value >= literals[0]
+            }[operator]
+        except (TypeError, ValueError):
+            skip = False
+        if skip:
+            return False
+    return True
+
+def parquet_scanned_bytes(connection, duckdb_sql : str, parquet_path : str) -> int:
+    """Estimate the bytes the parquet scans of the query read
+    The compressed size of the projected and filtered columns of every row group the statistics cannot skip
+    """
+    scans = parquet_scans(connection, duckdb_sql)
+    if len(scans) == 0:
+        return 0
+    metadata_df = connection.execute(f"""SELECT file_name, row_group_id, path_in_schema, stats_min_value, stats_max_value,
+        total_compressed_size FROM parquet_metadata('{parquet_path}')""").df()
+    parquet_columns = set(metadata_df["path_in_schema"])
+    scanned_bytes = 0
+    for scan in scans:
+        conditions = scan_filter_conditions(scan["filters"])
+        filter_words = set(re.findall(r"\w+", re.sub(r"'(?:[^']|'')*'", "", " ".join(scan["filters"]))))
+        columns = (set(scan["projections"]) | filter_words) & parquet_columns
+        for _, row_group_df in metadata_df.groupby(["file_name", "row_group_id"]):
+            stats = dict(zip(row_group_df["path_in_schema"], zip(row_group_df["stats_min_value"], row_group_df["stats_max_value"])))
+            if row_group_may_match(stats, conditions):
+                scanned_bytes += int(row_group_df.loc[row_group_df["path_in_schema"].isin(columns), "total_compressed_size"].sum())
+    return scanned_bytes
+
+def run_duckdb_candidates(connection, sql_str : str, parquet_path : str) -> (pd.DataFrame, int):
+    """Run the candidate query of a top-k-first report with duckdb
+    Returns:
+        (pd.DataFrame, int): the candidates and the estimated scanned bytes
+    """
+    cursor = connection.cursor()
+    duckdb_sql = bigquery_to_duckdb(sql_str, local_table_sources(parquet_path))
+    candidates_df = cursor.execute(duckdb_sql).df()
+    scanned_bytes = parquet_scanned_bytes(cursor, duckdb_sql, parquet_path)
+    cursor.close()
+    return candidates_df, scanned_bytes
+
+def run_duckdb_report(connection, file_name : str, sql_str : str, parquet_path : str, output_dir : str) -> dict:
+    """Run a report with duckdb and write the csv into the output directory
+    Returns:
+        dict: the timing of the report
+    """
+    timing = {"report" : file_name, "submitted_at" : time.time()}
+    cursor = connection.cursor() # a duckdb connection cannot be shared between threads, a cursor can
+    output_path = Path(output_dir) / f"{file_name}.csv"
+    duckdb_sql = bigquery_to_duckdb(sql_str, local_table_sources(parquet_path))
+    cursor.execute(f"COPY ({duckdb_sql}) TO '{output_path}' (HEADER, DELIMITER ',')")
+    timing["query_seconds"] = time.time() - timing["submitted_at"]
+    timing["extract_seconds"] = 0.0
+    timing["bytes_processed"] = parquet_scanned_bytes(cursor, duckdb_sql, parquet_path)
+    cursor.close()
+    return timing
+
+def run_reports(run_report, sql_queries : dict, max_in_flight_jobs : int = MAX_IN_FLIGHT_JOBS) -> list[dict]:
+    """Run the reports concurrently
+    Args:
+        run_report : the function running a single report with (file_name, sql_str)
+        sql_queries (dict): the sql of every report
+        max_in_flight_jobs (int, optional): the maximum number of reports running at the same time
+    Returns:
+        list[dict]: the timing of every report in the order of completion
+    """
+    timings = []
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=max_in_flight_jobs) as executor:
+        futures = [executor.submit(run_report, file_name, sql_str) for file_name, sql_str in sql_queries.items()]
+        for future in as_completed(futures):
+            timing = future.result()
+            timing["finished_after_seconds"] = time.time() - start_time
+            print(f"report {timing['report']}: query {timing['query_seconds']:.2f}s, extract {timing['extract_seconds']:.2f}s, "
+                  f"scanned {timing['bytes_processed']} bytes")
+            # the worker threads do not share the span context, the report spans are recorded here
+            tracing.record_span(f"report_{timing['report']}", timing["submitted_at"],
+                                timing["submitted_at"] + timing["query_seconds"] + timing["extract_seconds"],
+                                bytes_in = timing["bytes_processed"] or 0)
+            timings.append(timing)
+    print(f"generated {len(timings)} reports in {time.time() - start_time:.2f}s")
+    return timings
+
+def read_local_reports(output_dir : str) -> dict:
+    """Read the csv files of the dashboard reports from the local output directory"""
+    return {file_name : pd.read_csv(Path(output_dir) / f"{file_name}.csv") for file_name in DASHBOARD_REPORTS}
+
+def read_gcs_reports(storage_client, storage_bucket : str, storage_directory : str) -> dict:
+    """Read the csv files of the dashboard reports from the report bucket"""
+    bucket = storage_client.bucket(storage_bucket)
+    return {
+        file_name : pd.read_csv(io.StringIO(bucket.blob(f"{storage_directory}/{file_name}.csv").download_as_text()))
+        for file_name in DASHBOARD_REPORTS
+    }
+
+def epoch_milliseconds(dates : pd.Series) -> list[int]:
+    return ((pd.to_datetime(dates) - pd.Timestamp(0)) // pd.Timedelta(milliseconds=1)).tolist()
+
+def history_ranges(history_df : pd.DataFrame, windows : list[int] = HISTORY_WINDOWS) -> dict:
+    """Precompute the daily series of the last `window` days of the history for every window
+    Returns:
+        dict: window -> value column -> subreddit -> {t, value}
+    """
+    history_df = history_df.copy()
+    history_df["date"] = pd.to_datetime(history_df["date"])
+    # the same score as sentiment_score.sql
+    history_df["Mean Sentiment Score"] = (history_df["sentiment_sum"] / history_df["sentiment_count"].where(history_df["sentiment_count"] > 0)).round(2) * 10
+    end_date = history_df["date"].max()
+    ranges = {}
+    for window in windows:
+        window_df = history_df[history_df["date"] > end_date - pd.Timedelta(days=window)].sort_values(["subreddit", "date"])
+        ranges[str(window)] = {}
+        for value_column in DASHBOARD_SERIES.values():
+            value_df = window_df.dropna(subset=[value_column])
+            if value_column != "Mean Sentiment Score":
+                value_df = value_df[value_df[value_column] > 0]
+            ranges[str(window)][value_column] = {
+                subreddit : {"t" : epoch_milliseconds(group_df["date"]), "value" : group_df[value_column].astype(float).tolist()}
+                for subreddit, group_df in value_df.groupby("subreddit", sort=False)
+            }
+    return ranges
+
+def build_dashboard_bundle(report_frames : dict, history_df = None, sketch_df = None, day_window : int = DASHBOARD_DAY_WINDOW) -> dict:
+    """Build the dashboard bundle from the report dataframes
+    Args:
+        report_frames (dict): report name -> the dataframe of its csv
+        history_df (pd.DataFrame, optional): the (subreddit, date) history, the history ranges are skipped without it
+        sketch_df (pd.DataFrame, optional): the author sketch store, the author summaries of the ranges are skipped without it
+        day_window (int, optional): the days shown after the first date of every series
+    Returns:
+        dict: the typed bundle, dates are epoch milliseconds and the series are grouped by subreddit
+    """
+    basic_statistics = report_frames["basic_statistics"].iloc[0]
+    bundle = {
+        "generated_at" : int(time.time() * 1000),
+        "basic_statistics" : {column : int(value) for column, value in basic_statistics.items()},
+        # the order of the first appearance in the post breakdown keeps the colors of the subreddits stable
+        "subreddits" : report_frames["post_breakdown"]["subreddit"].drop_duplicates().tolist(),
+        "series" : {},
+        "tables" : {}
+    }
+    for file_name, value_column in DASHBOARD_SERIES.items():
+        series_df = report_frames[file_name].copy()
+        series_df["date"] = pd.to_datetime(series_df["date"])
+        start_date = series_df["date"].min()
+        end_date = start_date + pd.Timedelta(days=day_window)
+        series_df = series_df[(series_df["date"] >= start_date) & (series_df["date"] <= end_date)] \
+            .sort_values(["subreddit", "date"])
+        bundle["series"][value_column] = {
+            subreddit : {
+                "t" : epoch_milliseconds(group_df["date"]),
+                "value" : group_df[value_column].astype(float).tolist()
+            }
+            for subreddit, group_df in series_df.groupby("subreddit", sort=False)
+        }
+    for file_name in DASHBOARD_TABLES:
+        # the tables show the first rows with the text cut to the cell width, the links are kept whole
+        table_df = report_frames[file_name].head(DASHBOARD_TABLE_ROWS)
+        table_df = table_df.astype(object).where(table_df.notna(), None)
+        table_df = table_df.map(lambda x: x[:DASHBOARD_CELL_CHARS] if isinstance(x, str) and not x.startswith("http") else x)
+        bundle["tables"][file_name] = {"columns" : table_df.columns.tolist(), "rows" : table_df.values.tolist()}
+    if history_df is not None and len(history_df) > 0:
+        bundle["history"] = {"windows" : HISTORY_WINDOWS, "ranges" : history_ranges(history_df)}
+        if sketch_df is not None and len(sketch_df) > 0:
+            bundle["history"]["authors"] = sketches.window_author_summary(sketch_df, HISTORY_WINDOWS)
+    return bundle
+
+def write_dashboard_bundle(bundle : dict, output_dir : str):
+    """Write the dashboard bundle into the local output directory"""
+    with open(Path(output_dir) / DASHBOARD_BUNDLE_FILENAME, "w") as f:
+        json.dump(bundle, f, separators=(",", ":"))
+
+def upload_dashboard_bundle(storage_client, bundle : dict, storage_bucket : str, storage_directory : str):
+    """Upload the dashboard bundle next to the report csv files"""
+    storage_client.bucket(storage_bucket).blob(f"{storage_directory}/{DASHBOARD_BUNDLE_FILENAME}") \
+        .upload_from_string(json.dumps(bundle, separators=(",", ":")), content_type="application/json")
+
+def initialize_storage_client(credential_path : str = GCP_PATH):
+    from google.cloud import storage
+    from google.oauth2 import service_account
+    credentials = service_account.Credentials.from_service_account_file(credential_path)
+    return storage.Client(credentials=credentials)
+
+def cached_gcs_reports(storage_client, storage_bucket : str, storage_directory : str, sql_queries : dict,
+                       source_fingerprint : str, run_misses, use_cache : bool = True, dependency_sql : dict = None) -> list[dict]:
+    """Restore the cached reports in the report bucket and run only the missed reports
+    Args:
+        run_misses : the function running the missed reports with (sql_queries), the csv files are written to the report bucket
+        use_cache (bool, optional): run every report without the cache
+        dependency_sql (dict, optional): report -> the rollup and candidate sql it depends on(report_dependency_sql)
+    Returns:
+        list[dict]: the timing of the reports that ran
+    """
+    if not use_cache:
+        return run_misses(sql_queries)
+    bucket = storage_client.bucket(storage_bucket)
+    index = report_cache.load_gcs_index(bucket)
+    hits, misses, keys = report_cache.split_cached_reports(sql_queries, source_fingerprint, index, dependency_sql=dependency_sql)
+    tracing.current_span().set(cache_hits = len(hits), cache_misses = len(misses))
+    for file_name, key in hits.items():
+        report_cache.restore_gcs_report(bucket, key, f"{storage_directory}/{file_name}.csv")
+    timings = run_misses(misses) if len(misses) > 0 else []
+    for file_name in misses:
+        size = report_cache.store_gcs_report(bucket, f"{storage_directory}/{file_name}.csv", keys[file_name])
+        report_cache.record_entry(index, keys[file_name], file_name, size)
+    report_cache.delete_gcs_entries(bucket, report_cache.evict_entries(index))
+    report_cache.save_gcs_index(bucket, index)
+    return timings
+
 def generate_data_main(storage_bucket : str, storage_directory : str, sql_parent_project : str,
-                       project_id : str, dataset_id : str, table_id : str):
+                       project_id : str, dataset_id : str, table_id : str,
+                       start_date : str = MIN_DATE, end_date : str = MAX_DATE,
+                       max_in_flight_jobs : int = MAX_IN_FLIGHT_JOBS, use_cache : bool = True):
     """
     Use the sql and bigquery to generate the data for the report(Cost reduction)
     Args:
         storage_bucket (str) : the storage bucket on google cloud
         storage_path (str) : the storage path on google cloud
+        start_date (str, optional) : the first create date of the report(inclusive)
+        end_date (str, optional) : the last create date of the report(inclusive)
+        use_cache (bool, optional) : reuse the reports of an unchanged source table
     """
-    bigquery_client = initialize_bigquery_client(GCP_PATH) 
+    bigquery_client = initialize_bigquery_client(GCP_PATH)
     # generate the sql query
-    sql_queries = generate_sql_queries(sql_parent_project, project_id, dataset_id, table_id) 
-    for file_name, sql_str in sql_queries.items(): 
-        destination_table = f"{project_id}.{dataset_id}.{file_name}"
-        sql_job_config = bigquery.QueryJobConfig(
-            destination=destination_table,
-            write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE
-        )
-        query_job = bigquery_client.query(sql_str, job_config=sql_job_config)
-        query_job.result()
-        destination_uri = f"gs://{storage_bucket}/{storage_directory}/{file_name}.csv"
-        extract_job = bigquery_client.extract_table(
-            destination_table,
-            destination_uri,
-            job_config=bigquery.job.ExtractJobConfig(destination_format="CSV")
-        )
-        extract_job.result()
+    sql_queries = generate_sql_queries(sql_parent_project, project_id, dataset_id, table_id, start_date, end_date)
+    rollup_sql = generate_rollup_query(sql_parent_project, project_id, dataset_id, table_id, start_date, end_date)
+    history_sql = generate_history_query(sql_parent_project, project_id, dataset_id, table_id)
+    top_k_queries = generate_top_k_queries(sql_parent_project, project_id, dataset_id, table_id, start_date, end_date)
+
+    def run_misses(missed_queries : dict) -> list[dict]:
+        materialize_bigquery_rollup(bigquery_client, rollup_sql, project_id, dataset_id, table_id)
+        merge_bigquery_history(bigquery_client, history_sql)
+        update_gcs_sketch_store(storage_client, storage_bucket, read_bigquery_rollup(bigquery_client, project_id, dataset_id, table_id))
+        run_report = partial(run_bigquery_report, bigquery_client,
+                             project_id=project_id, dataset_id=dataset_id,
+                             storage_bucket=storage_bucket, storage_directory=storage_directory)
+        run_report = partial(run_top_k_first, run_report, partial(run_bigquery_candidates, bigquery_client), top_k_queries)
+        return run_reports(run_report, missed_queries, max_in_flight_jobs)
+
+    storage_client = initialize_storage_client(GCP_PATH)
+    source_fingerprint = report_cache.bigquery_fingerprint(bigquery_client, f"{project_id}.{dataset_id}.{table_id}") if use_cache else ""
+    timings = cached_gcs_reports(storage_client, storage_bucket, storage_directory, sql_queries, source_fingerprint, run_misses,
+                                 use_cache, report_dependency_sql(sql_queries, rollup_sql, top_k_queries))
+    bundle = build_dashboard_bundle(read_gcs_reports(storage_client, storage_bucket, storage_directory),
+                                    read_bigquery_history(bigquery_client, project_id, dataset_id, table_id),
+                                    read_gcs_history(storage_client, storage_bucket, SKETCH_STORE_BLOB_PATH))
+    upload_dashboard_bundle(storage_client, bundle, storage_bucket, storage_directory)
+    return timings
+
+def duckdb_reports(parquet_path : str, output_dir : str, sql_queries : dict, rollup_sql : str,
+                   history_sql : str = None, history_path : str = None,
+                   max_in_flight_jobs : int = MAX_IN_FLIGHT_JOBS, top_k_queries : dict = None) -> list[dict]:
+    """Materialize the rollup, merge it into the history parquet file(if given) and run the reports with duckdb"""
+    import duckdb
+    connection = duckdb.connect()
+    materialize_duckdb_rollup(connection, rollup_sql, parquet_path, output_dir)
+    if history_path is not None:
+        merge_duckdb_history(connection, history_sql, parquet_path, history_path)
+        rollup_df = pd.read_parquet(Path(output_dir) / f"{ROLLUP_DIR}.parquet")
+        update_sketch_store(rollup_df, str(Path(history_path).with_name(SKETCH_STORE_FILENAME)))
+    run_report = partial(run_duckdb_report, connection, parquet_path=parquet_path, output_dir=output_dir)
+    run_candidates = partial(run_duckdb_candidates, connection, parquet_path=parquet_path)
+    run_report = partial(run_top_k_first, run_report, run_candidates, top_k_queries or {})
+    return run_reports(run_report, sql_queries, max_in_flight_jobs)
+
+def cached_local_reports(output_dir : str, sql_queries : dict, source_fingerprint : str, run_misses,
+                         dependency_sql : dict = None) -> list[dict]:
+    """Restore the cached reports in the local output directory and run only the missed reports
+    Args:
+        run_misses : the function running the missed reports with (sql_queries), the csv files are written to the output directory
+        dependency_sql (dict, optional): report -> the rollup and candidate sql it depends on(report_dependency_sql)
+    Returns:
+        list[dict]: the timing of the reports that ran
+    """
+    cache_dir = Path(output_dir) / report_cache.CACHE_DIR
+    cache_dir.mkdir(exist_ok=True)
+    index = report_cache.load_local_index(str(cache_dir))
+    hits, misses, keys = report_cache.split_cached_reports(sql_queries, source_fingerprint, index, dependency_sql=dependency_sql)
+    for file_name, key in hits.items():
+        report_cache.restore_local_report(str(cache_dir), key, str(Path(output_dir) / f"{file_name}.csv"))
+    timings = run_misses(misses) if len(misses) > 0 else []
+    for file_name in misses:
+        size = report_cache.store_local_report(str(cache_dir), str(Path(output_dir) / f"{file_name}.csv"), keys[file_name])
+        report_cache.record_entry(index, keys[file_name], file_name, size)
+    report_cache.delete_local_entries(str(cache_dir), report_cache.evict_entries(index))
+    report_cache.save_local_index(str(cache_dir), index)
+    return timings
+
+def generate_data_local(parquet_path : str, output_dir : str, sql_parent_project : str,
+                        start_date : str = MIN_DATE, end_date : str = MAX_DATE,
+                        max_in_flight_jobs : int = MAX_IN_FLIGHT_JOBS, use_cache : bool = True,
+                        history_path : str = None):
+    """Generate the report data locally with duckdb over the merged parquet file
+    Args:
+        parquet_path (str): the merged meta text parquet file(or a glob of the part files)
+        output_dir (str): the local directory of the csv files, the cache is kept under it
+        sql_parent_project (str): the parent directory of the sql queries
+        use_cache (bool, optional) : reuse the reports of an unchanged parquet file
+        history_path (str, optional) : the history parquet file. Defaults to history.parquet under the output directory.
+    """
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    if history_path is None:
+        history_path = str(Path(output_dir) / f"{HISTORY_DIR}.parquet")
+    sql_queries = generate_sql_queries(sql_parent_project, *LOCAL_TABLE_REF.split("."), start_date, end_date)
+    rollup_sql = generate_rollup_query(sql_parent_project, *LOCAL_TABLE_REF.split("."), start_date, end_date)
+    history_sql = generate_history_query(sql_parent_project, *LOCAL_TABLE_REF.split("."))
+    top_k_queries = generate_top_k_queries(sql_parent_project, *LOCAL_TABLE_REF.split("."), start_date, end_date)
+    run_misses = partial(duckdb_reports, parquet_path, output_dir, rollup_sql=rollup_sql,
+                         history_sql=history_sql, history_path=history_path, max_in_flight_jobs=max_in_flight_jobs,
+                         top_k_queries=top_k_queries)
+    if use_cache:
+        timings = cached_local_reports(output_dir, sql_queries, report_cache.local_fingerprint(parquet_path), run_misses,
+                                       report_dependency_sql(sql_queries, rollup_sql, top_k_queries))
+    else:
+        timings = run_misses(sql_queries)
+    bundle = build_dashboard_bundle(read_local_reports(output_dir), read_local_history(history_path),
+                                    read_local_history(str(Path(history_path).with_name(SKETCH_STORE_FILENAME))))
+    write_dashboard_bundle(bundle, output_dir)
+    return timings
+
+def merged_output_prefix(source_directory : str, source_path : str) -> str:
+    """The prefix of the committed merge output that holds its manifest"""
+    return f"{source_directory}/{PurePosixPath(source_path).parent}"
+
+def download_merged_output(storage_client, source_bucket : str, source_directory : str, source_path : str, local_dir : str) -> str:
+    """Download the committed merge output(every part file listed in its manifest)
+    Returns:
+        str: the parquet glob of the downloaded files
+    """
+    from etl.output_commit import read_manifest
+    manifest = read_manifest(storage_client, source_bucket, merged_output_prefix(source_directory, source_path))
+    if manifest is not None:
+        blob_names = [file_dict["name"] for file_dict in manifest["files"]]
+    else:
+        blob_names = [f"{source_directory}/{source_path}"]
+    bucket = storage_client.bucket(source_bucket)
+    for idx, blob_name in enumerate(blob_names):
+        bucket.blob(blob_name).download_to_filename(str(Path(local_dir) / f"part-{idx}.parquet"))
+    return str(Path(local_dir) / "*.parquet")
+
+def upload_reports(storage_client, output_dir : str, storage_bucket : str, storage_directory : str):
+    """Upload the csv files of the reports to the same place the bigquery extract jobs write them"""
+    bucket = storage_client.bucket(storage_bucket)
+    for csv_path in sorted(Path(output_dir).glob("*.csv")):
+        bucket.blob(f"{storage_directory}/{csv_path.name}").upload_from_filename(str(csv_path), content_type="text/csv")
+
+def download_history(storage_client, storage_bucket : str, local_path : str, blob_path : str = HISTORY_BLOB_PATH) -> int:
+    """Download the history(or sketch store) parquet file of the report bucket
+    Returns:
+        int: the generation of the history(0 before the first merge)
+    """
+    blob = storage_client.bucket(storage_bucket).get_blob(blob_path)
+    if blob is None:
+        return 0
+    blob.download_to_filename(local_path, if_generation_match=blob.generation)
+    return blob.generation
+
+def upload_history(storage_client, storage_bucket : str, local_path : str, generation : int, blob_path : str = HISTORY_BLOB_PATH):
+    """Upload the merged history(or sketch store), fail if another run replaced it in between"""
+    storage_client.bucket(storage_bucket).blob(blob_path).upload_from_filename(local_path, if_generation_match=generation)
+
+def read_gcs_history(storage_client, storage_bucket : str, blob_path : str = HISTORY_BLOB_PATH):
+    """Read the history(or sketch store) parquet file of the report bucket, None before the first merge"""
+    blob = storage_client.bucket(storage_bucket).get_blob(blob_path)
+    if blob is None:
+        return None
+    return pd.read_parquet(io.BytesIO(blob.download_as_bytes()))
+
+def generate_data_duckdb_main(storage_bucket : str, storage_directory : str, sql_parent_project : str,
+                              source_bucket : str, source_directory : str, source_path : str,
+                              start_date : str = MIN_DATE, end_date : str = MAX_DATE,
+                              max_in_flight_jobs : int = MAX_IN_FLIGHT_JOBS, use_cache : bool = True,
+                              storage_client = None):
+    """Generate the report data with embedded duckdb on the airflow vm instead of bigquery
+    Args:
+        storage_bucket (str) : the report bucket on google cloud
+        storage_directory (str) : the report directory on google cloud
+        sql_parent_project (str): the parent directory of the sql queries
+        source_bucket (str): the bucket of the merged meta text output
+        source_directory (str): the date directory of the merged meta text output
+        source_path (str): the merged meta text file under the date directory
+        use_cache (bool, optional) : reuse the reports of an unchanged merge output
+        storage_client (optional) : the storage client. Defaults to the client of GCP_PATH.
+    """
+    import tempfile
+    from etl.run_manifest import fingerprint_prefix
+    if storage_client is None:
+        storage_client = initialize_storage_client(GCP_PATH)
+    sql_queries = generate_sql_queries(sql_parent_project, *LOCAL_TABLE_REF.split("."), start_date, end_date)
+    rollup_sql = generate_rollup_query(sql_parent_project, *LOCAL_TABLE_REF.split("."), start_date, end_date)
+    history_sql = generate_history_query(sql_parent_project, *LOCAL_TABLE_REF.split("."))
+    top_k_queries = generate_top_k_queries(sql_parent_project, *LOCAL_TABLE_REF.split("."), start_date, end_date)
+
+    def run_misses(missed_queries : dict) -> list[dict]:
+        # the merged output is only downloaded when a report has to run
+        with tempfile.TemporaryDirectory() as local_dir:
+            source_dir, output_dir = Path(local_dir) / "source", Path(local_dir) / "reports"
+            source_dir.mkdir()
+            output_dir.mkdir()
+            parquet_path = download_merged_output(storage_client, source_bucket, source_directory, source_path, str(source_dir))
+            history_path = str(Path(local_dir) / f"{HISTORY_DIR}.parquet")
+            sketch_path = str(Path(local_dir) / SKETCH_STORE_FILENAME)
+            history_generation = download_history(storage_client, storage_bucket, history_path)
+            sketch_generation = download_history(storage_client, storage_bucket, sketch_path, SKETCH_STORE_BLOB_PATH)
+            timings = duckdb_reports(parquet_path, str(output_dir), missed_queries, rollup_sql,
+                                     history_sql, history_path, max_in_flight_jobs, top_k_queries)
+            upload_reports(storage_client, str(output_dir), storage_bucket, storage_directory)
+            upload_history(storage_client, storage_bucket, history_path, history_generation)
+            upload_history(storage_client, storage_bucket, sketch_path, sketch_generation, SKETCH_STORE_BLOB_PATH)
+        return timings
 
+    source_fingerprint = json.dumps(
+        fingerprint_prefix(storage_client, source_bucket, merged_output_prefix(source_directory, source_path)),
+        sort_keys=True
+    )
+    timings = cached_gcs_reports(storage_client, storage_bucket, storage_directory, sql_queries, source_fingerprint, run_misses,
+                                 use_cache, report_dependency_sql(sql_queries, rollup_sql, top_k_queries))
+    bundle = build_dashboard_bundle(read_gcs_reports(storage_client, storage_bucket, storage_directory),
+                                    read_gcs_history(storage_client, storage_bucket),
+                                    read_gcs_history(storage_client, storage_bucket, SKETCH_STORE_BLOB_PATH))
+    upload_dashboard_bundle(storage_client, bundle, storage_bucket, storage_directory)
+    return timings
 
 if __name__ == "__main__":
     argparser = argparse.ArgumentParser("Generate the data for the report")
-    argparser.add_argument("--storage_bucket", required=True, type=str, help="the storage bucket")
-    argparser.add_argument("--storage_directory", required=True, type=str, help="the storage directory")
+    argparser.add_argument("--backend", type=str, default="bigquery", choices=["bigquery", "duckdb", "local"], help="where the queries run")
+    argparser.add_argument("--storage_bucket", type=str, help="the storage bucket")
+    argparser.add_argument("--storage_directory", type=str, help="the storage directory")
     argparser.add_argument("--sql_parent_project", type=str, required=True, help="the parent directory of the sql queries")
-    argparser.add_argument("--project_id", type=str, required=True, help="the project id")
-    argparser.add_argument("--dataset_id", type=str, required=True, help="the dataset id")
-    argparser.add_argument("--table_id", type=str, required=True, help="the table id")
+    argparser.add_argument("--project_id", type=str, help="the project id")
+    argparser.add_argument("--dataset_id", type=str, help="the dataset id")
+    argparser.add_argument("--table_id", type=str, help="the table id")
+    argparser.add_argument("--source_bucket", type=str, help="the bucket of the merged parquet file of the duckdb backend")
+    argparser.add_argument("--source_directory", type=str, help="the directory of the merged parquet file of the duckdb backend")
+    argparser.add_argument("--source_path", type=str, help="the merged parquet file under the directory of the duckdb backend")
+    argparser.add_argument("--parquet_path", type=str, help="the merged parquet file of the local backend")
+    argparser.add_argument("--output_dir", type=str, help="the output directory of the local backend")
+    argparser.add_argument("--history_path", type=str, help="the history parquet file of the local backend")
+    argparser.add_argument("--start_date", type=str, default=MIN_DATE, help="the first create date of the report(inclusive)")
+    argparser.add_argument("--end_date", type=str, default=MAX_DATE, help="the last create date of the report(inclusive)")
+    argparser.add_argument("--max_in_flight_jobs", type=int, default=MAX_IN_FLIGHT_JOBS, help="the maximum number of concurrent reports")
+    argparser.add_argument("--no_cache", action="store_true", help="run every report without the report cache")
 
     args = argparser.parse_args()
 
-    generate_data_main(args.storage_bucket, args.storage_directory, args.sql_parent_project,
-                       args.project_id, args.dataset_id, args.table_id)
+    if args.backend == "local":
+        generate_data_local(args.parquet_path, args.output_dir, args.sql_parent_project,
+                            args.start_date, args.end_date, args.max_in_flight_jobs, not args.no_cache, args.history_path)
+    elif args.backend == "duckdb":
+        generate_data_duckdb_main(args.storage_bucket, args.storage_directory, args.sql_parent_project,
+                                  args.source_bucket, args.source_directory, args.source_path,
+                                  args.start_date, args.end_date, args.max_in_flight_jobs, not args.no_cache)
+    else:
+        generate_data_main(args.storage_bucket, args.storage_directory, args.sql_parent_project,
+                           args.project_id, args.dataset_id, args.table_id,
+                           args.start_date, args.end_date, args.max_in_flight_jobs, not args.no_cache)
@@ -0,0 +1,438 @@
+import argparse
+import hashlib
+import multiprocessing
+import os
+import random
+import shutil
+import struct
+import sys
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from datetime import date, datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from types import SimpleNamespace
+
+from etl import tracing
+from etl.pipeline_config import (DATA_META_COMBINED_PATH, IMAGE_CAPTION_PATH, IMAGE_TEXT_DIR, IMAGE_TEXT_FILENAME,
+                                 IMAGE_TEXT_SENTIMENT_PATH, META_TEXT_DIR, META_TEXT_FILENAME,
+                                 IMAGE_CAPTION_TEXT_SQL, META_TEXT_SQL)
+
+# Idea:
+# Run the stages of the pipelined DAG in one process pool, without airflow, ssh, docker, dataproc or bigquery
+#   scraping        -> reddit_scraping.scrape with a fixture reddit instance(posts, comments, image posts)
+#   compact/merge   -> compact_small_files_main, combine_file on a local spark session + commit_output
+#   image_scraping  -> image_scrape_main, the image urls point to a local http server of generated pngs
+#                      with --stream image_scrape_stream_main on the image log the scraper appends to, next to the scraping
+#   caption         -> image_caption.main
+#   merge two files -> merge_two_files on a local spark session + commit_output
+#   sentiment       -> sentiment_analysis.main
+#   union, reports  -> union_subreddit_outputs_main, generate_data_duckdb_main
+# Every bucket is a directory under {work_dir}/storage(etl/local_storage.py), the same entry points get the local client
+# A stage starts as soon as the stages it depends on finished, the gpu stages run one at a time like on the single gpu vm
+# Every stage records its span under {work_dir}/traces, the per-stage timings and the latest-finisher chain are printed at the end
+# Run it from airflows/scripts: python -m etl.local_runner --work_dir /tmp/local_run
+
+SCRIPTS_DIR = Path(__file__).resolve().parents[1]
+SERVICES_DIR = SCRIPTS_DIR.parents[1] / "services"
+SERVICE_DIRS = ["scrape_docker", "image_scrape_docker", "image_caption_docker", "sentiment_analysis_docker"]
+SQL_PARENT_PROJECT = str(Path(__file__).resolve().parent / "sql_queries")
+BUCKETS = {
+    "image_bucket" : "image",
+    "text_bucket" : "text",
+    "meta_bucket" : "meta",
+    "report_bucket" : "report"
+}
+TERRAFORM_STORAGES = ["image_bucket", "text_bucket", "meta_bucket"]
+DEFAULT_SUBREDDITS = ["ucla", "berkeley", "UCSD"]
+GPU_LOCK = "gpu"
+STREAM_POLL_SECONDS = 0.2
+FIXTURE_IMAGE_SIZE = 64
+
+
+def import_service_modules():
+    """Make the flat imports of the services and the spark jobs resolve like in their images
+    parquet_config and tracing are the copies of the etl modules, so they are the same module objects here
+    """
+    for module_dir in [SERVICES_DIR / service_dir for service_dir in SERVICE_DIRS] + [SCRIPTS_DIR / "etl"]:
+        if str(module_dir) not in sys.path:
+            sys.path.append(str(module_dir))
+    from etl import parquet_config, segment_log
+    sys.modules.setdefault("parquet_config", parquet_config)
+    sys.modules.setdefault("segment_log", segment_log)
+    sys.modules.setdefault("tracing", tracing)
+
+
+def storage_client_of(context : dict):
+    from etl.local_storage import LocalStorageClient
+    return LocalStorageClient(context["storage_root"])
+
+
+# ---------------------------------------------------------------- fixtures
+
+class FixtureComments(list):
+    """The comment forest of a post, already expanded"""
+
+    def replace_more(self, limit = None):
+        return []
+
+
+class FixtureReddit:
+    """The praw instance of the fixture subreddits"""
+
+    def __init__(self, posts : dict):
+        self.posts = posts
+
+    def subreddit(self, subreddit_name : str):
+        return SimpleNamespace(new = lambda limit = None : iter(self.posts[subreddit_name]))
+
+
+def fixture_posts(subreddit : str, start_date : str, end_date : str, n_posts : int, n_comments : int,
+                  image_fraction : float, image_base_url : str, seed : int = 0) -> list:
+    """The posts of a subreddit between the dates(inclusive), the newest first like `new()`
+    Args:
+        n_posts (int): the number of posts
+        n_comments (int): the most comments of a post
+        image_fraction (float): the fraction of the image posts
+        image_base_url (str): the url of the fixture image server
+    """
+    rng = random.Random(f"{seed}-{subreddit}")
+    first_day, last_day = date.fromisoformat(start_date), date.fromisoformat(end_date)
+    n_days = (last_day - first_day).days + 1
+    posts = []
+    for post_idx in range(n_posts):
+        # noon utc is the same day in los angeles
+        post_day = last_day - timedelta(days = post_idx * n_days // n_posts)
+        created_utc = datetime(post_day.year, post_day.month, post_day.day, 12, tzinfo = timezone.utc).timestamp() - post_idx
+        post_id = f"{subreddit.lower()}p{post_idx}"
+        comments = FixtureComments(
+            SimpleNamespace(id = f"{post_id}c{comment_idx}", created_utc = created_utc + comment_idx + 1,
+                            permalink = f"/r/{subreddit}/comments/{post_id}/_/{post_id}c{comment_idx}/",
+                            score = rng.randint(-5, 200), body = f"comment {comment_idx} on {post_id}",
+                            author = SimpleNamespace(id = f"a{rng.randint(0, 99)}", name = f"author_{rng.randint(0, 99)}"))
+            for comment_idx in range(rng.randint(0, n_comments))
+        )
+        is_image = rng.random() < image_fraction
+        posts.append(SimpleNamespace(
+            id = post_id, created_utc = created_utc, score = rng.randint(0, 500),
+            url = f"{image_base_url}/{post_id}.png" if is_image else f"https://www.reddit.com/r/{subreddit}/comments/{post_id}/",
+            post_hint = "image" if is_image else "self",
+            title = f"post {post_idx} of {subreddit}", selftext = f"the body of {post_id}",
+            author = SimpleNamespace(id = f"a{rng.randint(0, 99)}", name = f"author_{rng.randint(0, 99)}"),
+            comments = comments
+        ))
+    return posts
+
+
+def fixture_png(name : str, size : int = FIXTURE_IMAGE_SIZE) -> bytes:
+    """A single colour png of the name(standard library only)"""
+    red, green, blue = hashlib.md5(name.encode()).digest()[:3]
+    raw_rows = b"".join(b"\x00" + bytes([red, green, blue]) * size for _ in range(size))
+
+    def chunk(chunk_type : bytes, data : bytes) -> bytes:
+        return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0)) \
+        + chunk(b"IDAT", zlib.compress(raw_rows)) + chunk(b"IEND", b"")
+
+
+class FixtureImageHandler(BaseHTTPRequestHandler):
+    """Serve a generated png for every path"""
+
+    def do_GET(self):
+        body = fixture_png(self.path)
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_image_server() -> (ThreadingHTTPServer, str):
+    """Start the fixture image server on a free local port
+    Returns:
+        (ThreadingHTTPServer, str): the server and its base url
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureImageHandler)
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/images"
+
+
+# ---------------------------------------------------------------- stages
+
+def scrape_stage(context : dict, subreddit : str, directory : str, start_date : str, end_date : str,
+                 n_posts : int, n_comments : int, image_fraction : float, image_base_url : str, seed : int):
+    import reddit_scraping
+    from etl.segment_log import SegmentLog, IMAGE_META_STREAM
+    # the wait of the reddit api, 0 unless the stream is shown
+    reddit_scraping.SLEEPTIME = context["sleep_seconds"]
+    storage_client = storage_client_of(context)
+    reddit_instance = FixtureReddit({subreddit : fixture_posts(subreddit, start_date, end_date, n_posts, n_comments,
+                                                               image_fraction, image_base_url, seed)})
+    image_log = None
+    if context["stream"]:
+        image_log = SegmentLog(storage_client, context["image_bucket"], IMAGE_META_STREAM.format(directory = directory), context["stream_token"])
+    reddit_scraping.scrape(reddit_instance, storage_client, subreddit,
+                           context["image_bucket"], context["text_bucket"], context["meta_bucket"],
+                           directory, end_date, start_date, thres = context["chunk_rows"], image_log = image_log)
+
+
+def compact_stage(context : dict, bucket_name : str, directory : str):
+    from etl.compact_small_files import compact_small_files_main
+    # the scraper of the subreddit has finished, every chunk can be compacted
+    compact_small_files_main(bucket_name, directory, min_file_age_seconds = 0, storage_client = storage_client_of(context))
+
+
+def combine_stage(context : dict, bucket_name : str, directory : str):
+    from dataproc_merge_files import initialize_spark, combine_file
+    from etl.output_commit import commit_output
+    combine_file(initialize_spark(), bucket_name, directory, context["image_bucket"], f"{context['storage_root']}/")
+    commit_output(storage_client_of(context), bucket_name, f"{directory}/combined", "combined.parquet")
+
+
+def image_scrape_stage(context : dict, directory : str):
+    from image_scraping import image_scrape_main, image_scrape_stream_main
+    if context["stream"]:
+        image_scrape_stream_main(1, 0, context["image_bucket"], directory, storage_client = storage_client_of(context),
+                                 poll_seconds = STREAM_POLL_SECONDS, stream_token = context["stream_token"])
+        return
+    image_scrape_main(1, 0, context["image_bucket"], directory, storage_client = storage_client_of(context))
+
+
+def image_caption_stage(context : dict, directory : str):
+    import image_caption
+    image_caption.main(context["image_bucket"], directory, DATA_META_COMBINED_PATH, storage_client = storage_client_of(context))
+
+
+def merge_two_files_stage(context : dict, directory : str, bucket1 : str, file1_path : str, bucket2 : str, file2_path : str,
+                          output_bucket : str, output_directory : str, output_filename : str, sql_statement : str):
+    from dataproc_merge_two_files import initialize_spark, merge_two_files
+    from etl.output_commit import commit_output
+    from etl.run_manifest import join_plan_attributes
+    storage_client = storage_client_of(context)
+    join_plan = merge_two_files(initialize_spark(),
+                    storage_client.path_of(bucket1, f"{directory}/{file1_path}"),
+                    storage_client.path_of(bucket2, f"{directory}/{file2_path}"),
+                    storage_client.path_of(output_bucket, f"{directory}/{output_directory}"),
+                    sql_statement)
+    tracing.current_span().set(**join_plan_attributes(join_plan))
+    commit_output(storage_client, output_bucket, f"{directory}/{output_directory}", output_filename)
+
+
+def sentiment_stage(context : dict, directory : str):
+    import sentiment_analysis
+    sentiment_analysis.main(context["text_bucket"], directory, f"{IMAGE_TEXT_DIR}/{IMAGE_TEXT_FILENAME}",
+                            context["text_bucket"], IMAGE_TEXT_SENTIMENT_PATH, storage_client = storage_client_of(context))
+
+
+def union_stage(context : dict, subreddits : list[str]):
+    from etl.union_subreddit_outputs import union_subreddit_outputs_main
+    union_subreddit_outputs_main(context["meta_bucket"], context["directory"], subreddits, META_TEXT_DIR,
+                                 storage_client = storage_client_of(context))
+
+
+def report_stage(context : dict, start_date : str, end_date : str):
+    from etl.generate_data_for_report import generate_data_duckdb_main
+    generate_data_duckdb_main(context["report_bucket"], context["directory"], SQL_PARENT_PROJECT,
+                              context["meta_bucket"], context["directory"], f"{META_TEXT_DIR}/{META_TEXT_FILENAME}",
+                              start_date, end_date, storage_client = storage_client_of(context))
+
+
+def stage_spec(stage : str, subreddit : str, function, kwargs : dict, deps : list[str], lock : str = None) -> dict:
+    key = f"{subreddit}/{stage}" if subreddit else stage
+    return {"key" : key, "stage" : stage, "subreddit" : subreddit, "function" : function,
+            "kwargs" : kwargs, "deps" : deps, "lock" : lock}
+
+
+def pipeline_stages(context : dict, subreddits : list[str], start_date : str, end_date : str, n_posts : int,
+                    n_comments : int, image_fraction : float, image_base_url : str, seed : int) -> list[dict]:
+    """The stages of the pipelined DAG with their dependencies"""
+    from etl.union_subreddit_outputs import subreddit_directory
+    stages = []
+    for subreddit in subreddits:
+        directory = subreddit_directory(context["directory"], subreddit)
+        key = lambda stage : f"{subreddit}/{stage}"
+        stages.append(stage_spec("scraping", subreddit, scrape_stage, {
+            "subreddit" : subreddit, "directory" : directory, "start_date" : start_date, "end_date" : end_date,
+            "n_posts" : n_posts, "n_comments" : n_comments, "image_fraction" : image_fraction,
+            "image_base_url" : image_base_url, "seed" : seed
+        }, []))
+        for bucket_name_key in TERRAFORM_STORAGES:
+            bucket_kwargs = {"bucket_name" : context[bucket_name_key], "directory" : directory}
+            stages.append(stage_spec(f"compact_{bucket_name_key}", subreddit, compact_stage, bucket_kwargs, [key("scraping")]))
+            stages.append(stage_spec(f"merge_{bucket_name_key}", subreddit, combine_stage, bucket_kwargs,
+                                     [key(f"compact_{bucket_name_key}")]))
+        # a streaming image scraping starts with the scraping on the image log
+        stages.append(stage_spec("image_scraping", subreddit, image_scrape_stage, {"directory" : directory},
+                                 [] if context["stream"] else [key("merge_image_bucket")]))
+        stages.append(stage_spec("generate_image_caption", subreddit, image_caption_stage, {"directory" : directory},
+                                 [key("image_scraping"), key("merge_image_bucket")], GPU_LOCK))
+        stages.append(stage_spec("merge_image_caption_text", subreddit, merge_two_files_stage, {
+            "directory" : directory,
+            "bucket1" : context["text_bucket"], "file1_path" : DATA_META_COMBINED_PATH,
+            "bucket2" : context["image_bucket"], "file2_path" : IMAGE_CAPTION_PATH,
+            "output_bucket" : context["text_bucket"], "output_directory" : IMAGE_TEXT_DIR,
+            "output_filename" : IMAGE_TEXT_FILENAME, "sql_statement" : IMAGE_CAPTION_TEXT_SQL
+        }, [key("generate_image_caption"), key("merge_text_bucket")]))
+        stages.append(stage_spec("sentiment_analysis", subreddit, sentiment_stage, {"directory" : directory},
+                                 [key("merge_image_caption_text")], GPU_LOCK))
+        stages.append(stage_spec("merge_meta_text", subreddit, merge_two_files_stage, {
+            "directory" : directory,
+            "bucket1" : context["meta_bucket"], "file1_path" : DATA_META_COMBINED_PATH,
+            "bucket2" : context["text_bucket"], "file2_path" : IMAGE_TEXT_SENTIMENT_PATH,
+            "output_bucket" : context["meta_bucket"], "output_directory" : META_TEXT_DIR,
+            "output_filename" : META_TEXT_FILENAME, "sql_statement" : META_TEXT_SQL
+        }, [key("merge_meta_bucket"), key("sentiment_analysis")]))
+    stages.append(stage_spec("union_meta_text", None, union_stage, {"subreddits" : subreddits},
+                             [f"{subreddit}/merge_meta_text" for subreddit in subreddits]))
+    stages.append(stage_spec("generate_data_report_duckdb", None, report_stage,
+                             {"start_date" : start_date, "end_date" : end_date}, ["union_meta_text"]))
+    return stages
+
+
+# ---------------------------------------------------------------- scheduling
+
+def run_stage(context : dict, stage : str, subreddit : str, function, kwargs : dict) -> float:
+    """Run a stage in a worker process, in its own working directory and under its own span
+    Returns:
+        float: the duration of the stage in seconds
+    """
+    work_dir = Path(context["work_dir"]) / "stages" / (subreddit or "run") / stage
+    work_dir.mkdir(parents = True, exist_ok = True)
+    os.chdir(work_dir)
+    tracing.configure(str(Path(context["traces_dir"]) / f"{subreddit or 'run'}-{stage}.jsonl"), context["directory"])
+    start_time = time.time()
+    with tracing.span(stage, subreddit = subreddit):
+        function(context, **kwargs)
+    return time.time() - start_time
+
+
+def run_pipeline(context : dict, stages : list[dict], n_workers : int) -> dict:
+    """Run the stages in dependency order on a process pool
+    A stage starts once all its dependencies succeeded, a failed stage skips every stage depending on it
+    The stages sharing a lock run one at a time
+    Returns:
+        dict: key -> {"status" : ok/failed/skipped, "seconds", "error"}
+    """
+    results = {}
+    pending = {stage["key"] : stage for stage in stages}
+    running, held_locks = {}, set()
+    spawn_context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(n_workers, mp_context = spawn_context, initializer = import_service_modules) as executor:
+        while len(pending) > 0 or len(running) > 0:
+            for key, stage in list(pending.items()):
+                dep_status = [results.get(dep, {}).get("status") for dep in stage["deps"]]
+                if any(status in ("failed", "skipped") for status in dep_status):
+                    results[key] = {"status" : "skipped", "seconds" : 0.0, "error" : None}
+                    del pending[key]
+                    continue
+                if all(status == "ok" for status in dep_status) and stage["lock"] not in held_locks:
+                    future = executor.submit(run_stage, context, stage["stage"], stage["subreddit"],
+                                             stage["function"], stage["kwargs"])
+                    running[future] = stage
+                    if stage["lock"] is not None:
+                        held_locks.add(stage["lock"])
+                    del pending[key]
+            if len(running) == 0:
+                continue
+            done, _ = wait(running, return_when = FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                held_locks.discard(stage["lock"])
+                try:
+                    results[stage["key"]] = {"status" : "ok", "seconds" : future.result(), "error" : None}
+                except Exception as e:
+                    results[stage["key"]] = {"status" : "failed", "seconds" : 0.0, "error" : f"{type(e).__name__}: {e}"}
+                print(f"{stage['key']} {results[stage['key']]['status']}")
+    return results
+
+
+def print_timings(stages : list[dict], results : dict, wall_seconds : float):
+    print(f"\n{'stage':<48}{'status':>9}{'seconds':>10}")
+    for stage in stages:
+        result = results[stage["key"]]
+        print(f"{stage['key']:<48}{result['status']:>9}{result['seconds']:>10.2f}")
+        if result["error"] is not None:
+            print(f"    {result['error'][:200]}")
+    total_seconds = sum(result["seconds"] for result in results.values())
+    print(f"\nwall clock {wall_seconds:.2f}s, stage total {total_seconds:.2f}s, "
+          f"{sum(result['status'] == 'ok' for result in results.values())}/{len(results)} stages ok")
+
+
+def local_runner_main(work_dir : str, subreddits : list[str], start_date : str, end_date : str,
+                      n_posts : int, n_comments : int, image_fraction : float, n_workers : int, seed : int = 0,
+                      stream : bool = False, chunk_rows : int = 50, sleep_seconds : float = 0.0) -> dict:
+    """Run the whole pipeline locally on the fixture subreddits
+    Args:
+        work_dir (str): the directory of the local buckets, the working directories of the stages and the spans
+        subreddits (list[str]): the fixture subreddits
+        start_date (str): the first day of the posts
+        end_date (str): the last day of the posts
+        n_posts (int): the posts of every subreddit
+        n_comments (int): the most comments of a post
+        image_fraction (float): the fraction of the image posts
+        n_workers (int): the worker processes
+        stream (bool, optional): hand the image chunks to the image scraping through the image log. Defaults to False.
+        chunk_rows (int, optional): the rows of a chunk of the scraper. Defaults to 50.
+        sleep_seconds (float, optional): the wait of the scraper per post and comment. Defaults to 0.0.
+    Returns:
+        dict: the status and the duration of every stage
+    """
+    from etl.trace_summary import read_trace_lines, print_summary
+    work_path = Path(work_dir).resolve()
+    context = {
+        "work_dir" : str(work_path),
+        "storage_root" : str(work_path / "storage"),
+        "traces_dir" : str(work_path / "traces"),
+        "directory" : f"{start_date}-{end_date}",
+        "stream" : stream,
+        # a rerun in the same work_dir ignores the image logs of the runs before
+        "stream_token" : uuid.uuid4().hex,
+        "chunk_rows" : chunk_rows,
+        "sleep_seconds" : sleep_seconds,
+        **BUCKETS
+    }
+    for bucket_name in BUCKETS.values():
+        (work_path / "storage" / bucket_name).mkdir(parents = True, exist_ok = True)
+    (work_path / "traces").mkdir(parents = True, exist_ok = True)
+    server, image_base_url = start_image_server()
+    stages = pipeline_stages(context, subreddits, start_date, end_date, n_posts, n_comments, image_fraction, image_base_url, seed)
+    start_time = time.time()
+    try:
+        results = run_pipeline(context, stages, n_workers)
+    finally:
+        server.shutdown()
+    print_timings(stages, results, time.time() - start_time)
+    print()
+    print_summary(tracing.read_spans(read_trace_lines(context["traces_dir"])))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("run the pipeline locally on fixture data without airflow, docker or the cloud")
+    parser.add_argument("--work_dir", type=str, default="./local_run", help="the directory of the local buckets and the spans")
+    parser.add_argument("--subreddits", type=str, nargs="+", default=DEFAULT_SUBREDDITS, help="the fixture subreddits")
+    parser.add_argument("--start_date", type=str, default="2024-01-01", help="the first day of the posts")
+    parser.add_argument("--end_date", type=str, default="2024-01-07", help="the last day of the posts")
+    parser.add_argument("--n_posts", type=int, default=20, help="the posts of every subreddit")
+    parser.add_argument("--n_comments", type=int, default=5, help="the most comments of a post")
+    parser.add_argument("--image_fraction", type=float, default=0.3, help="the fraction of the image posts")
+    parser.add_argument("--n_workers", type=int, default=os.cpu_count(), help="the worker processes")
+    parser.add_argument("--seed", type=int, default=0, help="the seed of the fixture data")
+    parser.add_argument("--stream", action="store_true", help="run the image scraping next to the scraping on the image log")
+    parser.add_argument("--chunk_rows", type=int, default=50, help="the rows of a chunk of the scraper")
+    parser.add_argument("--sleep_seconds", type=float, default=0.0, help="the wait of the scraper per post and comment")
+    parser.add_argument("--clean", action="store_true", help="remove the work directory first")
+    args = parser.parse_args()
+    if args.clean and Path(args.work_dir).exists():
+        shutil.rmtree(args.work_dir)
+    results = local_runner_main(args.work_dir, args.subreddits, args.start_date, args.end_date, args.n_posts,
+                                args.n_comments, args.image_fraction, args.n_workers, args.seed,
+                                args.stream, args.chunk_rows, args.sleep_seconds)
+    sys.exit(0 if all(result["status"] == "ok" for result in results.values()) else 1)
@@ -0,0 +1,190 @@
+import base64
+import hashlib
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from google.api_core.exceptions import NotFound, PreconditionFailed
+
+# Idea:
+# A directory on the local disk that behaves like the google cloud storage client for the calls the pipeline makes
+#   gs://{bucket}/{name} -> {root}/{bucket}/{name}
+#   generation           -> the modification time of the file in nanoseconds(0 for a missing object, like gcs)
+#   compose              -> concatenation of the source objects
+# The missing objects and the failed preconditions raise the same exceptions as gcs, so the retry and skip logic is unchanged
+# Spark and duckdb read and write the same files through the local path of an object(path_of)
+# The local runner(etl/local_runner.py) passes this client to every stage instead of the gcs client
+
+
+class LocalBlob:
+    """An object of a local bucket
+    Like a gcs blob, the metadata(size, generation, ...) is the snapshot of the last listing, reload or upload
+    """
+
+    def __init__(self, bucket, name : str):
+        self.bucket = bucket
+        self.name = name
+        self.path = bucket.path / name
+        self._stat = None
+
+    def _load(self):
+        self._stat = self.path.stat() if self.path.is_file() else None
+        return self
+
+    def _current_generation(self) -> int:
+        """The generation on the storage(0 for a missing object, like gcs)"""
+        return self.path.stat().st_mtime_ns if self.path.is_file() else 0
+
+    @property
+    def size(self):
+        return self._stat.st_size if self._stat else None
+
+    @property
+    def generation(self):
+        return self._stat.st_mtime_ns if self._stat else None
+
+    @property
+    def updated(self):
+        return datetime.fromtimestamp(self._stat.st_mtime, tz=timezone.utc) if self._stat else None
+
+    @property
+    def md5_hash(self):
+        if not self._stat or self._current_generation() != self._stat.st_mtime_ns:
+            return None
+        return base64.b64encode(hashlib.md5(self.path.read_bytes()).digest()).decode()
+
+    def exists(self, *args, **kwargs) -> bool:
+        return self.path.is_file()
+
+    def reload(self, *args, **kwargs):
+        if not self.path.is_file():
+            raise NotFound(f"gs://{self.bucket.name}/{self.name}")
+        self._load()
+
+    def check_generation(self, if_generation_match = None):
+        """Raise like gcs if the generation precondition fails(0 means the object must not exist)"""
+        if if_generation_match is None:
+            return
+        if self._current_generation() != if_generation_match:
+            raise PreconditionFailed(f"gs://{self.bucket.name}/{self.name} is not at generation {if_generation_match}")
+
+    @contextmanager
+    def replace(self, if_generation_match = None):
+        """Write a temporary file and move it onto the object at once"""
+        self.check_generation(if_generation_match)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, prefix=".tmp-")
+        os.close(fd)
+        try:
+            yield tmp_path
+            os.replace(tmp_path, self.path)
+            self._load()
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def upload_from_filename(self, filename : str, content_type : str = None, if_generation_match = None, **kwargs):
+        with self.replace(if_generation_match) as tmp_path:
+            shutil.copyfile(filename, tmp_path)
+
+    def upload_from_string(self, data, content_type : str = None, if_generation_match = None, **kwargs):
+        with self.replace(if_generation_match) as tmp_path:
+            Path(tmp_path).write_bytes(data.encode() if isinstance(data, str) else data)
+
+    def download_as_bytes(self, if_generation_match = None, **kwargs) -> bytes:
+        self.check_generation(if_generation_match)
+        self.reload()
+        return self.path.read_bytes()
+
+    def download_as_text(self, if_generation_match = None, **kwargs) -> str:
+        return self.download_as_bytes(if_generation_match).decode()
+
+    def download_to_filename(self, filename : str, if_generation_match = None, **kwargs):
+        self.check_generation(if_generation_match)
+        self.reload()
+        shutil.copyfile(self.path, filename)
+
+    def download_to_file(self, file_obj, **kwargs):
+        file_obj.write(self.download_as_bytes())
+
+    def open(self, mode : str = "rb", **kwargs):
+        if "r" in mode:
+            self.reload()
+        else:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        return open(self.path, mode)
+
+    def delete(self, if_generation_match = None, **kwargs):
+        if not self.path.is_file():
+            raise NotFound(f"gs://{self.bucket.name}/{self.name}")
+        self.check_generation(if_generation_match)
+        self.path.unlink()
+
+    def compose(self, sources : list, if_generation_match = None, **kwargs):
+        with self.replace(if_generation_match) as tmp_path:
+            with open(tmp_path, "wb") as f:
+                for source in sources:
+                    f.write(source.download_as_bytes())
+
+
+class LocalBucket:
+    """A directory under the root of the local storage"""
+
+    def __init__(self, client, name : str):
+        self.client = client
+        self.name = name
+        self.path = Path(client.root) / name
+
+    def blob(self, blob_name : str) -> LocalBlob:
+        return LocalBlob(self, blob_name)
+
+    def get_blob(self, blob_name : str, *args, **kwargs):
+        blob = self.blob(blob_name)._load()
+        return blob if blob.generation is not None else None
+
+    def exists(self) -> bool:
+        return self.path.is_dir()
+
+    def copy_blob(self, blob : LocalBlob, destination_bucket, new_name : str = None, if_generation_match = None, **kwargs) -> LocalBlob:
+        destination_blob = destination_bucket.blob(new_name or blob.name)
+        with destination_blob.replace(if_generation_match) as tmp_path:
+            Path(tmp_path).write_bytes(blob.download_as_bytes())
+        return destination_blob
+
+
+class LocalStorageClient:
+    """The storage client of a local root directory"""
+
+    def __init__(self, root : str):
+        self.root = str(Path(root).resolve())
+
+    def bucket(self, bucket_name : str) -> LocalBucket:
+        return LocalBucket(self, bucket_name)
+
+    def path_of(self, bucket_name : str, blob_name : str = "") -> str:
+        """The local path of an object(or a prefix), the replacement of its gs:// uri"""
+        return str(Path(self.root) / bucket_name / blob_name)
+
+    def list_blobs(self, bucket_name : str, prefix : str = None, delimiter : str = None, max_results : int = None, **kwargs) -> list:
+        """The objects of the bucket in name order, without the objects under a sub directory with a delimiter"""
+        bucket = self.bucket(bucket_name)
+        if not bucket.path.is_dir():
+            raise NotFound(f"gs://{bucket_name}")
+        prefix = prefix or ""
+        blobs = []
+        for path in sorted(bucket.path.rglob("*")):
+            name = path.relative_to(bucket.path).as_posix()
+            if not path.is_file() or not name.startswith(prefix) or path.name.startswith(".tmp-"):
+                continue
+            if delimiter is not None and delimiter in name[len(prefix):]:
+                continue
+            blobs.append(bucket.blob(name)._load())
+            if max_results is not None and len(blobs) >= max_results:
+                break
+        return blobs
+
+    @contextmanager
+    def batch(self, *args, **kwargs):
+        yield self
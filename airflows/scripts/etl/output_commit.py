@@ -0,0 +1,140 @@
+import json
+from datetime import datetime, timezone
+
+# Idea:
+# Spark writes `part-*.parquet` plus `_SUCCESS` marker files into the output directory.
+# Instead of copying every part onto the same destination name and deleting the source,
+# the commit step
+#   1. deletes the marker files in one batch request
+#   2. single part  -> server side compose into `output_filename` (metadata only, no download/upload)
+#      multi parts  -> keep the parts where they are
+#   3. writes `_manifest.json` listing the data files of the output
+# The manifest starts with "_" so spark and the other parquet readers skip it.
+
+MANIFEST_FILENAME = "_manifest.json"
+
+
+def batch_delete(storage_client, blobs : list):
+    """Delete the blobs in a single batch request
+    Args:
+        storage_client : the storage client
+        blobs (list): the blobs to delete
+    """
+    if len(blobs) == 0:
+        return
+    with storage_client.batch():
+        for blob in blobs:
+            blob.delete()
+
+
+def manifest_path(prefix : str) -> str:
+    """The manifest path of an output directory"""
+    return f"{prefix}/{MANIFEST_FILENAME}"
+
+
+def write_manifest(bucket, prefix : str, data_blobs : list) -> dict:
+    """Write the manifest of the data files under the prefix
+    Args:
+        bucket : the output bucket
+        prefix (str): the output directory
+        data_blobs (list): the committed data blobs
+    Returns:
+        dict: the manifest
+    """
+    return upload_manifest(bucket, prefix, [
+        {
+            "name" : blob.name,
+            "size" : blob.size,
+            "generation" : blob.generation,
+            "md5_hash" : blob.md5_hash
+        }
+        for blob in data_blobs
+    ])
+
+
+def upload_manifest(bucket, prefix : str, files : list[dict]) -> dict:
+    """Upload the manifest listing the data files of the output under the prefix"""
+    manifest = {
+        "committed_at" : datetime.now(timezone.utc).isoformat(),
+        "files" : files
+    }
+    bucket.blob(manifest_path(prefix)).upload_from_string(
+        json.dumps(manifest), content_type="application/json"
+    )
+    return manifest
+
+
+def read_manifest(storage_client, bucket_name : str, prefix : str):
+    """Read the manifest of an output directory
+    Returns:
+        Return None if the output directory has not been committed
+        Return the manifest dict otherwise
+    """
+    blob = storage_client.bucket(bucket_name).blob(manifest_path(prefix))
+    if not blob.exists():
+        return None
+    return json.loads(blob.download_as_text())
+
+
+def union_manifests(storage_client, bucket_name : str, prefixes : list[str], output_prefix : str) -> dict:
+    """Commit the union of the committed outputs under the prefixes as the output under output_prefix
+    The union manifest lists the data files of every output where they are, no data file is copied
+    Args:
+        storage_client : the storage client
+        bucket_name (str): the bucket of the outputs
+        prefixes (list[str]): the output directories, the uncommitted ones are skipped
+        output_prefix (str): the output directory of the union
+    Returns:
+        dict: the union manifest
+    """
+    files = []
+    for prefix in prefixes:
+        manifest = read_manifest(storage_client, bucket_name, prefix)
+        if manifest is None:
+            print(f"{prefix} has not been committed, skip it")
+            continue
+        files.extend(manifest["files"])
+    if len(files) == 0:
+        raise FileNotFoundError(f"none of the {len(prefixes)} outputs has been committed")
+    return upload_manifest(storage_client.bucket(bucket_name), output_prefix, files)
+
+
+def manifest_uris(manifest : dict, bucket_name : str) -> list[str]:
+    """The gs:// uris of the data files recorded in the manifest"""
+    return [f"gs://{bucket_name}/{file_dict['name']}" for file_dict in manifest["files"]]
+
+
+def commit_output(storage_client, bucket_name : str, prefix : str, output_filename : str) -> dict:
+    """Commit the spark output under the prefix
+    Args:
+        storage_client : the storage client
+        bucket_name (str): the output bucket name
+        prefix (str): the output directory written by spark
+        output_filename (str): the file name of a single part output
+    Returns:
+        dict: the manifest of the committed output
+    """
+    bucket = storage_client.bucket(bucket_name)
+    marker_blobs, part_blobs = [], []
+    for blob in storage_client.list_blobs(bucket_name, prefix = f"{prefix}/"):
+        file_name = blob.name.split("/")[-1]
+        if len(file_name) == 0 or blob.name == manifest_path(prefix):
+            continue
+        if file_name[0] == "_" or file_name[0] == ".":
+            marker_blobs.append(blob)
+        else:
+            part_blobs.append(blob)
+    batch_delete(storage_client, marker_blobs)
+
+    destination_blob_name = f"{prefix}/{output_filename}"
+    if len(part_blobs) == 1 and part_blobs[0].name != destination_blob_name:
+        # compose is done by the storage server, the object bytes never leave GCS
+        print("compose the single part into ", destination_blob_name)
+        destination_blob = bucket.blob(destination_blob_name)
+        destination_blob.compose(part_blobs)
+        batch_delete(storage_client, part_blobs)
+        destination_blob.reload()
+        part_blobs = [destination_blob]
+    else:
+        print(f"keep {len(part_blobs)} part files under {prefix}")
+    return write_manifest(bucket, prefix, part_blobs)
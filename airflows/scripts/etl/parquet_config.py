@@ -0,0 +1,86 @@
+import inspect
+
+# Idea:
+# The single parquet writer configuration used by every stage of the pipeline
+#   rows sorted by (subreddit, create_date, id) -> row group statistics let the date range filters skip row groups
+#   fixed row group size, zstd compression and dictionary encoding
+#   bloom filters on id and parent -> id lookups skip the row groups that cannot contain the id
+# The spark jobs get this file through `python_file_uris` and the service images copy it in at build time(Makefile)
+
+SORT_COLUMNS = ["subreddit", "create_date", "id"]
+BLOOM_FILTER_COLUMNS = ["id", "parent"]
+COMPRESSION = "zstd"
+ROW_GROUP_ROWS = 128 * 1024
+ROW_GROUP_BYTES = 64 * 1024 * 1024
+BLOOM_FILTER_FPP = 0.05
+
+
+def present_columns(wanted_columns : list[str], columns) -> list[str]:
+    """The wanted columns that exist in the columns, in the wanted order"""
+    columns = set(columns)
+    return [column for column in wanted_columns if column in columns]
+
+
+def pyarrow_write_options(table) -> dict:
+    """The keyword arguments of pyarrow.parquet.write_table for the table"""
+    import pyarrow.parquet as pq
+    options = {
+        "row_group_size" : ROW_GROUP_ROWS,
+        "compression" : COMPRESSION,
+        "use_dictionary" : True,
+        "write_statistics" : True
+    }
+    # older pyarrow releases cannot write bloom filters, the rest of the layout still applies
+    if "bloom_filter_options" in inspect.signature(pq.write_table).parameters:
+        options["bloom_filter_options"] = {
+            column : {"ndv" : max(table.num_rows, 1), "fpp" : BLOOM_FILTER_FPP}
+            for column in present_columns(BLOOM_FILTER_COLUMNS, table.column_names)
+        }
+    return options
+
+
+def write_table(table, path : str, **overrides):
+    """Write the pyarrow table with the shared layout
+    Args:
+        table (pyarrow.Table): the table to write
+        path (str): the local output path
+        overrides: write_table arguments replacing the shared ones
+    """
+    import pyarrow.parquet as pq
+    sort_keys = present_columns(SORT_COLUMNS, table.column_names)
+    if len(sort_keys) > 0:
+        table = table.sort_by([(column, "ascending") for column in sort_keys])
+    options = pyarrow_write_options(table)
+    options.update(overrides)
+    pq.write_table(table, path, **options)
+
+
+def write_parquet(df, path : str, **overrides):
+    """Write the pandas dataframe with the shared layout
+    Args:
+        df (pd.DataFrame): the dataframe to write
+        path (str): the local output path
+        overrides: write_table arguments replacing the shared ones
+    """
+    import pyarrow as pa
+    write_table(pa.Table.from_pandas(df, preserve_index=False), path, **overrides)
+
+
+def spark_write_options(columns) -> dict:
+    """The options of the spark parquet writer for a dataframe with the columns"""
+    options = {
+        "compression" : COMPRESSION,
+        "parquet.block.size" : str(ROW_GROUP_BYTES),
+        "parquet.enable.dictionary" : "true"
+    }
+    for column in present_columns(BLOOM_FILTER_COLUMNS, columns):
+        options[f"parquet.bloom.filter.enabled#{column}"] = "true"
+    return options
+
+
+def spark_write_parquet(df, output_path : str):
+    """Sort the single partition spark dataframe and write it with the shared layout"""
+    sort_keys = present_columns(SORT_COLUMNS, df.columns)
+    if len(sort_keys) > 0:
+        df = df.sortWithinPartitions(*sort_keys)
+    df.write.mode("overwrite").options(**spark_write_options(df.columns)).parquet(output_path)
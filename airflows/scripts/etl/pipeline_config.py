@@ -0,0 +1,102 @@
+import json
+from functools import lru_cache
+from pathlib import Path
+
+# standard library only, cheap enough for the parse of the DAG
+from etl import tracing
+
+# Idea:
+# The DAG module never reads a Variable or a file, the scheduler parses it without a metadata-db query
+#   operator arguments -> `{{ var.value.* }}` templates, rendered only when the task runs
+#   the task structure that depends on the Variables(connections, subreddits) -> mapped tasks expanded at run time
+# The tasks that need the values in python read them once per worker process through load_pipeline_config
+# and the etl functions are imported only inside the task through run_etl, which records the call as a span of the run
+
+SUBREDDITS_PATH = "/opt/airflow/subreddits.txt"
+DEFAULT_REPORT_BACKEND = "bigquery"
+PIPELINE_VARIABLES = [
+    "docker_username",
+    "gpu_vm_name",
+    "gpu_ip_address",
+    "ssh_private_key_path",
+    "ssh_public_key",
+    "report_backend",
+    "start_date",
+    "end_date",
+    "directory",
+    "image_bucket",
+    "text_bucket",
+    "meta_bucket",
+    "spark_bucket",
+    "cluster_name",
+    "region",
+    "report_bucket",
+    "project_id",
+    "bigquery_dataset_id",
+    # optional, the run manifests of the previous run help to balance the scraping
+    "previous_directory"
+]
+JSON_VARIABLES = ["internal_ip_addresses", "image_internal_ip_addresses", "client_id", "client_secret"]
+
+# the outputs of the stages under the date directory, shared by the DAGs and the local runner
+DATA_META_COMBINED_PATH = "combined/combined.parquet"
+IMAGE_CAPTION_PATH = "image_caption/image_caption.parquet"
+# Merge image and text
+IMAGE_TEXT_DIR = "image_text"
+IMAGE_TEXT_FILENAME = "image_text.parquet"
+# Sentiment Analaysis
+IMAGE_TEXT_SENTIMENT_PATH = "image_text_sentiment/image_text_sentiment.parquet"
+# Merge Meta with text sentiment
+META_TEXT_DIR = "meta_text_merge"
+META_TEXT_FILENAME = "meta_text.parquet"
+# the compaction after the scraping skips the chunks younger than this, a chunk may still be uploading
+COMPACTION_MIN_FILE_AGE_SECONDS = 120
+
+# the merge statements of the pipelined DAG and the local runner
+IMAGE_CAPTION_TEXT_SQL = """
+    SELECT text.id, IFNULL(concat(text.text, image.image_caption), text.text) as text
+    FROM df1 as text
+    LEFT JOIN df2 as image
+    on text.id = image.id
+"""
+META_TEXT_SQL = """
+    select m.id, m.url, m.score, CONCAT("https://www.reddit.com/user/", m.authorname) as author_url,
+        m.authorname, m.parent, m.create_date, m.subreddit, s.text, s.sentiment
+    from df1 as m
+    left join df2 as s
+    on m.id = s.id
+"""
+
+
+def read_subreddits(subreddits_path : str = SUBREDDITS_PATH) -> list[str]:
+    """The space separated subreddits of the airflow image"""
+    with open(subreddits_path, "r") as f:
+        return f.read().strip().split(" ")
+
+
+@lru_cache(maxsize=1)
+def load_pipeline_config() -> dict:
+    """Read the Variables and the subreddits of the pipeline once per process
+    Returns:
+        dict: the Variable values, the json Variables decoded, plus n_ssh_connections, n_image_connections and subreddits
+    """
+    from airflow.models import Variable
+    config = {key : Variable.get(key, default_var=None) for key in PIPELINE_VARIABLES}
+    config.update({key : json.loads(Variable.get(key, default_var="[]")) for key in JSON_VARIABLES})
+    config["report_backend"] = config["report_backend"] or DEFAULT_REPORT_BACKEND
+    config["n_ssh_connections"] = len(config["internal_ip_addresses"])
+    config["n_image_connections"] = len(config["image_internal_ip_addresses"])
+    config["subreddits"] = read_subreddits() if Path(SUBREDDITS_PATH).exists() else []
+    return config
+
+
+def run_etl(module_name : str, function_name : str, etl_kwargs : dict, stage : str = None, subreddit : str = None):
+    """Import the etl function only when the task runs and call it with the rendered arguments
+    The call is the span `stage`(the function name by default) of the run
+    """
+    import importlib
+    config = load_pipeline_config()
+    if config["spark_bucket"] and config["directory"]:
+        tracing.configure(tracing.trace_export_uri(config["spark_bucket"], config["directory"]), config["directory"])
+    with tracing.span(stage or function_name, module = module_name, subreddit = subreddit):
+        return getattr(importlib.import_module(f"etl.{module_name}"), function_name)(**etl_kwargs)
@@ -1,4 +1,6 @@
 from datetime import datetime, timedelta
+import base64
+import hashlib
 import json
 import os
 from pathlib import Path
@@ -24,7 +26,8 @@ TERRAFORM_STORAGES = [
 
 SPARK_PYTHON_FILES = [
     f"{HOME}/scripts/etl/dataproc_merge_files.py",
-    f"{HOME}/scripts/etl/dataproc_merge_two_files.py"
+    f"{HOME}/scripts/etl/dataproc_merge_two_files.py",
+    f"{HOME}/scripts/etl/parquet_config.py"
 ]
 
 
@@ -75,10 +78,14 @@ def upload_spark_job_file(storage_client, file_path : str, spark_job_bucket_name
     python_file_path = Path(file_path)
     if not python_file_path.exists():
         raise FileNotFoundError(f"The python file {file_path} is not found")
-    # upload the file into the blob
+    # upload the file into the blob, an unchanged file keeps its generation
     bucket = storage_client.bucket(spark_job_bucket_name)
-    blob = bucket.blob(python_file_path.name)
-    blob.upload_from_filename(file_path)
+    blob = bucket.get_blob(python_file_path.name)
+    local_md5_hash = base64.b64encode(hashlib.md5(python_file_path.read_bytes()).digest()).decode()
+    if blob is not None and blob.md5_hash == local_md5_hash:
+        print(f"{python_file_path.name} is unchanged, skip the upload")
+        return
+    bucket.blob(python_file_path.name).upload_from_filename(file_path)
 
 def project_init() -> dict:
     '''
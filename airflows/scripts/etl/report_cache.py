@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+
+# Idea:
+# A report output only depends on its sql text(after the placeholder substitution), the sql of the tables it reads
+# through(the rollup, its top-k candidate query) and on the source table
+#   cache key = sha256(sql text + dependency sql + source fingerprint)
+#   source fingerprint = bigquery (num_rows, last modified) / the generations of the merged output files / the local file stats
+# The cached csv files live next to the reports(report bucket or local directory) under `report_cache/`
+# with an index of {key : {report, created_at, size}}
+# A hit copies the cached csv to the report path, a miss runs the report and stores its csv under the key
+# The entries older than max_age_seconds are evicted, then the oldest entries until the cache is under max_cache_bytes
+
+CACHE_DIR = "report_cache"
+CACHE_INDEX_FILENAME = "index.json"
+MAX_AGE_SECONDS = 7 * 24 * 60 * 60
+MAX_CACHE_BYTES = 1024 * 1024 * 1024
+
+
+def cache_key(sql_str : str, source_fingerprint : str, dependency_sql : str = "") -> str:
+    """The cache key of a report"""
+    return hashlib.sha256(f"{source_fingerprint}\n{dependency_sql}\n{sql_str}".encode()).hexdigest()
+
+
+def bigquery_fingerprint(bigquery_client, table_id_full : str) -> str:
+    """The fingerprint of a bigquery table from its row count and last modified time"""
+    table = bigquery_client.get_table(table_id_full)
+    return f"{table_id_full}:{table.num_rows}:{table.modified.isoformat()}"
+
+
+def local_fingerprint(parquet_path : str) -> str:
+    """The fingerprint of the local parquet file(or glob) from the size and modified time of every file"""
+    file_paths = sorted(Path(parquet_path).parent.glob(Path(parquet_path).name))
+    file_stats = [f"{file_path}:{file_path.stat().st_size}:{file_path.stat().st_mtime_ns}" for file_path in file_paths]
+    return hashlib.sha256("\n".join(file_stats).encode()).hexdigest()
+
+
+def split_cached_reports(sql_queries : dict, source_fingerprint : str, index : dict,
+                         max_age_seconds : int = MAX_AGE_SECONDS, dependency_sql : dict = None):
+    """Split the reports into the cache hits and the misses
+    Args:
+        dependency_sql (dict, optional): report -> the sql of the tables the report reads besides the source table
+    Returns:
+        (dict, dict, dict): report -> key of the hits, report -> sql of the misses, report -> key of every report
+    """
+    now = time.time()
+    keys, hits, misses = {}, {}, {}
+    for file_name, sql_str in sql_queries.items():
+        key = cache_key(sql_str, source_fingerprint, (dependency_sql or {}).get(file_name, ""))
+        keys[file_name] = key
+        entry = index.get(key)
+        if entry is not None and now - entry["created_at"] <= max_age_seconds:
+            hits[file_name] = key
+            print(f"report cache hit: {file_name} ({key[:12]})")
+        else:
+            misses[file_name] = sql_str
+            print(f"report cache miss: {file_name} ({key[:12]})")
+    return hits, misses, keys
+
+
+def record_entry(index : dict, key : str, file_name : str, size : int):
+    """Record a cached report in the index"""
+    index[key] = {"report" : file_name, "created_at" : time.time(), "size" : size}
+
+
+def evict_entries(index : dict, max_age_seconds : int = MAX_AGE_SECONDS, max_cache_bytes : int = MAX_CACHE_BYTES) -> list[str]:
+    """Remove the expired entries, then the oldest entries until the cache fits in max_cache_bytes
+    Returns:
+        list[str]: the evicted keys
+    """
+    now = time.time()
+    evicted = [key for key, entry in index.items() if now - entry["created_at"] > max_age_seconds]
+    for key in evicted:
+        index.pop(key)
+    cache_bytes = sum(entry["size"] for entry in index.values())
+    for key in sorted(index, key=lambda x: index[x]["created_at"]):
+        if cache_bytes <= max_cache_bytes:
+            break
+        cache_bytes -= index.pop(key)["size"]
+        evicted.append(key)
+    if len(evicted) > 0:
+        print(f"report cache evicted {len(evicted)} entries")
+    return evicted
+
+
+# the cache in the report bucket
+def load_gcs_index(bucket) -> dict:
+    blob = bucket.blob(f"{CACHE_DIR}/{CACHE_INDEX_FILENAME}")
+    if not blob.exists():
+        return {}
+    return json.loads(blob.download_as_text())
+
+
+def save_gcs_index(bucket, index : dict):
+    bucket.blob(f"{CACHE_DIR}/{CACHE_INDEX_FILENAME}").upload_from_string(json.dumps(index), content_type="application/json")
+
+
+def restore_gcs_report(bucket, key : str, report_blob_name : str):
+    """Copy the cached csv to the report path(server side copy)"""
+    bucket.copy_blob(bucket.blob(f"{CACHE_DIR}/{key}.csv"), bucket, report_blob_name)
+
+
+def store_gcs_report(bucket, report_blob_name : str, key : str) -> int:
+    """Copy the report csv into the cache
+    Returns:
+        int: the size of the cached csv
+    """
+    cached_blob = bucket.copy_blob(bucket.blob(report_blob_name), bucket, f"{CACHE_DIR}/{key}.csv")
+    return cached_blob.size
+
+
+def delete_gcs_entries(bucket, keys : list[str]):
+    for key in keys:
+        blob = bucket.blob(f"{CACHE_DIR}/{key}.csv")
+        if blob.exists():
+            blob.delete()
+
+
+# the cache in a local directory
+def load_local_index(cache_dir : str) -> dict:
+    index_path = Path(cache_dir) / CACHE_INDEX_FILENAME
+    if not index_path.exists():
+        return {}
+    with open(index_path, "r") as f:
+        return json.load(f)
+
+
+def save_local_index(cache_dir : str, index : dict):
+    index_path = Path(cache_dir) / CACHE_INDEX_FILENAME
+    tmp_path = index_path.with_suffix(".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, index_path)
+
+
+def restore_local_report(cache_dir : str, key : str, report_path : str):
+    shutil.copyfile(Path(cache_dir) / f"{key}.csv", report_path)
+
+
+def store_local_report(cache_dir : str, report_path : str, key : str) -> int:
+    cached_path = Path(cache_dir) / f"{key}.csv"
+    shutil.copyfile(report_path, cached_path)
+    return cached_path.stat().st_size
+
+
+def delete_local_entries(cache_dir : str, keys : list[str]):
+    for key in keys:
+        (Path(cache_dir) / f"{key}.csv").unlink(missing_ok=True)
@@ -0,0 +1,179 @@
+import hashlib
+import json
+from datetime import datetime, timezone
+from google.api_core.exceptions import NotFound, PreconditionFailed
+
+# Idea:
+# Every run (date directory) owns one manifest object at gs://{job_bucket}/runs/{directory}/run_manifest.json
+# For each stage it records the fingerprints of the inputs and the committed outputs(path, size, md5, rows)
+# The spark job files are uploaded again by every project init, so they are fingerprinted by content(size, md5) only
+# A stage is skipped only if it is recorded as complete with exactly the same input fingerprints,
+# so the skip check costs a single object read instead of listing the output prefixes.
+# The parallel merge tasks update the same object, so writes use the generation precondition and retry.
+
+RUN_MANIFEST_PATH = "runs/{directory}/run_manifest.json"
+# the join plan the spark merge job of a stage writes(dataproc_merge_two_files.py)
+JOIN_PLAN_PATH = "runs/{directory}/join_plans/{stage}.json"
+MAX_UPDATE_RETRIES = 10
+
+
+def blob_exists(storage_client, bucket_name : str, prefix : str) -> bool:
+    """Check whether any object exists under the prefix with a single one-item listing"""
+    print(f"Check the storage: \nbucketname {bucket_name}\nprefix {prefix}")
+    blobs = storage_client.list_blobs(bucket_name, prefix = prefix, max_results = 1)
+    return any(True for _ in blobs)
+
+
+def fingerprint_blob(storage_client, bucket_name : str, blob_path : str):
+    """Fingerprint a single object from its metadata
+    Returns:
+        Return None if the object does not exist
+        Return a dict with the generation, size and md5 hash otherwise
+    """
+    blob = storage_client.bucket(bucket_name).get_blob(blob_path)
+    if blob is None:
+        return None
+    return {
+        "name" : blob.name,
+        "generation" : blob.generation,
+        "size" : blob.size,
+        "md5_hash" : blob.md5_hash
+    }
+
+
+def fingerprint_content(storage_client, bucket_name : str, blob_path : str):
+    """Fingerprint a single object from its content only, an upload of the same bytes keeps the fingerprint
+    Returns:
+        Return None if the object does not exist
+        Return a dict with the size and md5 hash otherwise
+    """
+    blob_fingerprint = fingerprint_blob(storage_client, bucket_name, blob_path)
+    if blob_fingerprint is None:
+        return None
+    blob_fingerprint.pop("generation")
+    return blob_fingerprint
+
+
+def fingerprint_prefix(storage_client, bucket_name : str, prefix : str):
+    """Fingerprint the objects directly under the prefix(sub directories are not included)
+    Returns:
+        Return None if there is no object under the prefix
+        Return a dict with the number of files, total size and a hash over the names and generations
+    """
+    digest = hashlib.sha256()
+    n_files, n_bytes = 0, 0
+    for blob in storage_client.list_blobs(bucket_name, prefix = f"{prefix}/", delimiter = "/"):
+        digest.update(f"{blob.name}:{blob.generation}\n".encode())
+        n_files += 1
+        n_bytes += blob.size or 0
+    if n_files == 0:
+        return None
+    return {
+        "prefix" : prefix,
+        "n_files" : n_files,
+        "size" : n_bytes,
+        "content_hash" : digest.hexdigest()
+    }
+
+
+def parquet_row_count(storage_client, bucket_name : str, blob_path : str):
+    """Read the row count from the parquet footer, only the footer bytes are fetched
+    Returns:
+        Return None if the footer cannot be read
+    """
+    try:
+        import pyarrow.parquet as pq
+        blob = storage_client.bucket(bucket_name).blob(blob_path)
+        with blob.open("rb") as parquet_file:
+            return pq.ParquetFile(parquet_file).metadata.num_rows
+    except Exception as e:
+        print(f"cannot read the row count of gs://{bucket_name}/{blob_path}: {e}")
+        return None
+
+
+def run_manifest_blob(storage_client, job_bucket_name : str, directory : str):
+    """The blob of the run manifest"""
+    return storage_client.bucket(job_bucket_name).blob(RUN_MANIFEST_PATH.format(directory = directory))
+
+
+def load_run_manifest(storage_client, job_bucket_name : str, directory : str) -> dict:
+    """Load the run manifest, an empty manifest is returned for a new run"""
+    blob = run_manifest_blob(storage_client, job_bucket_name, directory)
+    try:
+        return json.loads(blob.download_as_text())
+    except NotFound:
+        return {"directory" : directory, "stages" : {}}
+
+
+def stage_is_complete(manifest : dict, stage : str, inputs : dict) -> bool:
+    """Whether the stage finished with the same input fingerprints"""
+    stage_record = manifest["stages"].get(stage)
+    if stage_record is None:
+        return False
+    return stage_record.get("status") == "complete" and stage_record.get("inputs") == inputs
+
+
+def record_stage(storage_client, job_bucket_name : str, directory : str,
+                 stage : str, inputs : dict, outputs : list[dict], details : dict = None) -> dict:
+    """Record the completed stage into the run manifest
+    Args:
+        storage_client : the storage client
+        job_bucket_name (str): the bucket that holds the run manifest
+        directory (str): the date directory of the run
+        stage (str): the stage name
+        inputs (dict): the input fingerprints of the stage
+        outputs (list[dict]): the committed output files with name, size, md5_hash and rows
+        details (dict, optional): more fields of the stage record, e.g. the join plan. Defaults to None.
+    Returns:
+        dict: the updated run manifest
+    """
+    stage_record = {
+        "status" : "complete",
+        "inputs" : inputs,
+        "outputs" : outputs,
+        "completed_at" : datetime.now(timezone.utc).isoformat(),
+        **(details or {})
+    }
+    blob = run_manifest_blob(storage_client, job_bucket_name, directory)
+    for _ in range(MAX_UPDATE_RETRIES):
+        try:
+            blob.reload()
+            manifest = json.loads(blob.download_as_text(if_generation_match = blob.generation))
+            generation = blob.generation
+        except NotFound:
+            manifest = {"directory" : directory, "stages" : {}}
+            generation = 0 # the object must not exist yet
+        manifest["stages"][stage] = stage_record
+        try:
+            blob.upload_from_string(json.dumps(manifest), content_type = "application/json",
+                                    if_generation_match = generation)
+            print(f"recorded the stage {stage} in the run manifest")
+            return manifest
+        except PreconditionFailed:
+            print(f"the run manifest changed while recording {stage}, retry")
+    raise RuntimeError(f"cannot record the stage {stage} in the run manifest")
+
+
+def join_plan_attributes(plan : dict) -> dict:
+    """The span attributes of a join plan: the strategy, the input sizes, the hot keys and the seconds of its phases"""
+    return {
+        "join_strategy" : plan["strategy"],
+        "df1_bytes" : plan["df1_bytes"],
+        "df2_bytes" : plan["df2_bytes"],
+        "hot_keys" : len(plan["hot_keys"]),
+        "analysis_seconds" : plan["timings"]["analysis_seconds"],
+        "write_seconds" : plan["timings"]["write_seconds"]
+    }
+
+
+def describe_outputs(storage_client, bucket_name : str, output_manifest : dict) -> list[dict]:
+    """Describe the committed output files of a stage with their row counts"""
+    return [
+        {
+            "name" : file_dict["name"],
+            "size" : file_dict["size"],
+            "md5_hash" : file_dict["md5_hash"],
+            "rows" : parquet_row_count(storage_client, bucket_name, file_dict["name"])
+        }
+        for file_dict in output_manifest["files"]
+    ]
@@ -0,0 +1,157 @@
+import heapq
+import json
+from datetime import date
+import pandas as pd
+
+# Idea:
+# Assigning the subreddits to the VMs(and their reddit clients) by subreddit_idx % n_connections counts ucla
+# the same as ucmerced, so one VM scrapes for hours while the others finish in minutes
+# The scrape time of a subreddit follows its number of posts and comments, estimated in rows per day from
+#   the history table(the (subreddit, date) aggregates every report run merges into it)
+#   the run manifest of the previous run(the rows of the merged meta text of every subreddit in the pipelined DAG)
+# The subreddits are packed onto the connections with the longest-processing-time heuristic:
+# the largest subreddit first, always onto the connection with the least expected rows(makespan <= 4/3 of the optimum)
+# A subreddit without an estimate counts as the median subreddit
+
+DEFAULT_LOOKBACK_DAYS = 30
+# the stage of the merged meta text in the run manifest of a subreddit(merge_{output_directory})
+META_TEXT_STAGE = "merge_meta_text_merge"
+RUN_MANIFEST_PATH = "runs/{directory}/run_manifest.json"
+
+
+def history_volumes(history_df : pd.DataFrame, lookback_days : int = DEFAULT_LOOKBACK_DAYS) -> dict:
+    """The posts and comments per day of every subreddit over the last lookback days of the history
+    Args:
+        history_df (pd.DataFrame): the history with subreddit, date, n_posts and n_comments
+        lookback_days (int, optional): the days before the last history date. Defaults to DEFAULT_LOOKBACK_DAYS.
+    Returns:
+        dict: subreddit -> rows per day
+    """
+    if history_df is None or len(history_df) == 0:
+        return {}
+    dates = pd.to_datetime(history_df["date"])
+    window_df = history_df[dates > dates.max() - pd.Timedelta(days=lookback_days)]
+    rows = (window_df["n_posts"].fillna(0) + window_df["n_comments"].fillna(0)).groupby(window_df["subreddit"]).sum()
+    return {subreddit : float(n_rows) / lookback_days for subreddit, n_rows in rows.items()}
+
+
+def directory_days(directory : str) -> int:
+    """The number of days of a start_date-end_date directory(both dates inclusive)"""
+    start_date, end_date = date.fromisoformat(directory[:10]), date.fromisoformat(directory[-10:])
+    return (end_date - start_date).days + 1
+
+
+def manifest_volumes(storage_client, job_bucket_name : str, previous_directory : str, subreddits : list[str]) -> dict:
+    """The posts and comments per day of every subreddit recorded in the run manifests of the previous pipelined run
+    Args:
+        storage_client : the storage client
+        job_bucket_name (str): the bucket that holds the run manifests
+        previous_directory (str): the date directory of the previous run
+        subreddits (list[str]): the subreddits
+    Returns:
+        dict: subreddit -> rows per day, the subreddits without recorded rows are left out
+    """
+    from google.api_core.exceptions import NotFound
+    bucket = storage_client.bucket(job_bucket_name)
+    n_days = directory_days(previous_directory)
+    volumes = {}
+    for subreddit in subreddits:
+        blob = bucket.blob(RUN_MANIFEST_PATH.format(directory = f"{previous_directory}/{subreddit}"))
+        try:
+            run_manifest = json.loads(blob.download_as_text())
+        except NotFound:
+            continue
+        outputs = run_manifest["stages"].get(META_TEXT_STAGE, {}).get("outputs", [])
+        rows = [output["rows"] for output in outputs if output.get("rows") is not None]
+        if len(rows) > 0:
+            volumes[subreddit] = sum(rows) / n_days
+    return volumes
+
+
+def estimate_volumes(subreddits : list[str], *volume_sources : dict) -> dict:
+    """The expected volume of every subreddit, the first source with an estimate wins
+    Returns:
+        dict: subreddit -> rows per day, the median estimate(1.0 without any) for the unknown subreddits
+    """
+    volumes = {}
+    for subreddit in subreddits:
+        for source in volume_sources:
+            if source.get(subreddit) is not None:
+                volumes[subreddit] = float(source[subreddit])
+                break
+    known = sorted(volumes.values())
+    default_volume = known[len(known) // 2] if len(known) > 0 else 1.0
+    return {subreddit : volumes.get(subreddit, default_volume) for subreddit in subreddits}
+
+
+def lpt_schedule(subreddits : list[str], volumes : dict, n_connections : int) -> dict:
+    """Pack the subreddits onto the connections with the longest-processing-time heuristic
+    Args:
+        subreddits (list[str]): the subreddits
+        volumes (dict): subreddit -> expected volume
+        n_connections (int): the number of VMs(one reddit client per VM)
+    Returns:
+        dict: {"assignments" : subreddit -> connection index, "loads" : expected volume per connection,
+               "volumes" : subreddit -> expected volume}
+    """
+    if n_connections < 1:
+        raise ValueError("there must be at least one connection to schedule the subreddits")
+    # ties are broken by the subreddit order, so the same inputs give the same plan
+    order = sorted(range(len(subreddits)), key = lambda idx : (-volumes[subreddits[idx]], idx))
+    heap = [(0.0, conn_idx) for conn_idx in range(n_connections)]
+    assignments = {}
+    loads = [0.0] * n_connections
+    for idx in order:
+        load, conn_idx = heapq.heappop(heap)
+        assignments[subreddits[idx]] = conn_idx
+        loads[conn_idx] = load + volumes[subreddits[idx]]
+        heapq.heappush(heap, (loads[conn_idx], conn_idx))
+    return {"assignments" : assignments, "loads" : loads, "volumes" : {subreddit : volumes[subreddit] for subreddit in subreddits}}
+
+
+def round_robin_schedule(subreddits : list[str], volumes : dict, n_connections : int) -> dict:
+    """The subreddit_idx % n_connections assignment, in the same format as lpt_schedule"""
+    assignments = {subreddit : idx % n_connections for idx, subreddit in enumerate(subreddits)}
+    loads = [0.0] * n_connections
+    for subreddit, conn_idx in assignments.items():
+        loads[conn_idx] += volumes[subreddit]
+    return {"assignments" : assignments, "loads" : loads, "volumes" : {subreddit : volumes[subreddit] for subreddit in subreddits}}
+
+
+def read_history(config : dict, table_id : str):
+    """Read the history of the report backend(the history of table_id for bigquery), None if it cannot be read"""
+    try:
+        from etl import generate_data_for_report
+        if config["report_backend"] == "duckdb":
+            storage_client = generate_data_for_report.initialize_storage_client(generate_data_for_report.GCP_PATH)
+            return generate_data_for_report.read_gcs_history(storage_client, config["report_bucket"])
+        bigquery_client = generate_data_for_report.initialize_bigquery_client(generate_data_for_report.GCP_PATH)
+        return generate_data_for_report.read_bigquery_history(bigquery_client, config["project_id"],
+                                                              config["bigquery_dataset_id"], table_id)
+    except Exception as e:
+        print(f"cannot read the history, the subreddits are scheduled without it: {e}")
+        return None
+
+
+def read_manifest_volumes(config : dict) -> dict:
+    """The volumes in the run manifests of the previous run, empty without a previous_directory Variable"""
+    if not config.get("previous_directory"):
+        return {}
+    try:
+        from etl.generate_data_for_report import initialize_storage_client, GCP_PATH
+        return manifest_volumes(initialize_storage_client(GCP_PATH), config["spark_bucket"],
+                                config["previous_directory"], config["subreddits"])
+    except Exception as e:
+        print(f"cannot read the run manifests of {config['previous_directory']}: {e}")
+        return {}
+
+
+def scrape_schedule(config : dict, table_id : str) -> dict:
+    """The scrape plan of the pipeline config: the previous run manifests first, then the history
+    Returns:
+        dict: the lpt_schedule of the subreddits onto the ssh connections
+    """
+    volumes = estimate_volumes(config["subreddits"], read_manifest_volumes(config), history_volumes(read_history(config, table_id)))
+    schedule = lpt_schedule(config["subreddits"], volumes, config["n_ssh_connections"])
+    print(f"expected rows per day of every connection: {[round(load, 1) for load in schedule['loads']]}")
+    return schedule
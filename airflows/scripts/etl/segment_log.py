@@ -0,0 +1,140 @@
+import json
+import time
+
+# Idea:
+# Every stage boundary is a whole file(combined.parquet), so a stage waits for the merge of the stage before it.
+# A segment log lets the consumer start on the first rows while the producer is still writing
+#   {prefix}/segments/{offset:08d}.parquet -> append-only numbered segments, the producer claims the next offset with a
+#                                            create-only upload(if_generation_match=0), a taken offset moves on to the next
+#   {prefix}/offsets/{consumer}            -> the committed offset of a consumer, the first segment it has not finished
+#   {prefix}/_CLOSED                       -> written by the producer after its last segment, with the number of segments
+#                                            and the token of the producer
+# A consumer reads the segments in order from its committed offset and commits a segment after processing it,
+# so a restarted consumer continues after the last finished segment(at least once, the consumers are idempotent)
+# A rerun or a retry writes to the same prefix, so
+#   reset  -> the producer deletes the _CLOSED and the offsets of the runs before it when it starts,
+#             the segments stay and the new ones are appended after them
+#   token  -> the producer and its consumers share a token of the run(the plan of the DAG run), a consumer only stops
+#             on a _CLOSED with its token, so the _CLOSED of an earlier run is ignored even before the producer reset it
+# The log works on any client with the google cloud storage bucket/blob calls, the local runner passes the local
+# directory client(etl/local_storage.py)
+# The services copy this file in at build time(Makefile), so it only uses the standard library(the storage
+# exceptions come from the google-cloud-storage of the image)
+
+# the image chunks of a scraper(id, image_url) in the image bucket, outside of the directory the merge reads
+IMAGE_META_STREAM = "streams/{directory}/image_meta"
+SEGMENT_PATH = "{prefix}/segments/{offset:08d}.parquet"
+OFFSET_PATH = "{prefix}/offsets/{consumer}"
+CLOSED_PATH = "{prefix}/_CLOSED"
+POLL_SECONDS = 2.0
+# a consumer gives up when no segment arrived and the log was not closed for this long
+IDLE_TIMEOUT_SECONDS = 3600.0
+# a waiting consumer prints this often, the ssh session of its task fails a silent command(cmd_timeout)
+HEARTBEAT_SECONDS = 60.0
+
+
+class SegmentLog:
+    """An append-only log of numbered parquet segments under a prefix of a bucket"""
+
+    def __init__(self, storage_client, bucket_name : str, prefix : str, token : str = None):
+        self.storage_client = storage_client
+        self.bucket_name = bucket_name
+        self.bucket = storage_client.bucket(bucket_name)
+        self.prefix = prefix.rstrip("/")
+        # the token of the run shared by the producer and its consumers, None trusts any _CLOSED
+        self.token = token
+        self.next_offset = None
+
+    def segment_blob(self, offset : int):
+        return self.bucket.blob(SEGMENT_PATH.format(prefix = self.prefix, offset = offset))
+
+    def end_offset(self) -> int:
+        """The offset after the last written segment"""
+        offset = 0
+        while self.segment_blob(offset).exists():
+            offset += 1
+        return offset
+
+    def reset(self):
+        """Start a new run of the producer: delete the _CLOSED and the committed offsets of the runs before it"""
+        from google.api_core.exceptions import NotFound
+        stale_blobs = list(self.storage_client.list_blobs(self.bucket_name, prefix = OFFSET_PATH.format(prefix = self.prefix, consumer = "")))
+        stale_blobs.append(self.bucket.blob(CLOSED_PATH.format(prefix = self.prefix)))
+        for blob in stale_blobs:
+            try:
+                blob.delete()
+            except NotFound:
+                pass
+        self.next_offset = None
+
+    def append(self, local_path : str) -> int:
+        """Upload a local parquet file as the next segment
+        Returns:
+            int: the offset of the segment
+        """
+        from google.api_core.exceptions import PreconditionFailed
+        if self.next_offset is None:
+            self.next_offset = self.end_offset()
+        while True:
+            try:
+                self.segment_blob(self.next_offset).upload_from_filename(local_path, if_generation_match = 0)
+                break
+            except PreconditionFailed:
+                self.next_offset += 1
+        self.next_offset += 1
+        return self.next_offset - 1
+
+    def close(self):
+        """Mark the end of the log, the consumers stop after the last segment"""
+        n_segments = self.next_offset if self.next_offset is not None else self.end_offset()
+        self.bucket.blob(CLOSED_PATH.format(prefix = self.prefix)).upload_from_string(
+            json.dumps({"segments" : n_segments, "token" : self.token}), content_type = "application/json")
+
+    def closed_segments(self):
+        """The number of segments of a closed log, None while the producer is still appending(or the log was closed by another run)"""
+        from google.api_core.exceptions import NotFound
+        try:
+            closed = json.loads(self.bucket.blob(CLOSED_PATH.format(prefix = self.prefix)).download_as_text())
+        except NotFound:
+            return None
+        if self.token is not None and closed.get("token") != self.token:
+            return None
+        return closed["segments"]
+
+    def committed(self, consumer : str) -> int:
+        """The first offset the consumer has not finished, 0 for a new consumer"""
+        from google.api_core.exceptions import NotFound
+        try:
+            return int(self.bucket.blob(OFFSET_PATH.format(prefix = self.prefix, consumer = consumer)).download_as_text())
+        except NotFound:
+            return 0
+
+    def commit(self, consumer : str, offset : int):
+        self.bucket.blob(OFFSET_PATH.format(prefix = self.prefix, consumer = consumer)).upload_from_string(str(offset))
+
+    def consume(self, consumer : str, poll_seconds : float = POLL_SECONDS, idle_timeout_seconds : float = IDLE_TIMEOUT_SECONDS):
+        """Yield (offset, segment blob) from the committed offset of the consumer until the log is closed
+        A segment is committed when the caller asks for the next one, so a failure while processing it replays it
+        Raises:
+            TimeoutError: no segment and no close for idle_timeout_seconds
+        """
+        offset = self.committed(consumer)
+        idle_since = last_heartbeat = time.time()
+        while True:
+            blob = self.segment_blob(offset)
+            if blob.exists():
+                yield offset, blob
+                offset += 1
+                self.commit(consumer, offset)
+                idle_since = time.time()
+                continue
+            n_segments = self.closed_segments()
+            # the producer closes the log after its last segment, so a closed log has every segment written
+            if n_segments is not None and offset >= n_segments:
+                return
+            if time.time() - idle_since > idle_timeout_seconds:
+                raise TimeoutError(f"no segment {offset} of {self.prefix} for {idle_timeout_seconds}s")
+            if time.time() - last_heartbeat >= HEARTBEAT_SECONDS:
+                print(f"waiting for segment {offset} of {self.prefix} for {time.time() - idle_since:.0f}s", flush=True)
+                last_heartbeat = time.time()
+            time.sleep(poll_seconds)
@@ -0,0 +1,156 @@
+import base64
+import hashlib
+import json
+import math
+import pandas as pd
+
+# Idea:
+# Mergeable sketches of the authors for every (subreddit, date) partition of the rollup
+#   HyperLogLog   -> distinct authors, bytearray of 2^p registers, merged with the register-wise max
+#   Space-Saving  -> top authors by interactions, {author : [count, error]} with at most k counters
+#                    count is an upper bound of the true count, count - error a lower bound
+# The sketches of a partition are stored as one row of the sketch store(a parquet file next to the history)
+# A multi-window answer merges the sketches of the partitions in the window instead of rescanning the rows
+
+HLL_PRECISION = 12
+SPACE_SAVING_COUNTERS = 100
+SKETCH_STORE_COLUMNS = ["subreddit", "date", "authors_hll", "top_authors"]
+
+
+def hll_new(precision : int = HLL_PRECISION) -> bytearray:
+    """An empty HyperLogLog sketch"""
+    return bytearray(1 << precision)
+
+
+def hll_add(registers : bytearray, value : str):
+    """Add a value to the HyperLogLog sketch"""
+    precision = int(math.log2(len(registers)))
+    hashed = int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+    idx = hashed >> (64 - precision)
+    remaining = hashed & ((1 << (64 - precision)) - 1)
+    # the position of the leftmost 1 bit in the remaining 64 - p bits
+    rank = (64 - precision) - remaining.bit_length() + 1
+    if rank > registers[idx]:
+        registers[idx] = rank
+
+
+def hll_merge(registers1 : bytearray, registers2 : bytearray) -> bytearray:
+    """Merge two HyperLogLog sketches of the same precision"""
+    if len(registers1) != len(registers2):
+        raise ValueError("the HyperLogLog sketches have different precisions")
+    return bytearray(max(x, y) for x, y in zip(registers1, registers2))
+
+
+def hll_estimate(registers : bytearray) -> float:
+    """Estimate the number of distinct values"""
+    n_registers = len(registers)
+    alpha = 0.7213 / (1 + 1.079 / n_registers)
+    estimate = alpha * n_registers ** 2 / sum(2.0 ** -register for register in registers)
+    n_zeros = registers.count(0)
+    # linear counting is more accurate for the small cardinalities
+    if estimate <= 2.5 * n_registers and n_zeros > 0:
+        return n_registers * math.log(n_registers / n_zeros)
+    return estimate
+
+
+def hll_relative_error(precision : int = HLL_PRECISION) -> float:
+    """The standard error of the HyperLogLog estimate"""
+    return 1.04 / math.sqrt(1 << precision)
+
+
+def space_saving_add(counters : dict, item : str, weight : int = 1, k : int = SPACE_SAVING_COUNTERS):
+    """Add the weight of the item to the Space-Saving summary"""
+    if item in counters:
+        counters[item][0] += weight
+    elif len(counters) < k:
+        counters[item] = [weight, 0]
+    else:
+        # the new item takes over the smallest counter, its old count becomes the error
+        min_item = min(counters, key=lambda x: counters[x][0])
+        min_count = counters.pop(min_item)[0]
+        counters[item] = [min_count + weight, min_count]
+
+
+def space_saving_merge(counters1 : dict, counters2 : dict, k : int = SPACE_SAVING_COUNTERS) -> dict:
+    """Merge two Space-Saving summaries
+    An item missing from a full summary may have up to its smallest count there, it is added as count and error
+    """
+    min1 = min((count for count, _ in counters1.values()), default=0) if len(counters1) >= k else 0
+    min2 = min((count for count, _ in counters2.values()), default=0) if len(counters2) >= k else 0
+    merged = {}
+    for item in counters1.keys() | counters2.keys():
+        count1, error1 = counters1.get(item, (min1, min1))
+        count2, error2 = counters2.get(item, (min2, min2))
+        merged[item] = [count1 + count2, error1 + error2]
+    top_items = sorted(merged, key=lambda x: (-merged[x][0], x))[:k]
+    return {item : merged[item] for item in top_items}
+
+
+def space_saving_top(counters : dict, n : int) -> list:
+    """The n items with the largest counts as [item, count, error]"""
+    return [[item, counters[item][0], counters[item][1]] for item in sorted(counters, key=lambda x: (-counters[x][0], x))[:n]]
+
+
+def serialize_hll(registers : bytearray) -> str:
+    return base64.b64encode(bytes(registers)).decode()
+
+
+def deserialize_hll(serialized : str) -> bytearray:
+    return bytearray(base64.b64decode(serialized))
+
+
+def partition_sketches(rollup_df : pd.DataFrame, k : int = SPACE_SAVING_COUNTERS) -> pd.DataFrame:
+    """Build the sketches of every (subreddit, date) partition from the rollup rows
+    Args:
+        rollup_df (pd.DataFrame): the rollup with subreddit, create_date, authorname, post_rows and comment_rows
+    Returns:
+        pd.DataFrame: a row of the sketch store per partition
+    """
+    rows = []
+    rollup_df = rollup_df[rollup_df["authorname"].notna()]
+    for (subreddit, create_date), partition_df in rollup_df.groupby(["subreddit", "create_date"]):
+        registers, counters = hll_new(), {}
+        for authorname, interactions in zip(partition_df["authorname"], partition_df["post_rows"] + partition_df["comment_rows"]):
+            hll_add(registers, authorname)
+            space_saving_add(counters, authorname, int(interactions), k)
+        rows.append({
+            "subreddit" : subreddit,
+            "date" : pd.Timestamp(create_date).date(),
+            "authors_hll" : serialize_hll(registers),
+            "top_authors" : json.dumps(counters)
+        })
+    return pd.DataFrame(rows, columns=SKETCH_STORE_COLUMNS)
+
+
+def merge_sketch_store(store_df, new_df : pd.DataFrame) -> pd.DataFrame:
+    """Replace the partitions of the store with the new sketches of the same partitions"""
+    if store_df is None or len(store_df) == 0:
+        return new_df.sort_values(["subreddit", "date"]).reset_index(drop=True)
+    store_df = store_df.copy()
+    store_df["date"] = pd.to_datetime(store_df["date"]).dt.date
+    new_keys = set(zip(new_df["subreddit"], new_df["date"]))
+    kept_df = store_df[[key not in new_keys for key in zip(store_df["subreddit"], store_df["date"])]]
+    return pd.concat([kept_df, new_df], ignore_index=True).sort_values(["subreddit", "date"]).reset_index(drop=True)
+
+
+def window_author_summary(store_df : pd.DataFrame, windows : list[int], n_top : int = 10, k : int = SPACE_SAVING_COUNTERS) -> dict:
+    """Merge the sketches of the last `window` days for every window
+    Returns:
+        dict: window -> {distinct_authors, relative_error, top_authors : [[author, count, error]]}
+    """
+    store_df = store_df.copy()
+    store_df["date"] = pd.to_datetime(store_df["date"])
+    end_date = store_df["date"].max()
+    summary = {}
+    for window in windows:
+        window_df = store_df[store_df["date"] > end_date - pd.Timedelta(days=window)]
+        registers, counters = hll_new(), {}
+        for authors_hll, top_authors in zip(window_df["authors_hll"], window_df["top_authors"]):
+            registers = hll_merge(registers, deserialize_hll(authors_hll))
+            counters = space_saving_merge(counters, json.loads(top_authors), k)
+        summary[str(window)] = {
+            "distinct_authors" : round(hll_estimate(registers)),
+            "relative_error" : hll_relative_error(int(math.log2(len(registers)))),
+            "top_authors" : space_saving_top(counters, n_top)
+        }
+    return summary
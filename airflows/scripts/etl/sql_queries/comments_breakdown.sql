@@ -1,5 +1,5 @@
 SELECT 
-  distinct subreddit, create_date as `date`, count(distinct id) as n_comments
-FROM `project_id.dataset_id.table_id`
-WHERE parent is null
-group by subreddit, create_date
\ No newline at end of file
+  subreddit, create_date as `date`, SUM(n_posts) as n_comments
+FROM `project_id.dataset_id.table_id_rollup`
+group by subreddit, create_date
+having SUM(n_posts) > 0
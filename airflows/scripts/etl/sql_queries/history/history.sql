@@ -0,0 +1,29 @@
+CREATE TABLE IF NOT EXISTS `project_id.dataset_id.table_id_history` (
+  subreddit STRING,
+  `date` DATE,
+  n_posts INT64,
+  n_comments INT64,
+  sentiment_sum INT64,
+  sentiment_count INT64
+)
+PARTITION BY `date`
+CLUSTER BY subreddit;
+
+MERGE INTO `project_id.dataset_id.table_id_history` AS h
+USING (
+  SELECT
+    subreddit,
+    create_date as `date`,
+    SUM(n_comments) as n_posts,
+    SUM(n_posts) as n_comments,
+    SUM(sentiment_sum) as sentiment_sum,
+    SUM(sentiment_count) as sentiment_count
+  FROM `project_id.dataset_id.table_id_rollup`
+  GROUP BY subreddit, create_date
+) AS r
+ON h.subreddit = r.subreddit AND h.`date` = r.`date`
+WHEN MATCHED THEN
+  UPDATE SET n_posts = r.n_posts, n_comments = r.n_comments, sentiment_sum = r.sentiment_sum, sentiment_count = r.sentiment_count
+WHEN NOT MATCHED THEN
+  INSERT (subreddit, `date`, n_posts, n_comments, sentiment_sum, sentiment_count)
+  VALUES (r.subreddit, r.`date`, r.n_posts, r.n_comments, r.sentiment_sum, r.sentiment_count)
@@ -1,5 +1,5 @@
 SELECT 
-  subreddit, create_date as `date`, count(distinct id) as n_posts
-FROM `project_id.dataset_id.table_id`
-WHERE parent is not null
-group by subreddit, create_date
\ No newline at end of file
+  subreddit, create_date as `date`, SUM(n_comments) as n_posts
+FROM `project_id.dataset_id.table_id_rollup`
+group by subreddit, create_date
+having SUM(n_comments) > 0
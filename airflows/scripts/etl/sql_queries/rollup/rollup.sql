@@ -0,0 +1,14 @@
+SELECT
+  subreddit,
+  create_date,
+  authorname,
+  MAX(author_url) as author_url,
+  COUNT(DISTINCT CASE WHEN parent is null THEN id END) as n_posts,
+  COUNT(DISTINCT CASE WHEN parent is not null THEN id END) as n_comments,
+  SUM(CASE WHEN parent is null THEN 1 ELSE 0 END) as post_rows,
+  SUM(CASE WHEN parent is null THEN 0 ELSE 1 END) as comment_rows,
+  SUM(sentiment) as sentiment_sum,
+  COUNT(sentiment) as sentiment_count
+FROM `project_id.dataset_id.table_id`
+WHERE create_date BETWEEN DATE("start_date") AND DATE("end_date")
+GROUP BY subreddit, create_date, authorname
@@ -1,3 +1,3 @@
-SELECT distinct subreddit, create_date as date, ROUND(avg(sentiment), 2) * 10 as `Mean Sentiment Score`
-FROM `project_id.dataset_id.table_id`
-GROUP BY subreddit, create_date
\ No newline at end of file
+SELECT subreddit, create_date as date, ROUND(SUM(sentiment_sum) / NULLIF(SUM(sentiment_count), 0), 2) * 10 as `Mean Sentiment Score`
+FROM `project_id.dataset_id.table_id_rollup`
+GROUP BY subreddit, create_date
@@ -0,0 +1,11 @@
+SELECT
+  subreddit,
+  create_date,
+  url,
+  MAX(score) as score
+FROM `project_id.dataset_id.table_id`
+WHERE parent is null
+  AND create_date BETWEEN DATE("start_date") AND DATE("end_date")
+GROUP BY subreddit, create_date, url
+ORDER BY score DESC
+LIMIT 100
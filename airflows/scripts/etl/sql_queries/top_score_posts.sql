@@ -19,6 +19,8 @@ FROM (SELECT
   score
 FROM `project_id.dataset_id.table_id`
 WHERE parent is null
+  AND create_date BETWEEN DATE("start_date") AND DATE("end_date")
+  AND top_k_filter
 order by score DESC
 limit 100) as t1
 GROUP BY t1.`Post URL`
@@ -0,0 +1,55 @@
+import json
+
+# Idea:
+# Register the ssh connections of every VM and the GPU in the airflow metadata db in one transaction
+#   one query  -> the existing connections of all the conn ids(Connection.conn_id IN ...)
+#   upsert     -> add the missing ones, update the host/extra of the ones whose VM moved, keep the rest
+#   one commit -> create_session commits when the block ends(and rolls back on an error), then closes the session
+# Running it again with the same config changes nothing, so the task can be retried
+# The ids are chunked so hundreds of VMs stay below the bound parameter limit of sqlite
+
+SSH_LOGIN = "airflow"
+SSH_PORT = 22
+QUERY_CHUNK_SIZE = 500
+
+
+def ssh_extra(config : dict) -> str:
+    """The extra of every ssh connection, from the Variables read once by load_pipeline_config"""
+    return json.dumps({"key_file": config["ssh_private_key_path"], "pulic_key" : config["ssh_public_key"], "port": SSH_PORT})
+
+
+def register_ssh_connections(hosts : dict, extra : str, session = None) -> dict:
+    """Upsert the ssh connections
+    Args:
+        hosts (dict): conn_id -> the host of the connection
+        extra (str): the json extra of every connection
+        session (optional): the metadata db session. Defaults to a new session committed and closed here.
+    Returns:
+        dict: the conn ids added, updated and unchanged
+    """
+    from airflow.models import Connection
+    if session is None:
+        from airflow.utils.session import create_session
+        with create_session() as session:
+            return register_ssh_connections(hosts, extra, session)
+    conn_ids = list(hosts)
+    existing = {}
+    for start in range(0, len(conn_ids), QUERY_CHUNK_SIZE):
+        chunk = conn_ids[start:start + QUERY_CHUNK_SIZE]
+        existing.update({conn.conn_id : conn for conn in session.query(Connection).filter(Connection.conn_id.in_(chunk))})
+    result = {"added" : [], "updated" : [], "unchanged" : []}
+    for conn_id, host in hosts.items():
+        conn = existing.get(conn_id)
+        if conn is None:
+            session.add(Connection(conn_id = conn_id, conn_type = "SSH", host = host, login = SSH_LOGIN, extra = extra))
+            result["added"].append(conn_id)
+        elif conn.host != host or conn.extra != extra:
+            conn.host = host
+            conn.set_extra(extra)
+            result["updated"].append(conn_id)
+        else:
+            result["unchanged"].append(conn_id)
+    session.flush()
+    print(f"ssh connections: {len(result['added'])} added, {len(result['updated'])} updated, "
+          f"{len(result['unchanged'])} unchanged")
+    return result
@@ -0,0 +1,153 @@
+import argparse
+from pathlib import Path
+
+from etl.tracing import read_spans, trace_export_uri, GCP_PATH
+
+# Idea:
+# Turn the spans of one DAG run into the stage breakdown and the latest-finisher chain
+#   stage breakdown -> the spans of every stage(the root spans by name): count, total and slowest duration, rows, bytes
+#   latest-finisher -> start from the root span that ends last, step back to the root span that ended last before it started,
+#   chain              the gap between the two is the wait(scheduling, a task slot, the sensor interval)
+#                      the spans carry no dependencies, so the chain is an estimate of the critical path: a span that
+#                      overlaps the current one by more than the clock skew ran beside it and is never its predecessor
+#   stage overlap   -> the seconds two stages of the same subreddit ran at the same time(a streaming handoff,
+#                      etl/segment_log.py), the stages that only start after the stage before them overlap 0s
+#   join plans      -> the strategy, input sizes, hot keys and phase seconds of every merge(dataproc_merge_two_files.py)
+# The slowest subreddit of a stage is on the chain, so the stage with the longest chain share is the one to scale
+# The spans are read from gs://{spark_bucket}/runs/{directory}/traces or a local .jsonl file/directory
+
+# two spans closer than this are treated as back to back
+CLOCK_SKEW_SECONDS = 1.0
+# the skew tolerance is at most this share of the shorter span, short spans that overlap are concurrent
+CLOCK_SKEW_SPAN_FRACTION = 0.1
+
+
+def read_trace_lines(source : str, gcp_path : str = GCP_PATH) -> list[str]:
+    """The json lines of every span file under a gs:// prefix, a local directory or a local file"""
+    if source.startswith("gs://"):
+        from google.cloud import storage
+        bucket_name, _, prefix = source[len("gs://"):].partition("/")
+        storage_client = storage.Client.from_service_account_json(gcp_path) if Path(gcp_path).exists() else storage.Client()
+        lines = []
+        for blob in storage_client.list_blobs(bucket_name, prefix = prefix.rstrip("/") + "/"):
+            if blob.name.endswith(".jsonl"):
+                lines.extend(blob.download_as_text().splitlines())
+        return lines
+    paths = sorted(Path(source).glob("*.jsonl")) if Path(source).is_dir() else [Path(source)]
+    return [line for path in paths for line in path.read_text().splitlines()]
+
+
+def stage_breakdown(spans : list[dict]) -> list[dict]:
+    """The duration, rows and bytes of every stage, the slowest stage first"""
+    stages = {}
+    for span_dict in spans:
+        if span_dict["parent_span_id"]:
+            continue
+        stage = stages.setdefault(span_dict["name"], {"stage" : span_dict["name"], "spans" : 0, "total_seconds" : 0.0,
+                                                      "max_seconds" : 0.0, "rows_out" : 0, "bytes_out" : 0, "errors" : 0})
+        stage["spans"] += 1
+        stage["total_seconds"] += span_dict["duration"]
+        stage["max_seconds"] = max(stage["max_seconds"], span_dict["duration"])
+        stage["rows_out"] += span_dict.get("rows_out", 0)
+        stage["bytes_out"] += span_dict.get("bytes_out", 0)
+        stage["errors"] += span_dict["error"] is not None
+    return sorted(stages.values(), key = lambda stage : -stage["max_seconds"])
+
+
+def skew_tolerance(first : dict, second : dict, clock_skew_seconds : float = CLOCK_SKEW_SECONDS) -> float:
+    """The seconds the end of first may pass the start of second and still be back to back"""
+    return min(clock_skew_seconds, CLOCK_SKEW_SPAN_FRACTION * min(first["duration"], second["duration"]))
+
+
+def latest_finisher_chain(spans : list[dict], clock_skew_seconds : float = CLOCK_SKEW_SECONDS) -> list[dict]:
+    """The chain of root spans from the last one to end back through the latest finisher before each, in execution order
+    Returns:
+        list[dict]: the spans on the chain, each with the wait_seconds before it started
+    """
+    roots = sorted((span_dict for span_dict in spans if not span_dict["parent_span_id"]), key = lambda span_dict : span_dict["end"])
+    if len(roots) == 0:
+        return []
+    chain = [dict(roots[-1])]
+    while True:
+        current = chain[-1]
+        predecessors = [span_dict for span_dict in roots
+                        if span_dict["end"] <= current["start"] + skew_tolerance(span_dict, current, clock_skew_seconds)
+                        and span_dict["span_id"] != current["span_id"] and span_dict["start"] < current["start"]]
+        if len(predecessors) == 0:
+            current["wait_seconds"] = 0.0
+            break
+        predecessor = max(predecessors, key = lambda span_dict : span_dict["end"])
+        current["wait_seconds"] = max(current["start"] - predecessor["end"], 0.0)
+        chain.append(dict(predecessor))
+    return chain[::-1]
+
+
+def subreddit_key(span_dict : dict):
+    """The subreddit of a span, the containers of the pipelined DAG only know its directory({directory}/{subreddit})"""
+    return span_dict.get("directory") or span_dict.get("subreddit")
+
+
+def stage_overlaps(spans : list[dict]) -> list[dict]:
+    """The overlap of every pair of root spans of the same subreddit that ran at the same time
+    Returns:
+        list[dict]: {"stages", "pairs", "overlap_seconds", "first_seconds"} per pair of stages, the largest overlap first,
+                    first_seconds is the sum of the durations of the stage that started first
+    """
+    roots = sorted((span_dict for span_dict in spans if not span_dict["parent_span_id"]), key = lambda span_dict : span_dict["start"])
+    overlaps = {}
+    for idx, first in enumerate(roots):
+        for second in roots[idx + 1:]:
+            if second["start"] >= first["end"]:
+                continue
+            if subreddit_key(first) != subreddit_key(second) or first["name"] == second["name"]:
+                continue
+            pair = overlaps.setdefault((first["name"], second["name"]), {"stages" : f"{first['name']} | {second['name']}",
+                                                                          "pairs" : 0, "overlap_seconds" : 0.0, "first_seconds" : 0.0})
+            pair["pairs"] += 1
+            pair["overlap_seconds"] += min(first["end"], second["end"]) - second["start"]
+            pair["first_seconds"] += first["duration"]
+    return sorted(overlaps.values(), key = lambda pair : -pair["overlap_seconds"])
+
+
+def print_summary(spans : list[dict]):
+    chain = latest_finisher_chain(spans)
+    if len(chain) == 0:
+        print("no spans")
+        return
+    run_seconds = chain[-1]["end"] - chain[0]["start"]
+    print(f"{len(spans)} spans, the latest-finisher chain takes {run_seconds:.1f}s")
+    print(f"\n{'stage':<32}{'spans':>7}{'total s':>10}{'max s':>10}{'rows out':>11}{'MB out':>9}{'errors':>8}")
+    for stage in stage_breakdown(spans):
+        print(f"{stage['stage']:<32}{stage['spans']:>7}{stage['total_seconds']:>10.1f}{stage['max_seconds']:>10.1f}"
+              f"{stage['rows_out']:>11}{stage['bytes_out'] / 2**20:>9.1f}{stage['errors']:>8}")
+    # the independent stages of a subreddit overlap by a little when they start together
+    overlaps = [pair for pair in stage_overlaps(spans) if pair["overlap_seconds"] >= CLOCK_SKEW_SECONDS]
+    if len(overlaps) > 0:
+        print(f"\n{'overlapping stages':<56}{'pairs':>7}{'overlap s':>11}{'of first':>10}")
+        for pair in overlaps:
+            share = pair["overlap_seconds"] / pair["first_seconds"] if pair["first_seconds"] > 0 else 0.0
+            print(f"{pair['stages']:<56}{pair['pairs']:>7}{pair['overlap_seconds']:>11.1f}{share:>10.1%}")
+    join_spans = [span_dict for span_dict in spans if "join_strategy" in span_dict]
+    if len(join_spans) > 0:
+        print(f"\n{'join plan':<32}{'subreddit':<18}{'strategy':>10}{'df1 MB':>9}{'df2 MB':>9}{'hot keys':>10}"
+              f"{'analysis s':>12}{'write s':>9}")
+        for span_dict in join_spans:
+            print(f"{span_dict['name']:<32}{str(subreddit_key(span_dict) or ''):<18}{span_dict['join_strategy']:>10}"
+                  f"{span_dict['df1_bytes'] / 2**20:>9.1f}{span_dict['df2_bytes'] / 2**20:>9.1f}{span_dict['hot_keys']:>10}"
+                  f"{span_dict['analysis_seconds']:>12.1f}{span_dict['write_seconds']:>9.1f}")
+    print(f"\n{'latest-finisher chain':<32}{'subreddit':<18}{'wait s':>9}{'run s':>9}{'share':>8}")
+    for span_dict in chain:
+        share = (span_dict["duration"] + span_dict["wait_seconds"]) / run_seconds if run_seconds > 0 else 0.0
+        print(f"{span_dict['name']:<32}{str(span_dict.get('subreddit', '')):<18}{span_dict['wait_seconds']:>9.1f}"
+              f"{span_dict['duration']:>9.1f}{share:>8.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("summarize the spans of a DAG run into the stage breakdown and the latest-finisher chain")
+    parser.add_argument("--source", type=str, default=None, help="a gs:// prefix, a local directory or a local .jsonl file")
+    parser.add_argument("--spark_bucket", type=str, default=None, help="the job bucket of the run, used with --directory")
+    parser.add_argument("--directory", type=str, default=None, help="the date directory of the run")
+    parser.add_argument("--gcp_key_path", type=str, default=GCP_PATH, help="the service account json path")
+    args = parser.parse_args()
+    source = args.source or trace_export_uri(args.spark_bucket, args.directory)
+    print_summary(read_spans(read_trace_lines(source, args.gcp_key_path)))
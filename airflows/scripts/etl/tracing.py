@@ -0,0 +1,222 @@
+import contextvars
+import hashlib
+import json
+import os
+import secrets
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+# Idea:
+# Every stage(the scrapers, the captioner, the sentiment analysis, the spark submitters, the report generation)
+# records spans: stage, subreddit, rows in/out, bytes in/out and the duration
+# A span is written as one json line with the field names of the OpenTelemetry OTLP/JSON span
+#   traceId(the run), spanId, parentSpanId, name, startTimeUnixNano, endTimeUnixNano, attributes, status
+# so the files can be loaded into an OpenTelemetry backend, or summarized by etl/trace_summary.py
+# The export target comes from the environment, the DAG passes it to the docker containers with `-e`
+#   PIPELINE_TRACE_EXPORT : a local .jsonl path, or gs://bucket/prefix(one object per root span)
+#   PIPELINE_TRACE_RUN    : the run the spans belong to(the date directory), hashed into the traceId
+# Without an export target the spans are timed but not written
+# The services copy this file in at build time(Makefile), so it only uses the standard library
+# and runs on the python 3.8 of the cuda images
+
+TRACE_EXPORT_ENV = "PIPELINE_TRACE_EXPORT"
+TRACE_RUN_ENV = "PIPELINE_TRACE_RUN"
+# the spans of a run in the job bucket
+TRACES_PREFIX = "runs/{directory}/traces"
+GCP_PATH = "./gcp_key.json"
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_state = {"export" : None, "trace_id" : None, "storage_client" : None}
+
+
+def trace_id_of(run : str) -> str:
+    """The 16 byte OTLP trace id of a run"""
+    return hashlib.sha256(run.encode()).hexdigest()[:32]
+
+
+def trace_export_uri(spark_bucket : str, directory : str) -> str:
+    """The gs:// export target of the spans of a run"""
+    return f"gs://{spark_bucket}/{TRACES_PREFIX.format(directory = directory)}"
+
+
+def docker_env(spark_bucket : str, directory : str) -> str:
+    """The `docker run` options that export the spans of a container into the run"""
+    return f"-e {TRACE_EXPORT_ENV}={trace_export_uri(spark_bucket, directory)} -e {TRACE_RUN_ENV}={directory}"
+
+
+def configure(export : str = None, run : str = None, storage_client = None):
+    """Set the export target and the run of the spans, the environment variables fill the missing values
+    Args:
+        export (str, optional): a local .jsonl path or gs://bucket/prefix. Defaults to PIPELINE_TRACE_EXPORT.
+        run (str, optional): the run of the spans. Defaults to PIPELINE_TRACE_RUN.
+        storage_client (optional): the storage client of the gs:// export
+    """
+    _state["export"] = export or os.environ.get(TRACE_EXPORT_ENV) or None
+    run = run or os.environ.get(TRACE_RUN_ENV)
+    _state["trace_id"] = trace_id_of(run) if run else secrets.token_hex(16)
+    _state["storage_client"] = storage_client
+
+
+def otlp_value(value) -> dict:
+    """The OTLP/JSON AnyValue of a python value"""
+    if isinstance(value, bool):
+        return {"boolValue" : value}
+    if isinstance(value, int):
+        return {"intValue" : str(value)}
+    if isinstance(value, float):
+        return {"doubleValue" : value}
+    return {"stringValue" : str(value)}
+
+
+def python_value(otlp : dict):
+    """The python value of an OTLP/JSON AnyValue"""
+    if "intValue" in otlp:
+        return int(otlp["intValue"])
+    return next(iter(otlp.values()))
+
+
+class Span:
+    """A timed unit of work with its attributes"""
+
+    def __init__(self, name : str, parent = None, attributes : dict = None, start_ns : int = None):
+        if _state["trace_id"] is None:
+            configure()
+        self.name = name
+        self.trace_id = _state["trace_id"]
+        self.span_id = secrets.token_hex(8)
+        self.parent = parent
+        self.attributes = dict(attributes or {})
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns = None
+        self.children = []
+        self.error = None
+
+    def set(self, **attributes):
+        """Set the attributes, None values are ignored"""
+        self.attributes.update({key : value for key, value in attributes.items() if value is not None})
+
+    def add(self, **counters):
+        """Add to the counter attributes(rows_out, bytes_out, ...)"""
+        for key, value in counters.items():
+            self.attributes[key] = self.attributes.get(key, 0) + value
+
+    def to_otlp(self) -> dict:
+        return {
+            "traceId" : self.trace_id,
+            "spanId" : self.span_id,
+            "parentSpanId" : self.parent.span_id if self.parent is not None else "",
+            "name" : self.name,
+            "kind" : "SPAN_KIND_INTERNAL",
+            "startTimeUnixNano" : str(self.start_ns),
+            "endTimeUnixNano" : str(self.end_ns),
+            "attributes" : [{"key" : key, "value" : otlp_value(value)} for key, value in self.attributes.items()],
+            "status" : {"code" : "STATUS_CODE_ERROR", "message" : self.error} if self.error else {"code" : "STATUS_CODE_OK"}
+        }
+
+
+def current_span():
+    """The innermost open span, a detached span outside of any span so the callers never check for None"""
+    span_obj = _current_span.get()
+    return span_obj if span_obj is not None else Span("detached")
+
+
+@contextmanager
+def span(name : str, **attributes):
+    """Time the block as a span, the child of the current span
+    The spans of a root span are exported together when it ends
+    """
+    parent = _current_span.get()
+    span_obj = Span(name, parent, {key : value for key, value in attributes.items() if value is not None})
+    token = _current_span.set(span_obj)
+    try:
+        yield span_obj
+    except BaseException as e:
+        span_obj.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        finish(span_obj)
+
+
+def record_span(name : str, start_seconds : float, end_seconds : float, **attributes) -> Span:
+    """Record a span that was timed elsewhere(a bigquery job, a report query) as a child of the current span"""
+    span_obj = Span(name, _current_span.get(), attributes, start_ns = int(start_seconds * 1e9))
+    finish(span_obj, int(end_seconds * 1e9))
+    return span_obj
+
+
+def finish(span_obj : Span, end_ns : int = None):
+    span_obj.end_ns = end_ns or time.time_ns()
+    if span_obj.parent is not None:
+        span_obj.parent.children.append(span_obj)
+        return
+    duration = (span_obj.end_ns - span_obj.start_ns) / 1e9
+    print(f"span {span_obj.name} finished in {duration:.2f}s {span_obj.attributes}")
+    export(span_obj)
+
+
+def flatten(span_obj : Span) -> list:
+    """The span and all its descendants"""
+    spans = [span_obj]
+    for child in span_obj.children:
+        spans.extend(flatten(child))
+    return spans
+
+
+def to_json_lines(root : Span) -> str:
+    return "".join(json.dumps(span_obj.to_otlp()) + "\n" for span_obj in flatten(root))
+
+
+def export(root : Span):
+    """Write the spans of the root span to the export target, tracing never fails the stage"""
+    target = _state["export"]
+    if target is None:
+        return
+    try:
+        if target.startswith("gs://"):
+            bucket_name, _, prefix = target[len("gs://"):].partition("/")
+            blob_path = f"{prefix.rstrip('/')}/{root.name}-{root.span_id}.jsonl".lstrip("/")
+            gcs_client().bucket(bucket_name).blob(blob_path).upload_from_string(
+                to_json_lines(root), content_type = "application/x-ndjson")
+        else:
+            Path(target).parent.mkdir(parents = True, exist_ok = True)
+            with open(target, "a") as f:
+                f.write(to_json_lines(root))
+    except Exception as e:
+        print(f"cannot export the spans of {root.name} to {target}: {e}")
+
+
+def gcs_client():
+    if _state["storage_client"] is None:
+        from google.cloud import storage
+        if Path(GCP_PATH).exists():
+            _state["storage_client"] = storage.Client.from_service_account_json(GCP_PATH)
+        else:
+            _state["storage_client"] = storage.Client()
+    return _state["storage_client"]
+
+
+def read_spans(lines) -> list:
+    """Decode the json lines of the exported spans into flat dicts
+    Returns:
+        list[dict]: name, span_id, parent_span_id, start, end(seconds), duration, error and the attributes
+    """
+    spans = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        otlp = json.loads(line)
+        span_dict = {
+            "name" : otlp["name"],
+            "span_id" : otlp["spanId"],
+            "parent_span_id" : otlp["parentSpanId"],
+            "start" : int(otlp["startTimeUnixNano"]) / 1e9,
+            "end" : int(otlp["endTimeUnixNano"]) / 1e9,
+            "error" : otlp["status"].get("message")
+        }
+        span_dict["duration"] = span_dict["end"] - span_dict["start"]
+        span_dict.update({attribute["key"] : python_value(attribute["value"]) for attribute in otlp["attributes"]})
+        spans.append(span_dict)
+    return spans
@@ -0,0 +1,53 @@
+import argparse
+from google.cloud import storage
+from google.oauth2 import service_account
+
+from etl.output_commit import union_manifests
+
+# Idea:
+# The pipelined DAG runs every subreddit through its own stages under {directory}/{subreddit}/,
+# so the merged meta text of a subreddit is committed at {directory}/{subreddit}/{output_directory}/
+# The union commits {directory}/{output_directory}/ with a manifest listing the data files of every subreddit,
+# the report stages read the same path as after the global merge and no data file is copied
+
+GCP_PATH = "./gcp_key.json"
+
+
+def initialize_storage_client(gcp_path : str = GCP_PATH):
+    credentials = service_account.Credentials.from_service_account_file(gcp_path)
+    storage_client = storage.Client(credentials=credentials)
+    return storage_client
+
+
+def subreddit_directory(directory : str, subreddit : str) -> str:
+    """The directory of a subreddit in the pipelined DAG"""
+    return f"{directory}/{subreddit}"
+
+
+def union_subreddit_outputs_main(bucket_name : str, directory : str, subreddits : list[str], output_directory : str,
+                                 storage_client = None) -> dict:
+    """Commit the union of the subreddit outputs under the date directory
+    Args:
+        bucket_name (str): the bucket of the outputs
+        directory (str): the date directory
+        subreddits (list[str]): the subreddits of the run
+        output_directory (str): the output directory under every subreddit directory and under the date directory
+    Returns:
+        dict: the union manifest
+    """
+    if storage_client is None:
+        storage_client = initialize_storage_client()
+    prefixes = [f"{subreddit_directory(directory, subreddit)}/{output_directory}" for subreddit in subreddits]
+    manifest = union_manifests(storage_client, bucket_name, prefixes, f"{directory}/{output_directory}")
+    print(f"committed {len(manifest['files'])} files of {len(subreddits)} subreddits under {directory}/{output_directory}")
+    return manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("union the committed outputs of the subreddits")
+    parser.add_argument("--bucket_name", type=str, required=True, help="the bucket of the outputs")
+    parser.add_argument("--directory", type=str, required=True, help="the directory with format start_date-end_date")
+    parser.add_argument("--subreddits", type=str, nargs="+", required=True, help="the subreddits of the run")
+    parser.add_argument("--output_directory", type=str, required=True, help="the output directory of every subreddit")
+    args = parser.parse_args()
+    union_subreddit_outputs_main(args.bucket_name, args.directory, args.subreddits, args.output_directory)
@@ -0,0 +1,198 @@
+import argparse
+import importlib
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+import traceback
+from contextlib import redirect_stderr, redirect_stdout
+
+# Idea:
+# A `docker run` per scrape task pays the container start, the python start, the imports(pandas, praw, google-cloud)
+# and new storage/reddit clients every time. Instead every VM keeps one resident container per scrape image
+#   serve  -> the container entrypoint, imports the service module and its HEAVY_MODULES once and runs its main(argv) for every job
+#             received on a unix socket, one job at a time(the VM shares its reddit client limit)
+#   submit -> `docker exec` of a bare python(standard library only) that sends the argv of the job and
+#             streams the output back as json lines, the exit code of the job is its exit code
+# The services cache their clients(lru_cache), so the credentials, the sessions and the connections stay warm
+# The PIPELINE_* environment of `docker exec -e`(the trace export of the run) is applied to every job
+# The DAG starts the workers next to the image pull and falls back to `docker run` if a worker is not running
+# The ssh task of a job fails when its command is silent for cmd_timeout, so a job queued behind the running one sends
+# a heartbeat line, and a queued job whose client has closed its connection is dropped instead of run
+# The services copy this file in at build time(Makefile), so it only uses the standard library
+
+WORKER_SOCKET = "/tmp/warm_worker.sock"
+JOB_ENV_PREFIX = "PIPELINE_"
+CONNECT_WAIT_SECONDS = 30
+QUEUE_HEARTBEAT_SECONDS = 60
+# image name -> the container name of its worker and the service module it serves
+WORKERS = {
+    "scrape-reddit" : {"container" : "reddit-scrape-worker", "module" : "reddit_scraping"},
+    "scrape-image" : {"container" : "reddit-image-worker", "module" : "image_scraping"}
+}
+
+
+def start_command(docker_username : str, image_name : str) -> str:
+    """The shell command that (re)starts the worker of the image unless it already runs the pulled image"""
+    worker = WORKERS[image_name]
+    image = f"{docker_username}/{image_name}:latest"
+    return (f"sudo docker ps -q --filter name=^{worker['container']}$ --filter ancestor={image} | grep -q . || "
+            f"(sudo docker rm -f {worker['container']} > /dev/null 2>&1; "
+            f"sudo docker run -d --restart unless-stopped --name {worker['container']} --entrypoint python3 "
+            f"{image} -u warm_worker.py serve --module {worker['module']})")
+
+
+def pull_command(docker_username : str, image_names : list[str]) -> str:
+    """The shell command that pulls the images and (re)starts their workers"""
+    pulls = [f"sudo docker pull {docker_username}/{image_name}:latest" for image_name in image_names]
+    return " && ".join(pulls + [start_command(docker_username, image_name) for image_name in image_names])
+
+
+def submit_command(docker_username : str, image_name : str, docker_env : str, job_args : str) -> str:
+    """The shell command that runs the job on the worker of the image, or in a new container without a worker"""
+    worker = WORKERS[image_name]
+    return (f"if sudo docker top {worker['container']} > /dev/null 2>&1; "
+            f"then sudo docker exec {docker_env} {worker['container']} python3 -u warm_worker.py submit -- {job_args}; "
+            f"else sudo docker run {docker_env} {docker_username}/{image_name}:latest {job_args}; fi")
+
+
+class JobOutput:
+    """The stdout/stderr of a job, sent to the client line by line as {"log" : line}"""
+
+    def __init__(self, wfile):
+        self.wfile = wfile
+        self.buffer = ""
+        self.closed_by_client = False
+
+    def write(self, text : str) -> int:
+        self.buffer += text
+        while "\n" in self.buffer:
+            line, self.buffer = self.buffer.split("\n", 1)
+            self.send({"log" : line + "\n"})
+        return len(text)
+
+    def flush(self):
+        if self.buffer:
+            self.send({"log" : self.buffer})
+            self.buffer = ""
+
+    def send(self, message : dict):
+        # the job finishes even if the ssh session of the client is gone
+        if self.closed_by_client:
+            return
+        try:
+            self.wfile.write((json.dumps(message) + "\n").encode())
+            self.wfile.flush()
+        except OSError:
+            self.closed_by_client = True
+
+
+def run_job(module, request : dict, output : JobOutput) -> int:
+    """Run main(argv) of the service module with the environment of the request
+    Returns:
+        int: the exit code of the job
+    """
+    for key in [key for key in os.environ if key.startswith(JOB_ENV_PREFIX)]:
+        del os.environ[key]
+    os.environ.update(request.get("env", {}))
+    import tracing
+    tracing.configure()
+    with redirect_stdout(output), redirect_stderr(output):
+        try:
+            module.main(request["argv"])
+            exit_code = 0
+        except SystemExit as e:
+            exit_code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+        except Exception:
+            traceback.print_exc()
+            exit_code = 1
+    output.flush()
+    return exit_code
+
+
+def serve(module_name : str, socket_path : str = WORKER_SOCKET):
+    """Import the service module(and the HEAVY_MODULES its functions import lazily) once
+    and run the jobs of the socket one at a time"""
+    start_time = time.time()
+    module = importlib.import_module(module_name)
+    for heavy_module_name in getattr(module, "HEAVY_MODULES", []):
+        importlib.import_module(heavy_module_name)
+    job_lock = threading.Lock()
+    print(f"imported {module_name} in {time.time() - start_time:.2f}s, serving on {socket_path}")
+
+    class JobHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            request = json.loads(self.rfile.readline())
+            output = JobOutput(self.wfile)
+            queued_since = time.time()
+            while not job_lock.acquire(timeout = QUEUE_HEARTBEAT_SECONDS):
+                output.send({"log" : f"queued behind the running job for {time.time() - queued_since:.0f}s\n"})
+                if output.closed_by_client:
+                    print(f"job {request['argv']} dropped from the queue, its client is gone")
+                    return
+            try:
+                job_start = time.time()
+                exit_code = run_job(module, request, output)
+            finally:
+                job_lock.release()
+            output.send({"exit" : exit_code, "seconds" : time.time() - job_start})
+            print(f"job {request['argv']} exited with {exit_code} in {time.time() - job_start:.2f}s")
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    with socketserver.ThreadingUnixStreamServer(socket_path, JobHandler) as server:
+        server.serve_forever()
+
+
+def connect(socket_path : str, wait_seconds : float = CONNECT_WAIT_SECONDS) -> socket.socket:
+    """Connect to the worker, wait for a worker that is still importing its module"""
+    deadline = time.time() + wait_seconds
+    while True:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(socket_path)
+            return sock
+        except (FileNotFoundError, ConnectionRefusedError):
+            sock.close()
+            if time.time() > deadline:
+                raise
+            time.sleep(0.2)
+
+
+def submit(argv : list[str], socket_path : str = WORKER_SOCKET) -> int:
+    """Send the job to the worker and stream its output
+    Returns:
+        int: the exit code of the job, 1 if the worker dropped the connection
+    """
+    request = {"argv" : argv, "env" : {key : value for key, value in os.environ.items() if key.startswith(JOB_ENV_PREFIX)}}
+    with connect(socket_path) as sock:
+        sock.sendall((json.dumps(request) + "\n").encode())
+        for line in sock.makefile("r"):
+            message = json.loads(line)
+            if "log" in message:
+                sys.stdout.write(message["log"])
+            if "exit" in message:
+                sys.stdout.flush()
+                return message["exit"]
+    print("the worker closed the connection before the job finished")
+    return 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("a resident worker running the jobs of a service module")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve_parser = subparsers.add_parser("serve", help="import the module and serve the jobs")
+    serve_parser.add_argument("--module", type=str, required=True, help="the service module with main(argv)")
+    serve_parser.add_argument("--socket", type=str, default=WORKER_SOCKET, help="the unix socket path")
+    submit_parser = subparsers.add_parser("submit", help="run a job on the worker")
+    submit_parser.add_argument("--socket", type=str, default=WORKER_SOCKET, help="the unix socket path")
+    submit_parser.add_argument("job_args", nargs=argparse.REMAINDER, help="the arguments of the job after --")
+    args = parser.parse_args()
+    if args.command == "serve":
+        serve(args.module, args.socket)
+    else:
+        job_args = args.job_args[1:] if args.job_args[:1] == ["--"] else args.job_args
+        sys.exit(submit(job_args, args.socket))
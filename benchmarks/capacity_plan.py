@@ -0,0 +1,53 @@
+import argparse
+import sys
+from datetime import date
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "airflows" / "scripts"))
+from etl import capacity_planner
+from synthetic_data import generate_meta_text, SUBREDDITS
+
+# Idea:
+# Simulate the backlog of a run at growing scales and compare the stage minutes of
+#   fixed   -> one VM per reddit client, the image scraping on the same VMs(the pool before the planner)
+#   planned -> capacity_planner.plan_capacity, the fewest scrape VMs that fit the target, separate image VMs
+# The backlog of a scale is a synthetic week(the rows of every subreddit) with IMAGE_ROW_SHARE image rows
+# A smaller pool than the fixed one is the saving, an over target stage is what the fixed pool cannot absorb
+
+
+def simulated_volumes(n_rows : int, seed : int) -> dict:
+    """The rows of every subreddit in a synthetic week"""
+    meta_text_df = generate_meta_text(n_rows, date(2024, 1, 1), 7, seed=seed)
+    return {subreddit : float(n_subreddit_rows) for subreddit, n_subreddit_rows in meta_text_df["subreddit"].value_counts().items()}
+
+
+def main(scales : list[int], n_reddit_clients : int, target_minutes : float):
+    print(f"{n_reddit_clients} reddit clients, {len(SUBREDDITS)} subreddits, {target_minutes} minute target")
+    print(f"{'rows':>9}{'images':>8}  {'pool':<8}{'scrape VMs':>11}{'min':>7}{'image VMs':>10}{'min':>7}{'caption min':>12}")
+    for seed, n_rows in enumerate(scales):
+        volumes = simulated_volumes(n_rows, seed)
+        image_rows = round(sum(volumes.values()) * capacity_planner.IMAGE_ROW_SHARE)
+        fixed = capacity_planner.plan_capacity(volumes, image_rows, n_reddit_clients, target_minutes)
+        # the fixed pool keeps every client and scrapes the images on the same VMs
+        makespan = max(capacity_planner.lpt_schedule(list(volumes), volumes, n_reddit_clients)["loads"])
+        fixed["stages"]["scrape"].update(workers = n_reddit_clients,
+                                         expected_minutes = makespan / capacity_planner.SCRAPE_ROWS_PER_MINUTE)
+        fixed["stages"]["image_scrape"].update(workers = n_reddit_clients,
+                                               expected_minutes = image_rows / (capacity_planner.IMAGES_PER_WORKER_MINUTE * n_reddit_clients))
+        planned = capacity_planner.plan_capacity(volumes, image_rows, n_reddit_clients, target_minutes)
+        for name, plan in [("fixed", fixed), ("planned", planned)]:
+            stages = plan["stages"]
+            print(f"{n_rows:>9}{image_rows:>8}  {name:<8}{stages['scrape']['workers']:>11}{stages['scrape']['expected_minutes']:>7.1f}"
+                  f"{stages['image_scrape']['workers']:>10}{stages['image_scrape']['expected_minutes']:>7.1f}"
+                  f"{stages['caption']['expected_minutes']:>12.1f}")
+        over_target = [stage for stage, stage_values in planned["stages"].items() if stage_values["over_target"]]
+        print(f"{'':>19}terraform {capacity_planner.terraform_variables(planned)}, over the target: {over_target or 'none'}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("size the scrape and image workers of simulated backlogs")
+    parser.add_argument("--scales", type=int, nargs="+", default=[5000, 50000, 500000, 2000000], help="the rows of every simulated run")
+    parser.add_argument("--n_reddit_clients", type=int, default=4, help="the reddit clients, the fixed pool has one VM each")
+    parser.add_argument("--target_minutes", type=float, default=capacity_planner.DEFAULT_TARGET_MINUTES, help="the wall minutes of a stage")
+    args = parser.parse_args()
+    main(args.scales, args.n_reddit_clients, args.target_minutes)
@@ -0,0 +1,65 @@
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Idea:
+# Parse a DAG file the way the scheduler does and report the parse latency and the metadata-db lookups of a parse
+#   the dag file processor forks from a process that already imported airflow, so airflow is imported once here
+#     and every module the DAG file imported is dropped from sys.modules before the next parse
+#   Variable.get is wrapped to count the Variable lookups(one metadata-db query each) made while parsing
+# Run it inside the airflow image, for the DAG before the change:
+#   git show <commit>:airflows/dags/university_subreddit_dag.py > /tmp/old_dag.py
+#   python benchmarks/dag_parse_time.py --dag_path /tmp/old_dag.py
+
+DAG_PATH = Path(__file__).resolve().parents[1] / "airflows" / "dags" / "university_subreddit_dag.py"
+
+
+def count_variable_lookups() -> dict:
+    """Wrap Variable.get so every lookup is counted"""
+    from airflow.models import Variable
+    counter = {"lookups" : 0}
+    original_get = Variable.get
+    def counting_get(*args, **kwargs):
+        counter["lookups"] += 1
+        return original_get(*args, **kwargs)
+    Variable.get = counting_get
+    return counter
+
+
+def parse_once(dag_path : str, counter : dict) -> (float, int, int):
+    """Parse the DAG file into a fresh DagBag
+    Returns:
+        (float, int, int): the parse seconds, the Variable lookups and the number of tasks
+    """
+    from airflow.models import DagBag
+    loaded_modules = set(sys.modules)
+    counter["lookups"] = 0
+    start_time = time.perf_counter()
+    dag_bag = DagBag(dag_folder=dag_path, include_examples=False, safe_mode=False)
+    parse_seconds = time.perf_counter() - start_time
+    if len(dag_bag.import_errors) > 0:
+        raise RuntimeError(f"the DAG file failed to import: {dag_bag.import_errors}")
+    # a forked dag file processor starts without the modules of the previous parse
+    for module_name in set(sys.modules) - loaded_modules:
+        del sys.modules[module_name]
+    return parse_seconds, counter["lookups"], sum(len(dag.tasks) for dag in dag_bag.dags.values())
+
+
+def main(dag_path : str, repeat : int):
+    counter = count_variable_lookups()
+    results = [parse_once(dag_path, counter) for _ in range(repeat)]
+    parse_milliseconds = [parse_seconds * 1000 for parse_seconds, _, _ in results]
+    print(f"{dag_path}: {results[-1][2]} tasks")
+    print(f"parse median {statistics.median(parse_milliseconds):.1f}ms, min {min(parse_milliseconds):.1f}ms, "
+          f"max {max(parse_milliseconds):.1f}ms over {repeat} parses")
+    print(f"Variable lookups per parse {results[-1][1]}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("measure the parse time of a DAG file")
+    parser.add_argument("--dag_path", type=str, default=str(DAG_PATH), help="the DAG file")
+    parser.add_argument("--repeat", type=int, default=20, help="the number of parses")
+    args = parser.parse_args()
+    main(args.dag_path, args.repeat)
@@ -0,0 +1,66 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+import duckdb
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "airflows" / "scripts"))
+from etl.parquet_config import write_table
+from synthetic_data import generate_meta_text
+
+# Idea:
+# Write the same synthetic table with the default pandas layout and with the shared layout of etl/parquet_config.py
+# and compare the file size, an id lookup and a subreddit two day range scan on both files
+# duckdb is used as the reader because it skips row groups with the statistics and the bloom filters
+
+QUERIES = {
+    "id lookup" : "SELECT count(*), sum(length(text)) FROM read_parquet('{path}') WHERE id = '{lookup_id}'",
+    "date range" : """SELECT count(*), sum(length(text)) FROM read_parquet('{path}')
+                      WHERE subreddit = '{subreddit}' AND create_date >= DATE '{first_date}' AND create_date < DATE '{first_date}' + 2"""
+}
+
+
+def timed_query(connection, sql_query : str, repeat : int) -> (float, int):
+    """The best query time over repeat runs and the number of matched rows"""
+    best_time, n_rows = float("inf"), 0
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        n_rows = connection.execute(sql_query).fetchone()[0]
+        best_time = min(best_time, time.perf_counter() - start_time)
+    return best_time, n_rows
+
+
+def main(n_rows : int, row_group_rows : int, repeat : int):
+    df = generate_meta_text(n_rows)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    query_params = {
+        "lookup_id" : df["id"].iloc[len(df) // 2],
+        "subreddit" : df["subreddit"].iloc[0],
+        "first_date" : df["create_date"].min()
+    }
+    connection = duckdb.connect()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        layouts = {
+            "default" : str(Path(tmp_dir) / "default.parquet"),
+            "shared" : str(Path(tmp_dir) / "shared.parquet")
+        }
+        pq.write_table(table, layouts["default"], row_group_size=row_group_rows)
+        write_table(table, layouts["shared"], row_group_size=row_group_rows)
+        print(f"{'layout':<10}{'bytes':>14}{'query':>14}{'seconds':>12}{'rows':>10}")
+        for layout, path in layouts.items():
+            for query, sql_format in QUERIES.items():
+                seconds, rows = timed_query(connection, sql_format.format(path=path, **query_params), repeat)
+                print(f"{layout:<10}{os.path.getsize(path):>14}{query:>14}{seconds:>12.4f}{rows:>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("compare the default and the shared parquet layout")
+    parser.add_argument("--n_rows", type=int, default=500000, help="the number of synthetic rows")
+    parser.add_argument("--row_group_rows", type=int, default=32768, help="the row group size of both layouts")
+    parser.add_argument("--repeat", type=int, default=5, help="the number of timed reads")
+    args = parser.parse_args()
+    main(args.n_rows, args.row_group_rows, args.repeat)
@@ -0,0 +1,59 @@
+import argparse
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "airflows" / "scripts"))
+from etl import scrape_scheduler
+from synthetic_data import generate_meta_text, SUBREDDITS
+
+# Idea:
+# Build a fixture history(the (subreddit, date) rows of the history table) from a synthetic history,
+# estimate the volume of every subreddit from it and schedule the next run onto the connections
+# The next run is another synthetic week(another seed), the makespan is the most rows a connection has to scrape
+#   round robin -> subreddit_idx % n_connections
+#   lpt         -> the scrape scheduler
+#   lower bound -> max(total rows / n_connections, the largest subreddit)
+
+
+def fixture_history(n_rows : int, start_date : date, n_days : int, seed : int):
+    """The history rows of a synthetic table"""
+    meta_text_df = generate_meta_text(n_rows, start_date, n_days, seed=seed)
+    meta_text_df["is_post"] = meta_text_df["parent"].isna()
+    history_df = meta_text_df.groupby(["subreddit", "create_date"])["is_post"].agg(["sum", "count"]).reset_index()
+    return history_df.rename(columns={"create_date" : "date"}).assign(
+        n_posts=history_df["sum"], n_comments=history_df["count"] - history_df["sum"])[["subreddit", "date", "n_posts", "n_comments"]]
+
+
+def makespan(schedule : dict, actual_rows : dict, n_connections : int) -> int:
+    """The most actual rows scraped by one connection"""
+    loads = [0] * n_connections
+    for subreddit, conn_idx in schedule["assignments"].items():
+        loads[conn_idx] += actual_rows.get(subreddit, 0)
+    return max(loads)
+
+
+def main(n_rows : int, n_days : int, n_connections : int, subreddits : list[str]):
+    start_date = date(2024, 1, 1)
+    history_df = fixture_history(n_rows, start_date, n_days, seed=0)
+    # the next week with the same daily volume
+    next_df = fixture_history(n_rows * 7 // n_days, start_date + timedelta(days=n_days), 7, seed=1)
+    actual_rows = (next_df["n_posts"] + next_df["n_comments"]).groupby(next_df["subreddit"]).sum().to_dict()
+    volumes = scrape_scheduler.estimate_volumes(subreddits, scrape_scheduler.history_volumes(history_df))
+    total_rows = sum(actual_rows.get(subreddit, 0) for subreddit in subreddits)
+    lower_bound = max(total_rows / n_connections, max(actual_rows.get(subreddit, 0) for subreddit in subreddits))
+    print(f"{len(subreddits)} subreddits on {n_connections} connections, {total_rows} rows in the next run")
+    print(f"{'schedule':>12}{'makespan':>10}{'/ bound':>9}")
+    for name, schedule_fn in [("round robin", scrape_scheduler.round_robin_schedule), ("lpt", scrape_scheduler.lpt_schedule)]:
+        cur_makespan = makespan(schedule_fn(subreddits, volumes, n_connections), actual_rows, n_connections)
+        print(f"{name:>12}{cur_makespan:>10}{cur_makespan / lower_bound:>9.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("compare the scrape makespan of the round robin and the lpt schedule")
+    parser.add_argument("--n_rows", type=int, default=200000, help="the number of rows of the fixture history")
+    parser.add_argument("--n_days", type=int, default=30, help="the number of days of the fixture history")
+    parser.add_argument("--n_connections", type=int, default=3, help="the number of VMs and reddit clients")
+    parser.add_argument("--subreddits", type=str, nargs="+", default=SUBREDDITS, help="the subreddits in the order of subreddits.txt")
+    args = parser.parse_args()
+    main(args.n_rows, args.n_days, args.n_connections, args.subreddits)
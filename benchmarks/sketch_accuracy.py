@@ -0,0 +1,68 @@
+import argparse
+import sys
+import time
+from datetime import timedelta
+from pathlib import Path
+import duckdb
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "airflows" / "scripts"))
+from etl import sketches
+from etl.generate_data_for_report import generate_rollup_query, bigquery_to_duckdb, local_table_sources, LOCAL_TABLE_REF
+from synthetic_data import generate_meta_text
+
+# Idea:
+# Build the rollup of a long synthetic history with the rollup sql, build the author sketches of every (subreddit, date)
+# and compare the merged sketches of the 7/30/90 day windows against the exact answers over the rollup rows
+#   distinct authors -> relative error against the HyperLogLog standard error(1.04 / sqrt(2^p))
+#   top authors      -> recall of the exact top n, and whether the exact counts stay inside [count - error, count]
+
+SQL_PARENT_PROJECT = Path(__file__).resolve().parents[1] / "airflows" / "scripts" / "etl" / "sql_queries"
+WINDOWS = [7, 30, 90]
+
+
+def build_rollup(parquet_path : str):
+    """The rollup rows of the parquet file"""
+    rollup_sql = generate_rollup_query(str(SQL_PARENT_PROJECT), *LOCAL_TABLE_REF.split("."))
+    return duckdb.sql(bigquery_to_duckdb(rollup_sql, local_table_sources(parquet_path))).df()
+
+
+def exact_answers(rollup_df, window : int, n_top : int) -> (int, dict):
+    """The exact distinct authors and the exact interactions of the top authors in the last window days"""
+    end_date = rollup_df["create_date"].max()
+    window_df = rollup_df[(rollup_df["create_date"] > end_date - timedelta(days=window)) & rollup_df["authorname"].notna()]
+    interactions = (window_df["post_rows"] + window_df["comment_rows"]).groupby(window_df["authorname"]).sum()
+    return window_df["authorname"].nunique(), interactions.sort_values(ascending=False).head(n_top).to_dict()
+
+
+def main(n_rows : int, n_days : int, n_top : int, output_path : str):
+    generate_meta_text(n_rows, n_days=n_days).to_parquet(output_path)
+    rollup_df = build_rollup(output_path)
+    rollup_df["create_date"] = rollup_df["create_date"].astype("datetime64[ns]").dt.date
+    start_time = time.perf_counter()
+    store_df = sketches.partition_sketches(rollup_df)
+    build_seconds = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    summary = sketches.window_author_summary(store_df, WINDOWS, n_top)
+    merge_seconds = time.perf_counter() - start_time
+    print(f"{len(rollup_df)} rollup rows, {len(store_df)} partitions, build {build_seconds:.2f}s, merge {merge_seconds:.2f}s")
+    print(f"{'window':>8}{'exact':>10}{'estimate':>10}{'rel err':>10}{'std err':>10}{'top recall':>12}{'in bounds':>11}")
+    for window in WINDOWS:
+        exact_distinct, exact_top = exact_answers(rollup_df, window, n_top)
+        window_summary = summary[str(window)]
+        relative_error = abs(window_summary["distinct_authors"] - exact_distinct) / exact_distinct
+        estimated_top = {author : (count, error) for author, count, error in window_summary["top_authors"]}
+        recall = len(estimated_top.keys() & exact_top.keys()) / len(exact_top)
+        in_bounds = all(count - error <= exact_top[author] <= count
+                        for author, (count, error) in estimated_top.items() if author in exact_top)
+        print(f"{window:>8}{exact_distinct:>10}{window_summary['distinct_authors']:>10}{relative_error:>10.4f}"
+              f"{window_summary['relative_error']:>10.4f}{recall:>12.2f}{str(in_bounds):>11}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("compare the merged author sketches with the exact answers")
+    parser.add_argument("--n_rows", type=int, default=300000, help="the number of synthetic rows")
+    parser.add_argument("--n_days", type=int, default=90, help="the number of days of the history")
+    parser.add_argument("--n_top", type=int, default=10, help="the number of top authors compared")
+    parser.add_argument("--output_path", type=str, default="/tmp/sketch_history.parquet", help="the synthetic parquet path")
+    args = parser.parse_args()
+    main(args.n_rows, args.n_days, args.n_top, args.output_path)
@@ -0,0 +1,97 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "airflows" / "scripts"))
+
+# Idea:
+# Register the ssh connections of n VMs in a fresh sqlite airflow metadata db and count the statements
+#   per connection -> the query + commit per connection of the DAG before the change
+#   bulk upsert    -> etl.ssh_connections.register_ssh_connections, one query(per 500 ids) and one commit
+# The bulk upsert is then checked for idempotency
+#   a second run with the same hosts changes nothing, a run with moved VMs updates only their hosts
+# The metadata db is set before airflow is imported, so it never touches the db of the image
+# Run it inside the airflow image:
+#   python benchmarks/ssh_connection_registration.py --n_vms 300
+
+EXTRA = '{"key_file": "/opt/airflow/ssh/id_rsa", "pulic_key": "ssh-rsa AAAA", "port": 22}'
+
+
+def init_metadata_db(db_path : str):
+    """Point airflow at a new sqlite metadata db and create its tables"""
+    os.environ["AIRFLOW__DATABASE__SQL_ALCHEMY_CONN"] = f"sqlite:///{db_path}"
+    os.environ["AIRFLOW__CORE__LOAD_EXAMPLES"] = "False"
+    from airflow.utils import db
+    db.initdb(load_connections=False)
+
+
+def count_statements() -> dict:
+    """Count the statements and the commits sent to the metadata db"""
+    from sqlalchemy import event
+    from airflow import settings
+    counter = {"statements" : 0, "commits" : 0}
+    event.listen(settings.engine, "before_cursor_execute", lambda *args : counter.update(statements = counter["statements"] + 1))
+    event.listen(settings.engine, "commit", lambda *args : counter.update(commits = counter["commits"] + 1))
+    return counter
+
+
+def per_connection_registration(hosts : dict):
+    """The registration of the DAG before the change"""
+    from airflow import settings
+    from airflow.models import Connection
+    session = settings.Session()
+    for conn_id, host in hosts.items():
+        if not (session.query(Connection).filter(Connection.conn_id == conn_id).first()):
+            session.add(Connection(conn_id = conn_id, conn_type = 'SSH', host = host, login = 'airflow', extra = EXTRA))
+            session.commit()
+
+
+def timed(counter : dict, function, *args) -> (float, int, int, object):
+    counter.update(statements = 0, commits = 0)
+    start_time = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start_time, counter["statements"], counter["commits"], result
+
+
+def main(n_vms : int) -> bool:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        init_metadata_db(str(Path(tmp_dir) / "airflow.db"))
+        from airflow.models import Connection
+        from airflow.utils.session import create_session
+        from etl.ssh_connections import register_ssh_connections
+        counter = count_statements()
+        old_hosts = {f"old_ssh_{idx}" : f"10.0.{idx // 250}.{idx % 250}" for idx in range(n_vms)}
+        hosts = {f"ssh_{idx}" : f"10.0.{idx // 250}.{idx % 250}" for idx in range(n_vms)}
+        hosts["ssh_gpu"] = "10.1.0.1"
+        moved_hosts = dict(hosts, ssh_0 = "10.2.0.1", ssh_gpu = "10.2.0.2")
+
+        rows = [("per connection", *timed(counter, per_connection_registration, old_hosts))]
+        rows.append(("bulk upsert", *timed(counter, register_ssh_connections, hosts, EXTRA)))
+        rows.append(("bulk, rerun", *timed(counter, register_ssh_connections, hosts, EXTRA)))
+        rows.append(("bulk, 2 moved", *timed(counter, register_ssh_connections, moved_hosts, EXTRA)))
+        print(f"{n_vms} VM connections")
+        print(f"{'registration':<16}{'ms':>9}{'statements':>12}{'commits':>9}")
+        for name, seconds, statements, commits, _ in rows:
+            print(f"{name:<16}{seconds * 1000:>9.1f}{statements:>12}{commits:>9}")
+
+        with create_session() as session:
+            stored = {conn.conn_id : conn.host for conn in session.query(Connection).filter(Connection.conn_id.in_(list(hosts)))}
+        checks = {
+            "first run adds every connection" : len(rows[1][4]["added"]) == len(hosts),
+            "rerun changes nothing" : len(rows[2][4]["unchanged"]) == len(hosts),
+            "moved VMs are updated" : sorted(rows[3][4]["updated"]) == ["ssh_0", "ssh_gpu"],
+            "the db holds the moved hosts" : stored == moved_hosts
+        }
+        for check, passed in checks.items():
+            print(f"{'ok  ' if passed else 'FAIL'} {check}")
+        return all(checks.values())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("measure the ssh connection registration on a sqlite airflow metadata db")
+    parser.add_argument("--n_vms", type=int, default=300, help="the number of VM connections")
+    args = parser.parse_args()
+    sys.exit(0 if main(args.n_vms) else 1)
@@ -0,0 +1,90 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+# Idea:
+# Measure how long the service entry points take before they do any work, with `python -X importtime`
+#   help           -> `--help`
+#   argument error -> no arguments, argparse exits with the usage
+# Both return before any storage, reddit or model call, so the time is the python start plus the module imports
+# Every entry point has a budget(STARTUP_BUDGET_MS, the median wall time of a case), the script exits with 1 over budget
+# The largest imports(cumulative) are listed, a new top-level import of pandas/torch shows up there first
+# Run it where the service requirements are installed(the ML entry points do not need torch for these cases):
+#   python benchmarks/startup_time.py
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+ETL_DIR = ROOT_DIR / "airflows" / "scripts" / "etl"
+ENTRY_POINTS = {
+    "reddit_scraping" : ROOT_DIR / "services" / "scrape_docker" / "reddit_scraping.py",
+    "image_scraping" : ROOT_DIR / "services" / "image_scrape_docker" / "image_scraping.py",
+    "image_caption" : ROOT_DIR / "services" / "image_caption_docker" / "image_caption.py",
+    "sentiment_analysis" : ROOT_DIR / "services" / "sentiment_analysis_docker" / "sentiment_analysis.py"
+}
+CASES = {"help" : ["--help"], "argument_error" : []}
+# the median wall time of a case in milliseconds, the imports of pandas alone take longer
+STARTUP_BUDGET_MS = {
+    "reddit_scraping" : 150,
+    "image_scraping" : 150,
+    "image_caption" : 150,
+    "sentiment_analysis" : 150
+}
+TOP_IMPORTS = 5
+
+
+def parse_importtime(stderr : str) -> (float, list):
+    """Parse the `-X importtime` lines
+    Returns:
+        (float, list): the total import milliseconds and the (cumulative ms, package) of the top-level imports
+    """
+    total_us, top_level = 0, []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, package = line[len("import time:"):].split("|")
+        total_us += int(self_us)
+        # the nesting is the indentation of the package name
+        if not package[1:].startswith(" "):
+            top_level.append((int(cumulative_us) / 1000, package.strip()))
+    return total_us / 1000, sorted(top_level, reverse=True)
+
+
+def measure(script_path : Path, args : list[str]) -> (float, float, list):
+    """Run the entry point once
+    Returns:
+        (float, float, list): the wall ms, the import ms and the top-level imports
+    """
+    # the shared modules are copied next to the service in its image
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([str(script_path.parent), str(ETL_DIR)]))
+    start_time = time.perf_counter()
+    process = subprocess.run([sys.executable, "-X", "importtime", str(script_path)] + args,
+                             env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    wall_ms = (time.perf_counter() - start_time) * 1000
+    import_ms, top_level = parse_importtime(process.stderr)
+    return wall_ms, import_ms, top_level
+
+
+def main(repeat : int) -> bool:
+    within_budget = True
+    print(f"{'entry point':<22}{'case':<16}{'wall ms':>9}{'import ms':>11}{'budget ms':>11}")
+    for name, script_path in ENTRY_POINTS.items():
+        for case, args in CASES.items():
+            results = [measure(script_path, args) for _ in range(repeat)]
+            wall_ms = statistics.median(result[0] for result in results)
+            import_ms = statistics.median(result[1] for result in results)
+            over = wall_ms > STARTUP_BUDGET_MS[name]
+            within_budget = within_budget and not over
+            print(f"{name:<22}{case:<16}{wall_ms:>9.1f}{import_ms:>11.1f}{STARTUP_BUDGET_MS[name]:>11}{'  OVER' if over else ''}")
+        top_imports = ", ".join(f"{package} {cumulative_ms:.1f}ms" for cumulative_ms, package in results[-1][2][:TOP_IMPORTS])
+        print(f"    largest imports: {top_imports}")
+    return within_budget
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("measure the startup time of the service entry points against their budget")
+    parser.add_argument("--repeat", type=int, default=5, help="the runs of every case")
+    args = parser.parse_args()
+    sys.exit(0 if main(args.repeat) else 1)
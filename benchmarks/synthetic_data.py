@@ -0,0 +1,76 @@
+import argparse
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+
+# Idea:
+# Generate a table with the columns of meta_text_merge/meta_text.parquet(the table loaded into bigquery)
+# so the benchmarks and the local backends can run without scraping reddit
+# posts have parent = null, comments point to a post of the same subreddit and day
+# the author activity follows a zipf distribution like on reddit
+
+SUBREDDITS = ["ucla", "berkeley", "USC", "UCSD",
+              "UCSantaBarbara", "UCDavis", "stanford", "Caltech", "UCI", "ucmerced"]
+POST_FRACTION = 0.1
+N_AUTHORS = 20000
+WORDS = ["campus", "class", "exam", "housing", "parking", "professor", "dining", "library",
+         "major", "internship", "club", "football", "research", "midterm", "dorm", "advice"]
+
+
+def generate_meta_text(n_rows : int, start_date : date = date(2024, 1, 1), n_days : int = 7,
+                       subreddits : list[str] = SUBREDDITS, seed : int = 0) -> pd.DataFrame:
+    """Generate a synthetic meta text table
+    Args:
+        n_rows (int): the number of posts and comments
+        start_date (date, optional): the first create date. Defaults to date(2024, 1, 1).
+        n_days (int, optional): the number of days covered. Defaults to 7.
+        subreddits (list[str], optional): the subreddits. Defaults to SUBREDDITS.
+        seed (int, optional): the random seed. Defaults to 0.
+    Returns:
+        pd.DataFrame: a dataframe with the columns of the merged meta text table
+    """
+    rng = np.random.default_rng(seed)
+    ids = np.array([f"t{idx:09x}" for idx in range(n_rows)])
+    # bigger subreddits first, like ucla against ucmerced
+    subreddit_weights = 1 / np.arange(1, len(subreddits) + 1)
+    subreddit_idx = rng.choice(len(subreddits), size=n_rows, p=subreddit_weights / subreddit_weights.sum())
+    day_offsets = rng.integers(0, n_days, size=n_rows)
+    is_post = rng.random(n_rows) < POST_FRACTION
+    is_post[0] = True
+    # every comment points to a random earlier post
+    post_positions = np.flatnonzero(is_post)
+    parent_positions = post_positions[rng.integers(0, len(post_positions), size=n_rows)]
+    parent = np.where(is_post, None, ids[parent_positions])
+    subreddit_idx = np.where(is_post, subreddit_idx, subreddit_idx[parent_positions])
+    day_offsets = np.where(is_post, day_offsets, day_offsets[parent_positions])
+    author_idx = np.minimum(rng.zipf(1.3, size=n_rows), N_AUTHORS) - 1
+    authornames = np.array([f"author_{idx}" for idx in range(N_AUTHORS)])[author_idx]
+    n_words = rng.integers(5, 60, size=n_rows)
+    word_idx = rng.integers(0, len(WORDS), size=n_words.sum())
+    texts, position = [], 0
+    for cur_n in n_words:
+        texts.append(" ".join(WORDS[idx] for idx in word_idx[position:position + cur_n]))
+        position += cur_n
+    create_dates = [start_date + timedelta(days=int(offset)) for offset in day_offsets]
+    return pd.DataFrame({
+        "id" : ids,
+        "url" : [f"https://www.reddit.com/r/x/comments/{cur_id}" for cur_id in ids],
+        "score" : rng.zipf(1.8, size=n_rows).clip(max=5000).astype("int64"),
+        "author_url" : [f"https://www.reddit.com/user/{name}" for name in authornames],
+        "authorname" : authornames,
+        "parent" : parent,
+        "create_date" : create_dates,
+        "subreddit" : np.array(subreddits)[subreddit_idx],
+        "text" : texts,
+        "sentiment" : rng.integers(-1, 2, size=n_rows).astype("int64")
+    }).sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("generate a synthetic meta text parquet table")
+    parser.add_argument("--n_rows", type=int, default=100000, help="the number of posts and comments")
+    parser.add_argument("--n_days", type=int, default=7, help="the number of days")
+    parser.add_argument("--start_date", type=str, default="2024-01-01", help="the first create date")
+    parser.add_argument("--output_path", type=str, required=True, help="the output parquet path")
+    args = parser.parse_args()
+    generate_meta_text(args.n_rows, date.fromisoformat(args.start_date), args.n_days).to_parquet(args.output_path)
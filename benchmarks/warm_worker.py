@@ -0,0 +1,70 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "airflows" / "scripts"))
+from etl import warm_worker
+
+# Idea:
+# Compare the per task overhead of a service entry point started cold with a job of a warm worker
+#   cold -> `python3 -u reddit_scraping.py --help`, the python start and the imports of every task(a `docker run`
+#           adds the container start on top)
+#   warm -> `python3 -u warm_worker.py submit -- --help`, the bare python of `docker exec` and a socket round trip
+#           to the worker that imported the module once
+# --help exits after the argument parsing, so only the overhead is measured, not the scraping
+# Run it where the service requirements are installed:
+#   python benchmarks/warm_worker.py --module reddit_scraping
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+ETL_DIR = ROOT_DIR / "airflows" / "scripts" / "etl"
+SERVICE_DIRS = {"reddit_scraping" : ROOT_DIR / "services" / "scrape_docker",
+                "image_scraping" : ROOT_DIR / "services" / "image_scrape_docker"}
+
+
+def timed_run(command : list[str], env : dict) -> float:
+    """Run the command and return its wall seconds"""
+    start_time = time.perf_counter()
+    subprocess.run(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - start_time
+
+
+def main(module_name : str, repeat : int):
+    # the shared modules are copied next to the service in its image
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([str(SERVICE_DIRS[module_name]), str(ETL_DIR)]))
+    module_path = str(SERVICE_DIRS[module_name] / f"{module_name}.py")
+    cold_seconds = [timed_run([sys.executable, "-u", module_path, "--help"], env) for _ in range(repeat)]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        socket_path = str(Path(tmp_dir) / "worker.sock")
+        start_time = time.perf_counter()
+        server = subprocess.Popen([sys.executable, "-u", str(ETL_DIR / "warm_worker.py"), "serve",
+                                   "--module", module_name, "--socket", socket_path],
+                                  env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            warm_worker.connect(socket_path).close()
+            ready_seconds = time.perf_counter() - start_time
+            submit_command = [sys.executable, "-u", str(ETL_DIR / "warm_worker.py"), "submit", "--socket", socket_path, "--", "--help"]
+            warm_seconds = [timed_run(submit_command, env) for _ in range(repeat)]
+        finally:
+            server.terminate()
+            server.wait()
+
+    print(f"{module_name}: {repeat} tasks")
+    print(f"cold start    median {statistics.median(cold_seconds) * 1000:8.1f}ms, max {max(cold_seconds) * 1000:8.1f}ms")
+    print(f"warm worker   median {statistics.median(warm_seconds) * 1000:8.1f}ms, max {max(warm_seconds) * 1000:8.1f}ms"
+          f"  (worker ready after {ready_seconds * 1000:.1f}ms, paid once per VM)")
+    print(f"speedup {statistics.median(cold_seconds) / statistics.median(warm_seconds):.1f}x per task, "
+          f"the container start of `docker run` is not included")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("measure the per task overhead of a cold entry point against a warm worker")
+    parser.add_argument("--module", type=str, default="reddit_scraping", choices=sorted(SERVICE_DIRS), help="the service module")
+    parser.add_argument("--repeat", type=int, default=10, help="the number of tasks")
+    args = parser.parse_args()
+    main(args.module, args.repeat)
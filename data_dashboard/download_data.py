@@ -1,30 +1,126 @@
 import argparse
 from google.cloud import storage
 from google.oauth2 import service_account
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import os
 import json
+import time
+
+# Idea(sync mode):
+# data/.manifest.json keeps the generation and md5 hash of every downloaded object
+# 1. list the report prefix, compare every object against the manifest
+# 2. download only the new or changed objects with a thread pool, each into a temporary file renamed over the old one
+# 3. delete the local files whose objects were removed, save the manifest
+# --watch repeats the sync every poll interval so the dashboard stays fresh
+
+DATA_DIR = "data/"
+MANIFEST_FILENAME = ".manifest.json"
+MAX_WORKERS = 8
+POLL_SECONDS = 60
 
 def download_directory(storage_client, bucket_name, prefix, destination_dir):
     """Download all files in a directory from GCS bucket."""
     bucket = storage_client.bucket(bucket_name)
-    blobs = bucket.list_blobs(prefix=prefix)  
-    
+    blobs = bucket.list_blobs(prefix=prefix)
+    Path(destination_dir).mkdir(parents=True, exist_ok=True)
+
     for blob in blobs:
         print(blob.name)
-        destination_file_name = os.path.join(destination_dir, blob.name[len(prefix) + 1:]) 
-        
+        destination_file_name = os.path.join(destination_dir, blob.name[len(prefix) + 1:])
+
         blob.download_to_filename(destination_file_name)
         print(f"Downloaded {blob.name} to {destination_file_name}.")
 
+def load_manifest(destination_dir : str) -> dict:
+    """Load the local manifest, an empty manifest if the directory was never synced"""
+    manifest_path = Path(destination_dir) / MANIFEST_FILENAME
+    if not manifest_path.exists():
+        return {}
+    with open(manifest_path, "r") as f:
+        return json.load(f)
+
+def save_manifest(destination_dir : str, manifest : dict):
+    """Save the local manifest atomically"""
+    manifest_path = Path(destination_dir) / MANIFEST_FILENAME
+    tmp_path = manifest_path.with_name(manifest_path.name + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+def download_atomic(blob, destination_file_name : str):
+    """Download the blob into a temporary file and rename it, the dashboard never reads a partial file"""
+    tmp_file_name = f"{destination_file_name}.tmp"
+    blob.download_to_filename(tmp_file_name, if_generation_match=blob.generation)
+    os.replace(tmp_file_name, destination_file_name)
+
+def sync_directory(storage_client, bucket_name : str, prefix : str, destination_dir : str, max_workers : int = MAX_WORKERS) -> dict:
+    """Download only the objects that changed since the last sync
+    Args:
+        storage_client : the storage client
+        bucket_name (str): the report bucket
+        prefix (str): the report directory
+        destination_dir (str): the local data directory
+        max_workers (int, optional): the number of concurrent downloads
+    Returns:
+        dict: the number of downloaded, unchanged and deleted files
+    """
+    Path(destination_dir).mkdir(parents=True, exist_ok=True)
+    manifest = load_manifest(destination_dir)
+    remote, changed = {}, []
+    for blob in storage_client.list_blobs(bucket_name, prefix=f"{prefix}/"):
+        file_name = blob.name[len(prefix) + 1:]
+        if file_name == "" or "/" in file_name:
+            continue
+        remote[file_name] = {"generation" : blob.generation, "md5_hash" : blob.md5_hash, "size" : blob.size}
+        local_entry = manifest.get(file_name)
+        is_unchanged = local_entry is not None and \
+            (local_entry["generation"] == blob.generation or local_entry["md5_hash"] == blob.md5_hash) and \
+            (Path(destination_dir) / file_name).exists()
+        if not is_unchanged:
+            changed.append((file_name, blob))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            file_name : executor.submit(download_atomic, blob, os.path.join(destination_dir, file_name))
+            for file_name, blob in changed
+        }
+        for file_name, future in futures.items():
+            future.result()
+            print(f"Downloaded {prefix}/{file_name} to {os.path.join(destination_dir, file_name)}.")
+
+    deleted = [file_name for file_name in manifest if file_name not in remote]
+    for file_name in deleted:
+        Path(destination_dir, file_name).unlink(missing_ok=True)
+        print(f"Deleted {os.path.join(destination_dir, file_name)}.")
+    save_manifest(destination_dir, remote)
+    result = {"downloaded" : len(changed), "unchanged" : len(remote) - len(changed), "deleted" : len(deleted)}
+    print(result)
+    return result
+
+def watch_directory(storage_client, bucket_name : str, prefix : str, destination_dir : str,
+                    poll_seconds : int = POLL_SECONDS, max_workers : int = MAX_WORKERS):
+    """Sync the directory every poll interval until interrupted"""
+    while True:
+        try:
+            sync_directory(storage_client, bucket_name, prefix, destination_dir, max_workers)
+        except Exception as e:
+            # a failed poll(network, a report rewritten during the download) is retried at the next poll
+            print(f"sync failed: {e}")
+        time.sleep(poll_seconds)
+
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--gcp_key_path", type=str)
     parser.add_argument("--variable_path", type=str)
-    
+    parser.add_argument("--sync", action="store_true", help="download only the reports that changed since the last sync")
+    parser.add_argument("--watch", action="store_true", help="keep syncing the reports every poll interval")
+    parser.add_argument("--poll_seconds", type=int, default=POLL_SECONDS, help="the poll interval of the watch mode")
+    parser.add_argument("--max_workers", type=int, default=MAX_WORKERS, help="the number of concurrent downloads")
+
     args = parser.parse_args()
-    # initialize the storage 
+    # initialize the storage
     if not Path(args.gcp_key_path).exists():
         raise FileNotFoundError("GCP Key File is not found")
     credentials = service_account.Credentials.from_service_account_file(args.gcp_key_path)
@@ -36,10 +132,24 @@ def main():
     except:
         raise FileExistsError("Json file problem")
     print(json_dir["report_bucket"], json_dir["directory"])
-    download_directory(storage_client, 
+    if args.watch:
+        watch_directory(storage_client,
+                        bucket_name=json_dir["report_bucket"],
+                        prefix=json_dir["directory"],
+                        destination_dir=DATA_DIR,
+                        poll_seconds=args.poll_seconds,
+                        max_workers=args.max_workers)
+    elif args.sync:
+        sync_directory(storage_client,
                        bucket_name=json_dir["report_bucket"],
                        prefix=json_dir["directory"],
-                       destination_dir="data/")
+                       destination_dir=DATA_DIR,
+                       max_workers=args.max_workers)
+    else:
+        download_directory(storage_client,
+                           bucket_name=json_dir["report_bucket"],
+                           prefix=json_dir["directory"],
+                           destination_dir=DATA_DIR)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
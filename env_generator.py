@@ -60,7 +60,7 @@ def get_service_account_email():
     return {"service_account_email" : service_account_email}
 
 def resources_prompt():
-    """Get the number of vms and worknodes in the project"""
+    """Get the number of vms, worknodes and image vms in the project"""
     n_vms = input("Number of VM instances(Default to 2): ")
     if len(n_vms) == 0:
         n_vms = 2
@@ -69,7 +69,12 @@ def resources_prompt():
     if len(n_worknodes) == 0:
        n_worknodes = 2
     n_worknodes = int(n_worknodes)
-    return {"n_vms" : n_vms, "n_worknodes" : n_worknodes}
+    # the image VMs need no reddit client, 0 scrapes the images on the VM instances
+    n_image_vms = input("Number of image scraping VM instances(Default to 0): ")
+    if len(n_image_vms) == 0:
+        n_image_vms = 0
+    n_image_vms = int(n_image_vms)
+    return {"n_vms" : n_vms, "n_worknodes" : n_worknodes, "n_image_vms" : n_image_vms}
 
 def subreddit_prompt() -> str:
     """Get the subreddits on the dashboard
@@ -104,8 +109,9 @@ def sanity_check(input_dict : dict):
     # start checking
     if len(reddit_client_ids) != len(reddit_client_secrets):
         raise AssertionError("The length of client id is equal to client secrets")
-    if n_vms != len(reddit_client_ids):
-        raise AssertionError("the number of vm should be equal to number of vms")
+    # every VM scrapes with its own reddit client, the spare clients are unused
+    if not 1 <= n_vms <= len(reddit_client_ids):
+        raise AssertionError(f"the number of vms should be between 1 and the number of reddit clients({len(reddit_client_ids)})")
     return True
 
 def write_docker_compose(docker_username : str, AIRFLOW_UID :int =1000, AIRFLOW_GID :int =0):
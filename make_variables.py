@@ -14,6 +14,7 @@ TERRAFORM_BUCKETS = [
     "spark_bucket"
 ]
 TERRAFORM_VM_SSHS = "internal_ip_addresses"  
+TERRAFORM_IMAGE_VM_SSHS = "image_internal_ip_addresses"
 TERRAFORM_CLUSTER_NAME = "cluster_name"
 TERRAFORM_REGION = "region"
 TERRAFORM_GPU_VM_NAME = "gpu_vm_name"
@@ -41,6 +42,8 @@ def get_terraform_json(terraforn_json_path : str) -> dict:
     }
     return_dict[TERRAFORM_VM_SSHS] = terraform_dict[TERRAFORM_VM_SSHS]["value"]
     return_dict["n_ssh_connections"] = len(return_dict[TERRAFORM_VM_SSHS])
+    # the image scraping VMs, none before image_machine_count is planned
+    return_dict[TERRAFORM_IMAGE_VM_SSHS] = terraform_dict.get(TERRAFORM_IMAGE_VM_SSHS, {"value" : []})["value"]
     return_dict[TERRAFORM_CLUSTER_NAME] = terraform_dict[TERRAFORM_CLUSTER_NAME]["value"] 
     return_dict[TERRAFORM_REGION] = terraform_dict[TERRAFORM_REGION]["value"]
     return_dict[TERRAFORM_GPU_VM_NAME] = terraform_dict[TERRAFORM_GPU_VM_NAME]["value"]
@@ -80,6 +83,8 @@ def main():
     parser.add_argument("--terraform_path", required=True, type=str, help="the terraform json path")
     parser.add_argument("--ssh_public_key_path", type=str, required=True, help="the ssh public key path")
     parser.add_argument("--output_path", required=True, type=str, help="the output file path")
+    parser.add_argument("--report_backend", type=str, default="bigquery", choices=["bigquery", "duckdb"], help="where the report queries run")
+    parser.add_argument("--previous_directory", type=str, default=None, help="the directory of the previous run, its run manifests balance the scraping")
     args = parser.parse_args()
     reddit_dict = get_reddit_json(args.reddit_path)
     terraform_dict = get_terraform_json(args.terraform_path)
@@ -96,6 +101,9 @@ def main():
     json_dict.update(ssh_dict)
     json_dict.update(date_dir)
     json_dict.update(generate_docker_variable())
+    json_dict["report_backend"] = args.report_backend
+    if args.previous_directory is not None:
+        json_dict["previous_directory"] = args.previous_directory
     print(json_dict)
     with open(args.output_path, 'w') as json_file:
         json.dump(json_dict, json_file)
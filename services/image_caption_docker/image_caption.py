@@ -1,13 +1,18 @@
-from transformers import VisionEncoderDecoderModel, ViTImageProcessor, AutoTokenizer
-import torch
+from __future__ import annotations
 from pathlib import Path
-import pandas as pd 
-from PIL import Image
-from google.cloud import storage
-from google.oauth2 import service_account
+from typing import TYPE_CHECKING
 import argparse
 import os
 
+from parquet_config import write_parquet
+import tracing
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# torch, transformers, PIL, pandas and google-cloud are imported by the functions that use them,
+# --help and argument errors return before the model libraries load
+
 # Idea:
 # download the image meta to local storage
 # Generate the image caption from the image
@@ -26,6 +31,8 @@ def cloud_storage_initialize(gcp_path :str = GCP_PATH):
     Args: gcp_path: the gcp_key path for initializing the gcp cloud storage
     Returns: the storage client
     """
+    from google.cloud import storage
+    from google.oauth2 import service_account
     credentials = service_account.Credentials.from_service_account_file(gcp_path)
     storage_client = storage.Client(credentials=credentials) 
     return storage_client
@@ -39,6 +46,7 @@ def get_image_meta(storage_client, image_bucket_name : str, date_directory : str
     Returns:
         pd.DataFrame: the pandas dataframe
     """
+    import pandas as pd
     local_image_dir = Path(LOCAL_IMAGE_DIR)
     if not local_image_dir.exists():
         local_image_dir.mkdir(parents=True)
@@ -76,6 +84,8 @@ def model_initialization():
     """
         Initialize the model
     """
+    import torch
+    from transformers import VisionEncoderDecoderModel, ViTImageProcessor, AutoTokenizer
     try:
         model = VisionEncoderDecoderModel.from_pretrained("nlpconnect/vit-gpt2-image-captioning")
         feature_extractor = ViTImageProcessor.from_pretrained("nlpconnect/vit-gpt2-image-captioning")
@@ -109,6 +119,7 @@ def single_image_caption(storage_client, image_bucket_name : str, cloud_image_pa
     Returns:
         str: a string representing the caption of the image
     """ 
+    from PIL import Image
     image_path = get_image(storage_client, image_bucket_name, cloud_image_path) 
     print("working on the image path: ", image_path)
     return_val = ""
@@ -129,25 +140,33 @@ def single_image_caption(storage_client, image_bucket_name : str, cloud_image_pa
     return return_val
 
 
-def main(image_bucket_name : str, date_directory : str,image_meta_path : str):
-    storage_client = cloud_storage_initialize()
-    image_meta_df = get_image_meta(storage_client, image_bucket_name, date_directory, image_meta_path)
-    model, feature_extractor, tokenizer, gen_kwargs, device = model_initialization()
+def main(image_bucket_name : str, date_directory : str,image_meta_path : str, storage_client = None):
+    if storage_client is None:
+        storage_client = cloud_storage_initialize()
+    with tracing.span("download_image_meta"):
+        image_meta_df = get_image_meta(storage_client, image_bucket_name, date_directory, image_meta_path)
+    tracing.current_span().set(rows_in = len(image_meta_df))
+    with tracing.span("model_initialization"):
+        model, feature_extractor, tokenizer, gen_kwargs, device = model_initialization()
     # generate the image caption
-    image_meta_df["image_caption"] = image_meta_df \
-        .apply(
-            lambda cur_row : single_image_caption(storage_client, image_bucket_name, cur_row["image_path"],
-                                                  model, feature_extractor, tokenizer, device, gen_kwargs)
-            ,axis = 1
-        )
+    with tracing.span("caption", rows_in = len(image_meta_df), device = str(device)):
+        image_meta_df["image_caption"] = image_meta_df \
+            .apply(
+                lambda cur_row : single_image_caption(storage_client, image_bucket_name, cur_row["image_path"],
+                                                      model, feature_extractor, tokenizer, device, gen_kwargs)
+                ,axis = 1
+            )
     # upload the dataframe to the cloud  
-    image_meta_df.to_parquet(LOCAL_IMAGE_CAPTION_WRITE_PATH)
-    print("write to local parquet path:", LOCAL_IMAGE_CAPTION_WRITE_PATH)
-    image_bucket = storage_client.bucket(image_bucket_name)
-    image_cloud_write_path = f"{date_directory}/{CLOUD_IMAGE_CAPTION_WRITE_PATH}"
-    print("write to cloud storage with cloud storage: ", image_cloud_write_path)
-    image_df_blob = image_bucket.blob(image_cloud_write_path)
-    image_df_blob.upload_from_filename(LOCAL_IMAGE_CAPTION_WRITE_PATH)
+    with tracing.span("upload_image_caption"):
+        write_parquet(image_meta_df, LOCAL_IMAGE_CAPTION_WRITE_PATH)
+        print("write to local parquet path:", LOCAL_IMAGE_CAPTION_WRITE_PATH)
+        image_bucket = storage_client.bucket(image_bucket_name)
+        image_cloud_write_path = f"{date_directory}/{CLOUD_IMAGE_CAPTION_WRITE_PATH}"
+        print("write to cloud storage with cloud storage: ", image_cloud_write_path)
+        image_df_blob = image_bucket.blob(image_cloud_write_path)
+        image_df_blob.upload_from_filename(LOCAL_IMAGE_CAPTION_WRITE_PATH)
+    tracing.current_span().set(rows_out = int((image_meta_df["image_caption"] != "").sum()),
+                               bytes_out = os.path.getsize(LOCAL_IMAGE_CAPTION_WRITE_PATH))
 
     
 if __name__ == "__main__":
@@ -157,4 +176,5 @@ if __name__ == "__main__":
     parser.add_argument("--image_meta_path", type=str, required=True, help="the combined image path")
 
     args=parser.parse_args()
-    main(args.image_bucket_name, args.date_directory, args.image_meta_path)
\ No newline at end of file
+    with tracing.span("generate_image_caption", directory=args.date_directory):
+        main(args.image_bucket_name, args.date_directory, args.image_meta_path)
\ No newline at end of file
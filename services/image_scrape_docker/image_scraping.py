@@ -1,38 +1,55 @@
 # IDEA: there are k vm instances. this is i the vm. if the idx % k == i, scrape the image and put it into path
 import argparse
 import io
-import requests
-import pandas as pd 
-import numpy as np
-import os 
+from functools import lru_cache
 from pathlib import Path
-from google.cloud import storage
-from google.oauth2 import service_account
+
+from segment_log import SegmentLog, IMAGE_META_STREAM, POLL_SECONDS
+import tracing
+
+# requests, pandas, numpy and google-cloud are imported by the functions that use them
+# the warm worker imports HEAVY_MODULES when it starts
+HEAVY_MODULES = ["requests", "pandas", "numpy", "google.cloud.storage"]
 
 GCP_JSON = "./gcp_key.json"
 
+@lru_cache(maxsize=None)
 def initialize_storage_client(gcp_path):
-    # initialize the storage client from the gcp_path
+    # initialize the storage client from the gcp_path, cached for the jobs of a warm worker
+    from google.cloud import storage
+    from google.oauth2 import service_account
     credentials = service_account.Credentials.from_service_account_file(gcp_path)
     storage_client = storage.Client(credentials=credentials) 
     return storage_client
 
+@lru_cache(maxsize=None)
+def http_session():
+    # keep the connections to the image hosts alive between the images(and the jobs of a warm worker)
+    import requests
+    return requests.Session()
+
 def scrape_image(storage_client, image_url : str, storage_bucket : str,
                  cloud_image_path : str, local_storage_dir : str):
     local_path = Path(local_storage_dir) / Path(cloud_image_path).name
     try:
-        response = requests.get(image_url, timeout=15)
+        response = http_session().get(image_url, timeout=15)
         if response.status_code == 200:
             with open(local_path, "wb") as f:
                 f.write(response.content)
             bucket = storage_client.bucket(storage_bucket)
             blob = bucket.blob(cloud_image_path)
             blob.upload_from_filename(str(local_path))
+            tracing.current_span().add(rows_out = 1, bytes_out = len(response.content))
     except Exception:
         return None
 
 
-def image_scrape_main(n_vm_instances : int, vm_idx : int, storage_bucket : str, directory : str, local_storage_dir = "images"):
+def image_paths(directory : str, image_urls):
+    """The image path of every image url, the same path the image merge adds(dataproc_merge_files.combine_file)"""
+    return image_urls.apply(lambda image_url : f"{directory}/images/{image_url.split('/')[-1]}")
+
+def image_scrape_main(n_vm_instances : int, vm_idx : int, storage_bucket : str, directory : str, local_storage_dir = "images",
+                      storage_client = None):
     """
         Scrape the image given that meta data is stored at storage_bucket/combined/combined.parquet
     Args:
@@ -40,11 +57,15 @@ def image_scrape_main(n_vm_instances : int, vm_idx : int, storage_bucket : str,
         vm_idx (int): the current vm index
         storage_bucket (str): storage bucket for the meta image data
         local_storage_dir (str, optional): the local storage path Defaults to "images".
+        storage_client (optional): the storage client. Defaults to the client of GCP_JSON.
     """
+    import numpy as np
+    import pandas as pd
     # feaures image_path, image_url
     # scrape the image at image url and put it into image path
     # initialize the storage client
-    storage_client = initialize_storage_client(GCP_JSON)
+    if storage_client is None:
+        storage_client = initialize_storage_client(GCP_JSON)
     bucket = storage_client.bucket(storage_bucket)
     # make the local image storage
     local_storage_dir = Path(local_storage_dir)
@@ -60,18 +81,63 @@ def image_scrape_main(n_vm_instances : int, vm_idx : int, storage_bucket : str,
     # assign the specified rows into the vm
     rows_idx = (np.arange(n_rows) % n_vm_instances) == vm_idx
     df = df.iloc[rows_idx, :]
+    tracing.current_span().set(rows_in = len(df))
     df.apply(lambda cur_row : scrape_image(storage_client,
                                            cur_row["image_url"],
                                            storage_bucket,
                                            cur_row["image_path"],
                                            str(local_storage_dir)), axis = 1)
 
-if __name__ == "__main__":
+def image_scrape_stream_main(n_vm_instances : int, vm_idx : int, storage_bucket : str, directory : str, local_storage_dir = "images",
+                             storage_client = None, poll_seconds : float = POLL_SECONDS, stream_token : str = None):
+    """
+        Scrape the images of the image log of the directory while the scraper is still appending to it
+        The vm scrapes the segments with offset % n_vm_instances == vm_idx, every segment is a span
+    Args:
+        n_vm_instances (int): total number of vm instances available
+        vm_idx (int): the current vm index
+        storage_bucket (str): storage bucket for the image log and the images
+        local_storage_dir (str, optional): the local storage path Defaults to "images".
+        storage_client (optional): the storage client. Defaults to the client of GCP_JSON.
+        poll_seconds (float, optional): the wait for the next segment. Defaults to POLL_SECONDS.
+        stream_token (str, optional): the token of the run, only its scraper closes the log. Defaults to None.
+    """
+    import pandas as pd
+    if storage_client is None:
+        storage_client = initialize_storage_client(GCP_JSON)
+    local_storage_dir = Path(local_storage_dir)
+    local_storage_dir.mkdir(parents=True, exist_ok=True)
+    image_log = SegmentLog(storage_client, storage_bucket, IMAGE_META_STREAM.format(directory = directory), stream_token)
+    stage_span = tracing.current_span()
+    for offset, blob in image_log.consume(f"image_scraping-{vm_idx}-of-{n_vm_instances}", poll_seconds):
+        if offset % n_vm_instances != vm_idx:
+            continue
+        with tracing.span("image_segment", offset = offset) as segment_span:
+            df = pd.read_parquet(io.BytesIO(blob.download_as_bytes()))
+            df["image_path"] = image_paths(directory, df["image_url"])
+            segment_span.set(rows_in = len(df))
+            for image_url, image_path in zip(df["image_url"], df["image_path"]):
+                scrape_image(storage_client, image_url, storage_bucket, image_path, str(local_storage_dir))
+        stage_span.add(rows_in = len(df), rows_out = segment_span.attributes.get("rows_out", 0),
+                       bytes_out = segment_span.attributes.get("bytes_out", 0), segments_in = 1)
+
+def main(argv : list[str] = None):
+    # the warm worker passes the argv of its job
     parser = argparse.ArgumentParser()
     parser.add_argument("--n_vm_instances", type=int, required=True, help="Numer of instances in the cloud")
     parser.add_argument("--vm_idx", type=int, required=True, help = "the current vm index")
     parser.add_argument("--storage_bucket", type=str, required=True, help = "the storage bucket")
     parser.add_argument("--directory", type=str, required=True, help="the directory with format start_date-end_date")
-    args = parser.parse_args()
-    image_scrape_main(args.n_vm_instances, args.vm_idx, args.storage_bucket, args.directory)
+    parser.add_argument("--stream", action="store_true", help="scrape the image log of the directory while it is written")
+    parser.add_argument("--stream_token", type=str, default=None, help="the token of the run shared with the scraper of the image log")
+    args = parser.parse_args(argv)
+    with tracing.span("image_scraping", vm_idx=args.vm_idx, directory=args.directory):
+        if args.stream:
+            image_scrape_stream_main(args.n_vm_instances, args.vm_idx, args.storage_bucket, args.directory,
+                                     stream_token = args.stream_token)
+        else:
+            image_scrape_main(args.n_vm_instances, args.vm_idx, args.storage_bucket, args.directory)
+
+if __name__ == "__main__":
+    main()
     
\ No newline at end of file
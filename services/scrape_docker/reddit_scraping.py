@@ -1,14 +1,22 @@
-from datetime import datetime
-from dateutil import tz
+from __future__ import annotations
+from datetime import datetime, timezone
+from functools import lru_cache
 from pathlib import Path
-import pandas as pd
-import praw
 from time import sleep
+from typing import TYPE_CHECKING
 from zoneinfo import ZoneInfo
 from argparse import ArgumentParser
-from google.cloud import storage
-from google.oauth2 import service_account
 
+from parquet_config import write_parquet
+from segment_log import SegmentLog, IMAGE_META_STREAM
+import tracing
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# pandas, praw and google-cloud are imported by the functions that use them, --help and argument errors return at once
+# the warm worker imports HEAVY_MODULES when it starts, so its jobs never pay for them
+HEAVY_MODULES = ["pandas", "praw", "google.cloud.storage"]
 SLEEPTIME=6 # Avoid the reddit api limit
 LOCAL_STORAGE = "./local_storage/"
 
@@ -28,8 +36,11 @@ meta_author_fields = [
     "id",
     "name",
 ]
+@lru_cache(maxsize=None)
 def reddit_initialization(client_id:str, client_secret:str):
-    '''initialize the reddit credential with a json format'''
+    '''initialize the reddit credential with a json format
+    cached, the jobs of a warm worker reuse the instance(and its session) of the client id'''
+    import praw
     reddit = praw.Reddit(
         client_id=client_id,
         client_secret=client_secret,
@@ -37,6 +48,7 @@ def reddit_initialization(client_id:str, client_secret:str):
     )
     return reddit
 
+@lru_cache(maxsize=None)
 def cloud_storage_init(gcp_path : str = "./gcp_key.json"):
     """Initialize the google storage client
 
@@ -46,6 +58,8 @@ def cloud_storage_init(gcp_path : str = "./gcp_key.json"):
     Returns:
         _type_: the storage client
     """
+    from google.cloud import storage
+    from google.oauth2 import service_account
     credentials = service_account.Credentials.from_service_account_file(gcp_path)
     storage_client = storage.Client(credentials=credentials)
     return storage_client
@@ -60,19 +74,30 @@ def store_data(cloud_client, bucket_name : str, dir_path : str, df : pd.DataFram
         dir (str): the direcotory on the google cloud
         df : the dataframe
         file_name : str
+    Returns:
+        str: the local parquet file
     """
     # 1
     local_storage_path = Path(LOCAL_STORAGE)
     if not local_storage_path.exists():
         local_storage_path.mkdir(parents=True)
     local_file_path = local_storage_path / file_name
-    df.to_parquet(local_file_path)
+    write_parquet(df, str(local_file_path))
     # 2
     dir_path = Path(dir_path)
     destination_path = dir_path / file_name
     bucket = cloud_client.bucket(bucket_name)
     blob = bucket.blob(str(destination_path))
     blob.upload_from_filename(str(local_file_path))
+    tracing.current_span().add(rows_out = len(df), bytes_out = local_file_path.stat().st_size, files_out = 1)
+    return str(local_file_path)
+
+def store_image_data(cloud_client, bucket_name : str, dir_path : str, df : pd.DataFrame, file_name : str, image_log : SegmentLog = None):
+    """Store the image chunk like store_data and append it to the image log, the image scraping starts on it at once"""
+    local_file_path = store_data(cloud_client, bucket_name, dir_path, df, file_name)
+    if image_log is not None:
+        image_log.append(local_file_path)
+        tracing.current_span().add(segments_out = 1)
 
 # def check_if_directory_empty(storage_client, directory:str, bucket_name: str):
 #     blobs = storage_client.list_blobs(bucket_name, prefix=directory)
@@ -106,7 +131,7 @@ def convert_utc_time(sub_dict, time_str) -> dict:
     '''
     utc_time = sub_dict[time_str]
     cur_time_zone = ZoneInfo('America/Los_Angeles')
-    create_date= pd.to_datetime(utc_time, utc=True, unit='s').astimezone(cur_time_zone).date()
+    create_date= datetime.fromtimestamp(utc_time, tz=timezone.utc).astimezone(cur_time_zone).date()
     del sub_dict[time_str]
     sub_dict["create_date"] = create_date
     return sub_dict
@@ -192,7 +217,7 @@ def print_status(post_date, meta_lst : list[dict], image_lst : list[dict], text_
 def scrape(reddit_instance, storage_client, subreddit_name : str, 
            image_bucket : str, text_bucket : str, meta_bucket : str,
            directory : str,
-           time_upper : str, time_lower : str, thres : int = 50):
+           time_upper : str, time_lower : str, thres : int = 50, image_log : SegmentLog = None):
     """Scrap the subreddit ucla posts and comment
 
     Args:
@@ -205,9 +230,14 @@ def scrape(reddit_instance, storage_client, subreddit_name : str,
         directory (str) : the directory under the bucket
         time_upper (str): the time constraint: upper bound
         time_lower (str): the time constraint: loewr bound
+        image_log (SegmentLog, optional): the log the image chunks are appended to, reset first and closed after the last chunk
     Returns:
         _type_: _description_
     """
+    import pandas as pd
+    if image_log is not None:
+        # a rerun or a retry appends to the same log, drop the _CLOSED and the offsets of the run before
+        image_log.reset()
     recent_posts  = reddit_instance.subreddit(subreddit_name).new(limit=None)
     meta_lst, text_lst, image_lst = [], [], []
     time_upper, time_lower = pd.to_datetime(time_upper).date(), pd.to_datetime(time_lower).date()
@@ -236,6 +266,7 @@ def scrape(reddit_instance, storage_client, subreddit_name : str,
         post.comments.replace_more(limit=None)
         parent_id = post_dict["id"]
         print_status(post_dict["create_date"], meta_lst, image_lst, text_lst)
+        tracing.current_span().add(posts = 1, comments = len(post.comments))
         for comment in post.comments:
             sleep(SLEEPTIME)
             comment_dict = extract_comment(comment, parent_id, meta_comments_fields, meta_author_fields)
@@ -262,7 +293,7 @@ def scrape(reddit_instance, storage_client, subreddit_name : str,
         if len(image_lst) >= thres:
             df = pd.DataFrame(image_lst)
             file_name = f"{subreddit_name}-text-{image_cnt}.parquet" 
-            store_data(storage_client, image_bucket, directory, df, file_name)
+            store_image_data(storage_client, image_bucket, directory, df, file_name, image_log)
             image_cnt += 1
             image_lst.clear()
 
@@ -282,12 +313,14 @@ def scrape(reddit_instance, storage_client, subreddit_name : str,
     if len(image_lst) > 0:
         df = pd.DataFrame(image_lst)
         file_name = f"{subreddit_name}-image-{image_cnt}.parquet" 
-        store_data(storage_client, image_bucket, directory, df, file_name)
+        store_image_data(storage_client, image_bucket, directory, df, file_name, image_log)
         image_cnt += 1
         image_lst.clear()
+    if image_log is not None:
+        image_log.close()
 
-def main():
-    # parse the argument into the function
+def main(argv : list[str] = None):
+    # parse the argument into the function, the warm worker passes the argv of its job
     parser = ArgumentParser(description="reddit scraping")
     parser.add_argument("--client_id", type=str, required=True, help="the reddit instance client id")
     parser.add_argument("--client_secret", type=str, required=True,help="the reddit client secrete")
@@ -298,17 +331,23 @@ def main():
     parser.add_argument("--image_bucket", type=str, required=True,help="the image bucket in the google cloud")
     parser.add_argument("--text_bucket", type=str, required=True,help="the text bucket in the google cloud")
     parser.add_argument("--meta_bucket", type=str, required=True,help="the meta bucket in the google cloud")
-    args = parser.parse_args()
+    parser.add_argument("--image_stream", action="store_true", help="append the image chunks to the image log of the directory")
+    parser.add_argument("--stream_token", type=str, default=None, help="the token of the run shared with the image scraping of the image log")
+    args = parser.parse_args(argv)
 
     # Initialize the instance
     reddit_instance = reddit_initialization(args.client_id, args.client_secret)
     storage_client = cloud_storage_init()
     # if not check_if_directory_empty(storage_client, args.directory, args.meta_bucket): # NOT EMPTY
     #     return None
+    image_log = None
+    if args.image_stream:
+        image_log = SegmentLog(storage_client, args.image_bucket, IMAGE_META_STREAM.format(directory = args.directory), args.stream_token)
     # scrape the reddit
-    scrape(reddit_instance, storage_client, 
-           args.subreddit, args.image_bucket, args.text_bucket, args.meta_bucket,
-           args.directory, args.end_date, args.start_date)
+    with tracing.span("scraping", subreddit=args.subreddit, directory=args.directory):
+        scrape(reddit_instance, storage_client, 
+               args.subreddit, args.image_bucket, args.text_bucket, args.meta_bucket,
+               args.directory, args.end_date, args.start_date, image_log = image_log)
 
 
 if __name__ == "__main__":
@@ -1,11 +1,12 @@
-from transformers import pipeline
-import torch
 from pathlib import Path
-import pandas as pd 
-from google.cloud import storage
-from google.oauth2 import service_account
 import argparse
 
+from parquet_config import write_parquet
+import tracing
+
+# torch, transformers, pandas and google-cloud are imported by the functions that use them,
+# --help and argument errors return before the model libraries load
+
 GCP_PATH = "./gcp_key.json"
 LOCAL_STORAGE_PATH = "./text_image.parquet"
 LOCAL_SENTIMENT_PATH = "./text_sentiment.parquet"
@@ -15,6 +16,8 @@ def initialize_pipeline():
     Returns:
         _type_: _description_
     """
+    import torch
+    from transformers import pipeline
     device = None 
     if torch.backends.mps.is_available():
         device = torch.device("mps")
@@ -28,6 +31,7 @@ def initialize_pipeline():
 
 def predict_sentiment(sentiment_pipeline, texts):
     """Generate the label and map the label to score"""
+    import pandas as pd
     senti_map = {"POS" : 1, "NEU" : 0, "NEG" : -1}
     return pd.Series(sentiment_pipeline(texts)).apply(lambda x:senti_map[x["label"]])
 
@@ -40,17 +44,21 @@ def sentiment_main(combined_text_path : str) -> str:
     RETURNS:
         str: the path that contains the sentiment score
     """
-    sentiment_pipeline = initialize_pipeline()
+    import pandas as pd
+    with tracing.span("model_initialization"):
+        sentiment_pipeline = initialize_pipeline()
     combined_text_path = Path(combined_text_path)
     if not combined_text_path.exists():
         raise FileExistsError(f"the file {combined_text_path} does not exist")
     # read the data into the dataframe
     combined_text_df = pd.read_parquet(str(combined_text_path))
     text_lst = list(combined_text_df["text"].apply(lambda x:x[:120]))
-    sentiment = predict_sentiment(sentiment_pipeline, text_lst)
+    with tracing.span("predict_sentiment", rows_in = len(text_lst)):
+        sentiment = predict_sentiment(sentiment_pipeline, text_lst)
     combined_text_df["sentiment"] = sentiment 
+    tracing.current_span().set(rows_in = len(combined_text_df), rows_out = len(combined_text_df))
     # Save the files into a new directory
-    combined_text_df.to_parquet(LOCAL_SENTIMENT_PATH) 
+    write_parquet(combined_text_df, LOCAL_SENTIMENT_PATH)
     return LOCAL_SENTIMENT_PATH
 
 def cloud_storage_initialize(gcp_path :str = GCP_PATH):
@@ -58,18 +66,20 @@ def cloud_storage_initialize(gcp_path :str = GCP_PATH):
     Args: gcp_path: the gcp_key path for initializing the gcp cloud storage
     Returns: the storage client
     """
+    from google.cloud import storage
+    from google.oauth2 import service_account
     credentials = service_account.Credentials.from_service_account_file(gcp_path)
     storage_client = storage.Client(credentials=credentials)
     return storage_client
 
-def get_image_meta(storage_client, text_bucket_name : str, date_directory : str, image_text_path : str) -> pd.DataFrame:
+def get_image_meta(storage_client, text_bucket_name : str, date_directory : str, image_text_path : str) -> str:
     """get the image meta from the google cloud
     Args:
         storage_client (_type_): the storage client just initialized 
         text_bucket_name (str): the text bucket name on gcp 
         image_text_path (str): the combined image text path
     Returns:
-        pd.DataFrame: the pandas dataframe
+        str: the local path of the combined image text
     """
     text_bucket = storage_client.bucket(text_bucket_name)
     blob_path = f"{date_directory}/{image_text_path}"
@@ -89,11 +99,17 @@ def upload_to_cloud(storage_client, local_file_path : str, output_bucket_name :
     output_blob = output_bucket.blob(write_path)
     output_blob.upload_from_filename(local_file_path)
 
-def main(text_bucket_name : str, date_directory : str, image_text_path : str, output_bucket_name : str, output_path : str):
-    storage_client = cloud_storage_initialize()
-    local_image_text_path = get_image_meta(storage_client, text_bucket_name, date_directory, image_text_path)
+def main(text_bucket_name : str, date_directory : str, image_text_path : str, output_bucket_name : str, output_path : str,
+         storage_client = None):
+    if storage_client is None:
+        storage_client = cloud_storage_initialize()
+    with tracing.span("download_image_text"):
+        local_image_text_path = get_image_meta(storage_client, text_bucket_name, date_directory, image_text_path)
     local_text_sentiment_path = sentiment_main(local_image_text_path)
-    upload_to_cloud(storage_client, local_text_sentiment_path, output_bucket_name, date_directory, output_path)
+    with tracing.span("upload_sentiment"):
+        upload_to_cloud(storage_client, local_text_sentiment_path, output_bucket_name, date_directory, output_path)
+    tracing.current_span().set(bytes_in = Path(local_image_text_path).stat().st_size,
+                               bytes_out = Path(local_text_sentiment_path).stat().st_size)
 
 
 if __name__ == "__main__":
@@ -104,4 +120,5 @@ if __name__ == "__main__":
     parser.add_argument("--output_bucket_name", type=str, required=True, help="the output bucketname")
     parser.add_argument("--output_path", type=str, required=True, help = "the output path")
     args = parser.parse_args()
-    main(args.text_bucket_name, args.date_directory, args.image_text_path, args.output_bucket_name, args.output_path)
+    with tracing.span("sentiment_analysis", directory=args.date_directory):
+        main(args.text_bucket_name, args.date_directory, args.image_text_path, args.output_bucket_name, args.output_path)
@@ -147,6 +147,24 @@ resource "google_compute_instance" "airflow" {
   }
 }
 
+# the docker setup of the scrape and image VMs
+locals {
+  vm_startup_script = <<EOT
+      #!/bin/bash
+      sudo apt-get update
+      sudo apt-get install -y ca-certificates curl gnupg
+      sudo install -m 0755 -d /etc/apt/keyrings
+      curl -fsSL https://download.docker.com/linux/debian/gpg | sudo gpg --dearmor -o /etc/apt/keyrings/docker.gpg
+      sudo chmod a+r /etc/apt/keyrings/docker.gpg
+
+      echo "deb [arch=$(dpkg --print-architecture) signed-by=/etc/apt/keyrings/docker.gpg] https://download.docker.com/linux/debian $(. /etc/os-release && echo \"$VERSION_CODENAME\") stable" | sudo tee /etc/apt/sources.list.d/docker.list > /dev/null
+      sudo apt-get update
+      sudo apt-get install -y docker-ce docker-ce-cli containerd.io docker-buildx-plugin docker-compose-plugin
+      sudo apt-get install python3-pip
+      sudo docker login --username ${var.docker_username} --password ${var.docker_password}
+  EOT
+}
+
 resource "google_compute_instance" "scraping_machine" {
   count = var.scrape_machine_count
   name = "scraping-machine-${count.index}"
@@ -169,20 +187,38 @@ resource "google_compute_instance" "scraping_machine" {
     "ssh-keys" = <<EOT
       airflow:${var.ssh_public} 
      EOT
-    "startup-script" = <<EOT
-      #!/bin/bash
-      sudo apt-get update
-      sudo apt-get install -y ca-certificates curl gnupg
-      sudo install -m 0755 -d /etc/apt/keyrings
-      curl -fsSL https://download.docker.com/linux/debian/gpg | sudo gpg --dearmor -o /etc/apt/keyrings/docker.gpg
-      sudo chmod a+r /etc/apt/keyrings/docker.gpg
+    "startup-script" = local.vm_startup_script
+  }
+  service_account {
+    email = var.service_account_email
+    scopes = ["cloud-platform"]
+  }
+}
 
-      echo "deb [arch=$(dpkg --print-architecture) signed-by=/etc/apt/keyrings/docker.gpg] https://download.docker.com/linux/debian $(. /etc/os-release && echo \"$VERSION_CODENAME\") stable" | sudo tee /etc/apt/sources.list.d/docker.list > /dev/null
-      sudo apt-get update
-      sudo apt-get install -y docker-ce docker-ce-cli containerd.io docker-buildx-plugin docker-compose-plugin
-      sudo apt-get install python3-pip
-      sudo docker login --username ${var.docker_username} --password ${var.docker_password}
-    EOT 
+# the image scraping needs no reddit client, so its VMs scale apart from the scraping machines
+resource "google_compute_instance" "image_scraping_machine" {
+  count = var.image_machine_count
+  name = "image-scraping-machine-${count.index}"
+  machine_type = var.image_machine_type
+  zone = var.zone
+  allow_stopping_for_update = true
+  boot_disk {
+    initialize_params {
+      image = "debian-cloud/debian-11"
+      size = 15
+    }
+  }
+  network_interface {
+    network = google_compute_network.internal.name 
+    access_config {
+      
+    }
+  }
+  metadata = {
+    "ssh-keys" = <<EOT
+      airflow:${var.ssh_public} 
+     EOT
+    "startup-script" = local.vm_startup_script
   }
   service_account {
     email = var.service_account_email
@@ -5,6 +5,9 @@ output "airflow_external_ip" {
 output "internal_ip_addresses" {
   value = [for instance in google_compute_instance.scraping_machine : instance.network_interface[0].network_ip]
 }
+output "image_internal_ip_addresses" {
+  value = [for instance in google_compute_instance.image_scraping_machine : instance.network_interface[0].network_ip]
+}
 output "image_bucket" {
   value = google_storage_bucket.image.name
 }
@@ -31,6 +31,16 @@ variable "scrape_machine_count" {
   description = "the number scraping machines"
 }
 
+variable "image_machine_type" {
+  description = "The type of the image scraping instances"
+  default     = "e2-small"
+}
+
+variable "image_machine_count" {
+  description = "the number of image scraping machines, 0 scrapes the images on the scraping machines"
+  default     = 0
+}
+
 variable "worker_node_count" {
   description = "the number of worker node in dataproc"
 }
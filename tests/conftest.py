@@ -0,0 +1,43 @@
+import sys
+from datetime import date
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+# the etl package lives under airflows/scripts, like in the airflow image(/opt/airflow/scripts)
+sys.path.append(str(Path(__file__).resolve().parents[1] / "airflows" / "scripts"))
+
+# a small merged meta text table(meta_text_merge/meta_text.parquet) of two subreddits and days
+META_TEXT_ROWS = [
+    # id, subreddit, create_date, authorname, parent, score, sentiment, text
+    ("p1", "ucla", date(2024, 1, 1), "alice", None, 50, 1, "0123456789" * 8),
+    ("p2", "ucla", date(2024, 1, 1), "bob", None, 30, -1, "Short post"),
+    ("p3", "berkeley", date(2024, 1, 2), "carol", None, 40, 0, "Berkeley post"),
+    ("c1", "ucla", date(2024, 1, 1), "bob", "p1", 5, 1, "nice"),
+    ("c3", "berkeley", date(2024, 1, 2), "alice", "p3", 2, -1, "meh"),
+    ("c4", "berkeley", date(2024, 1, 2), None, "p3", 1, None, "[deleted]"),
+    ("c5", "ucla", date(2024, 1, 1), "alice", "p2", 1, 1, "agree"),
+    ("p4", "ucla", date(2024, 1, 5), "dave", None, 100, 1, "Later post")
+]
+
+
+@pytest.fixture
+def meta_text_parquet(tmp_path) -> str:
+    """The merged meta text parquet file of the fixture rows"""
+    ids, subreddits, create_dates, authornames, parents, scores, sentiments, texts = zip(*META_TEXT_ROWS)
+    meta_text_df = pd.DataFrame({
+        "id" : ids,
+        "url" : [f"https://www.reddit.com/r/{subreddit}/comments/{cur_id}" for cur_id, subreddit in zip(ids, subreddits)],
+        "score" : pd.array(scores, dtype="Int64"),
+        "author_url" : [f"https://www.reddit.com/user/{name}" if name else None for name in authornames],
+        "authorname" : authornames,
+        "parent" : parents,
+        "create_date" : create_dates,
+        "subreddit" : subreddits,
+        "text" : texts,
+        "sentiment" : pd.array(sentiments, dtype="Int64")
+    })
+    parquet_path = tmp_path / "meta_text.parquet"
+    meta_text_df.to_parquet(parquet_path)
+    return str(parquet_path)
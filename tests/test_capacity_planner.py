@@ -0,0 +1,59 @@
+import json
+
+from etl import capacity_planner
+
+# Idea:
+# The planner is deterministic, so small backlogs give worker counts that can be worked out by hand
+# At the default 60 minute target a scrape worker takes 36000 rows, an image worker 14400 images
+#   scrape       -> the fewest clients whose lpt makespan fits, all of them(at most one per subreddit) if none fits
+#   image scrape -> ceil(image rows / 14400), at most MAX_IMAGE_WORKERS
+#   caption      -> the single gpu, only flagged
+
+
+def test_plan_capacity_fits_the_target():
+    volumes = {"a" : 30000.0, "b" : 20000.0, "c" : 10000.0}
+    plan = capacity_planner.plan_capacity(volumes, 20000, 3)
+    stages = plan["stages"]
+    # one worker scrapes 60000 rows, two split them 30000/30000
+    assert stages["scrape"]["workers"] == 2 and stages["scrape"]["expected_minutes"] == 50.0
+    assert stages["scrape"]["backlog"] == 60000.0 and not stages["scrape"]["over_target"]
+    assert stages["image_scrape"]["workers"] == 2 and stages["image_scrape"]["expected_minutes"] == 41.7
+    assert stages["caption"]["workers"] == 1 and stages["caption"]["expected_minutes"] == 66.7
+    assert stages["caption"]["over_target"]
+    assert capacity_planner.terraform_variables(plan) == {"scrape_machine_count" : 2, "image_machine_count" : 2}
+
+
+def test_scrape_workers_limits():
+    # a single subreddit cannot be split, however many clients there are
+    assert capacity_planner.scrape_workers({"a" : 100000.0}, 4, 60) == (1, 100000.0)
+    # no count fits, so every client is used
+    volumes = {"a" : 50000.0, "b" : 50000.0, "c" : 50000.0}
+    assert capacity_planner.scrape_workers(volumes, 2, 60) == (2, 100000.0)
+    plan = capacity_planner.plan_capacity(volumes, 0, 2)
+    assert plan["stages"]["scrape"]["expected_minutes"] == 166.7 and plan["stages"]["scrape"]["over_target"]
+
+
+def test_image_workers():
+    plan = capacity_planner.plan_capacity({"a" : 1.0}, 0, 1)
+    # no image rows keep the image scraping on the scrape VMs
+    assert capacity_planner.terraform_variables(plan)["image_machine_count"] == 0
+    assert plan["stages"]["image_scrape"]["expected_minutes"] == 0.0
+    assert capacity_planner.plan_capacity({"a" : 1.0}, 14401, 1)["stages"]["image_scrape"]["workers"] == 2
+    plan = capacity_planner.plan_capacity({"a" : 1.0}, 10 ** 7, 1)
+    assert plan["stages"]["image_scrape"]["workers"] == capacity_planner.MAX_IMAGE_WORKERS
+    assert plan["stages"]["image_scrape"]["over_target"]
+
+
+def test_capacity_plan_main_writes_the_terraform_variables(tmp_path, monkeypatch):
+    from etl.local_storage import LocalStorageClient
+    storage_client = LocalStorageClient(str(tmp_path))
+    config = {"subreddits" : ["a", "b"], "directory" : "2024-01-01-2024-01-02", "client_id" : ["id1", "id2"],
+              "image_bucket" : "image", "spark_bucket" : "spark"}
+    # 20000 rows per day of both subreddits, no combined.parquet yet
+    monkeypatch.setattr(capacity_planner, "read_manifest_volumes", lambda config : {"a" : 20000.0, "b" : 20000.0})
+    monkeypatch.setattr(capacity_planner, "read_history", lambda config, table_id : None)
+    variables = capacity_planner.capacity_plan_main(config, "table", storage_client = storage_client)
+    # 40000 rows each over 2 days, 4000 estimated image rows
+    assert variables == {"scrape_machine_count" : 2, "image_machine_count" : 1}
+    blob = storage_client.bucket("spark").blob(capacity_planner.CAPACITY_PLAN_PATH.format(directory = config["directory"]))
+    assert json.loads(blob.download_as_text()) == variables
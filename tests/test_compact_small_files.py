@@ -0,0 +1,73 @@
+import os
+from datetime import date
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from etl import compact_small_files
+from etl.local_storage import LocalStorageClient
+
+# Idea:
+# A chunk re-scraped during the compaction keeps its new file, its old rows must leave the compacted file
+# The compacted file is sorted by (subreddit, create_date, id), the bin is read in the order of the file sizes,
+# so the chunks below cross in the sort order:
+#   a-ucla     -> ucla z1, z2, the largest chunk(a long text) read first
+#   b-berkeley -> berkeley a1, sorted before every row of a-ucla, rewritten while the bin is compacted
+#   c-ucla     -> ucla b1, sorted between the rows of the other chunks
+
+DIRECTORY = "2024-01-01-2024-01-02"
+CHUNKS = {"a-ucla" : ([("ucla", "z1"), ("ucla", "z2")], 4000), "b-berkeley" : ([("berkeley", "a1")], 10),
+          "c-ucla" : ([("ucla", "b1")], 1000)}
+
+
+def chunk_table(rows : list[tuple], text_length : int) -> pa.Table:
+    # the random text keeps the size of a chunk after the compression
+    texts = [os.urandom(text_length).hex() for _ in rows]
+    return pa.table({"id" : [row_id for _, row_id in rows], "subreddit" : [subreddit for subreddit, _ in rows],
+                     "create_date" : [date(2024, 1, 1)] * len(rows), "text" : texts})
+
+
+@pytest.fixture
+def storage_client(tmp_path) -> LocalStorageClient:
+    (tmp_path / "meta").mkdir()
+    storage_client = LocalStorageClient(str(tmp_path))
+    for name, (rows, text_length) in CHUNKS.items():
+        local_path = tmp_path / f"{name}.parquet"
+        pq.write_table(chunk_table(rows, text_length), local_path)
+        storage_client.bucket("meta").blob(f"{DIRECTORY}/{name}.parquet").upload_from_filename(str(local_path))
+    return storage_client
+
+
+def compacted_ids(storage_client) -> list[str]:
+    blobs = [blob for blob in storage_client.list_blobs("meta", prefix = f"{DIRECTORY}/compacted-")]
+    return [row_id for blob in blobs for row_id in pq.read_table(storage_client.path_of("meta", blob.name)).column("id").to_pylist()]
+
+
+def test_compaction(storage_client):
+    report = compact_small_files.compact_small_files_main("meta", DIRECTORY, min_file_age_seconds = 0, storage_client = storage_client)
+    assert report["files_after"] == 1
+    assert compacted_ids(storage_client) == ["a1", "b1", "z1", "z2"]
+
+
+def test_rewritten_source_rows_leave_the_compacted_file(storage_client, tmp_path, monkeypatch):
+    compact_bin = compact_small_files.compact_bin
+
+    def compact_bin_then_rewrite(*args, **kwargs):
+        bin_dict = compact_bin(*args, **kwargs)
+        # the scraper writes the chunk again after it was read
+        local_path = tmp_path / "rewritten.parquet"
+        pq.write_table(chunk_table([("berkeley", "a1"), ("berkeley", "a2")], 10), local_path)
+        storage_client.bucket("meta").blob(f"{DIRECTORY}/b-berkeley.parquet").upload_from_filename(str(local_path))
+        return bin_dict
+
+    monkeypatch.setattr(compact_small_files, "compact_bin", compact_bin_then_rewrite)
+    report = compact_small_files.compact_small_files_main("meta", DIRECTORY, min_file_age_seconds = 0, storage_client = storage_client)
+    assert compacted_ids(storage_client) == ["b1", "z1", "z2"]
+    assert pq.read_table(storage_client.path_of("meta", f"{DIRECTORY}/b-berkeley.parquet")).column("id").to_pylist() == ["a1", "a2"]
+    assert report["files_after"] == 2
+    manifest, _ = compact_small_files.load_compaction_manifest(storage_client.bucket("meta"), DIRECTORY)
+    bin_dict = manifest["bins"][0]
+    assert bin_dict["status"] == "committed" and bin_dict["rows"] == 3
+    assert sorted(source["name"] for source in bin_dict["sources"]) == [f"{DIRECTORY}/a-ucla.parquet", f"{DIRECTORY}/c-ucla.parquet"]
+    assert all("ids" not in source for source in bin_dict["sources"])
@@ -0,0 +1,60 @@
+from pathlib import Path
+
+import pandas as pd
+
+from etl import generate_data_for_report as report
+
+# Idea:
+# The duckdb backend runs the bigquery sql of the reports through the dialect shim(bigquery_to_duckdb)
+# A small meta text table is run through every report, the rollup and the history merge with duckdb
+# and the csv files are compared with the results bigquery gives for the same rows(fixtures/duckdb_reports)
+# The fixture covers the rewrites: a text longer than the preview(SUBSTR 0), the double quoted dates and strings,
+# the PARTITION/CLUSTER clauses of the history table, a null author and sentiment, a row outside the date range
+
+SQL_PARENT_PROJECT = Path(__file__).resolve().parents[1] / "airflows" / "scripts" / "etl" / "sql_queries"
+EXPECTED_DIR = Path(__file__).resolve().parent / "fixtures" / "duckdb_reports"
+START_DATE, END_DATE = "2024-01-01", "2024-01-02"
+# the reports without an ORDER BY are compared in this order
+ROW_ORDER = {"basic_statistics" : [], "post_breakdown" : ["subreddit", "date"], "comments_breakdown" : ["subreddit", "date"],
+             "sentiment_score" : ["subreddit", "date"], "history" : ["subreddit", "date"]}
+
+
+def read_csv(csv_path : Path, report_name : str) -> pd.DataFrame:
+    report_df = pd.read_csv(csv_path)
+    if ROW_ORDER.get(report_name):
+        report_df = report_df.sort_values(ROW_ORDER[report_name]).reset_index(drop=True)
+    return report_df
+
+
+def test_bigquery_to_duckdb_rewrites():
+    sql_str = """CREATE TABLE IF NOT EXISTS `p.d.t_history` (subreddit STRING)
+PARTITION BY `date`
+CLUSTER BY subreddit;
+SELECT SUBSTR(text, 0, 75), SUBSTR(text, 2, 3) FROM `p.d.t` WHERE create_date >= DATE("2024-01-01") AND x = "a b\""""
+    duckdb_sql = report.bigquery_to_duckdb(sql_str, {"p.d.t" : "read_parquet('t.parquet')"})
+    assert "PARTITION BY" not in duckdb_sql and "CLUSTER BY" not in duckdb_sql
+    assert "SUBSTR(text, 1, 75)" in duckdb_sql and "SUBSTR(text, 2, 3)" in duckdb_sql
+    assert "DATE('2024-01-01')" in duckdb_sql and "x = 'a b'" in duckdb_sql
+    assert "FROM read_parquet('t.parquet')" in duckdb_sql and '"p.d.t_history"' in duckdb_sql
+
+
+def test_duckdb_reports_match_bigquery(meta_text_parquet, tmp_path):
+    output_dir = tmp_path / "reports"
+    report.generate_data_local(meta_text_parquet, str(output_dir), str(SQL_PARENT_PROJECT), START_DATE, END_DATE, use_cache=False)
+    for report_name in report.DASHBOARD_REPORTS:
+        expected_df = read_csv(EXPECTED_DIR / f"{report_name}.csv", report_name)
+        report_df = read_csv(output_dir / f"{report_name}.csv", report_name)
+        pd.testing.assert_frame_equal(report_df, expected_df, check_dtype=False, obj=report_name)
+
+
+def test_duckdb_history_merge(meta_text_parquet, tmp_path):
+    output_dir = tmp_path / "reports"
+    history_path = tmp_path / "history.parquet"
+    # a second run of the same rows replaces its dates instead of adding them again
+    for _ in range(2):
+        report.generate_data_local(meta_text_parquet, str(output_dir), str(SQL_PARENT_PROJECT), START_DATE, END_DATE,
+                                   use_cache=False, history_path=str(history_path))
+    history_df = pd.read_parquet(history_path)
+    history_df["date"] = pd.to_datetime(history_df["date"]).dt.strftime("%Y-%m-%d")
+    history_df = history_df.sort_values(ROW_ORDER["history"]).reset_index(drop=True)
+    pd.testing.assert_frame_equal(history_df, read_csv(EXPECTED_DIR / "history.csv", "history"), check_dtype=False)
@@ -0,0 +1,60 @@
+import shutil
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from etl import generate_data_for_report as report
+
+# Idea:
+# A cached report is only valid for the sql it ran and every sql it reads through
+# Run the local reports with the cache, then change one input at a time and check which reports run again
+#   nothing changed     -> every report is restored from the cache
+#   the date range      -> every report(the rollup filters the dates, the reports reading it have none of their own)
+#   rollup.sql          -> every report reading the rollup table
+#   a candidate query   -> only its top-k-first report
+
+SQL_PARENT_PROJECT = Path(__file__).resolve().parents[1] / "airflows" / "scripts" / "etl" / "sql_queries"
+START_DATE, END_DATE = "2024-01-01", "2024-01-02"
+
+
+@pytest.fixture
+def sql_dir(tmp_path) -> Path:
+    """A copy of the sql queries the test can edit"""
+    return Path(shutil.copytree(SQL_PARENT_PROJECT, tmp_path / "sql_queries"))
+
+
+def ran_reports(parquet_path : str, output_dir : Path, sql_dir : Path, start_date : str = START_DATE, end_date : str = END_DATE) -> set:
+    """The reports that missed the cache"""
+    timings = report.generate_data_local(parquet_path, str(output_dir), str(sql_dir), start_date, end_date)
+    return {timing["report"] for timing in timings}
+
+
+def test_unchanged_reports_hit_the_cache(meta_text_parquet, tmp_path, sql_dir):
+    assert ran_reports(meta_text_parquet, tmp_path / "reports", sql_dir) == set(report.DASHBOARD_REPORTS)
+    assert ran_reports(meta_text_parquet, tmp_path / "reports", sql_dir) == set()
+
+
+def test_date_range_misses_the_rollup_reports(meta_text_parquet, tmp_path, sql_dir):
+    output_dir = tmp_path / "reports"
+    ran_reports(meta_text_parquet, output_dir, sql_dir)
+    assert ran_reports(meta_text_parquet, output_dir, sql_dir, START_DATE, START_DATE) == set(report.DASHBOARD_REPORTS)
+    # the statistics are those of the new range, not the cached ones
+    basic_statistics = pd.read_csv(output_dir / "basic_statistics.csv").iloc[0]
+    assert (basic_statistics["Number of Posts"], basic_statistics["Number of Comments"]) == (2, 2)
+
+
+def test_rollup_sql_misses_the_rollup_reports(meta_text_parquet, tmp_path, sql_dir):
+    ran_reports(meta_text_parquet, tmp_path / "reports", sql_dir)
+    rollup_path = sql_dir / report.ROLLUP_DIR / f"{report.ROLLUP_DIR}.sql"
+    rollup_path.write_text(rollup_path.read_text().replace("GROUP BY", "\nGROUP BY"))
+    rollup_reports = {path.stem for path in sql_dir.glob("*.sql") if report.ROLLUP_TABLE_SUFFIX in path.read_text()}
+    assert ran_reports(meta_text_parquet, tmp_path / "reports", sql_dir) == rollup_reports
+    assert "top_score_posts" not in rollup_reports
+
+
+def test_candidate_sql_misses_its_report(meta_text_parquet, tmp_path, sql_dir):
+    ran_reports(meta_text_parquet, tmp_path / "reports", sql_dir)
+    candidate_path = sql_dir / report.TOP_K_DIR / "top_score_posts.sql"
+    candidate_path.write_text(candidate_path.read_text().replace("LIMIT 100", "LIMIT 50"))
+    assert ran_reports(meta_text_parquet, tmp_path / "reports", sql_dir) == {"top_score_posts"}
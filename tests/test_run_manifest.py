@@ -0,0 +1,51 @@
+from etl.local_storage import LocalStorageClient
+from etl.run_manifest import (fingerprint_blob, fingerprint_content, join_plan_attributes, load_run_manifest,
+    record_stage, stage_is_complete)
+
+# Idea:
+# Every project init uploads the spark job files again, a re-run must still skip the finished stages
+# The job file is fingerprinted by its content, so an upload of the same bytes keeps the stage complete
+# while a changed job file runs the stage again
+# The join plan of a merge is recorded with its stage and as the attributes of its span
+
+DIRECTORY = "2024-01-01-2024-01-02"
+
+
+def upload_job_file(storage_client, tmp_path, content : bytes):
+    local_path = tmp_path / "dataproc_merge_files.py"
+    local_path.write_bytes(content)
+    storage_client.bucket("spark").blob("dataproc_merge_files.py").upload_from_filename(str(local_path))
+
+
+def test_reuploaded_job_file_keeps_the_stage_complete(tmp_path):
+    (tmp_path / "spark").mkdir()
+    storage_client = LocalStorageClient(str(tmp_path))
+    upload_job_file(storage_client, tmp_path, b"print('merge')\n")
+    inputs = {"job_file" : fingerprint_content(storage_client, "spark", "dataproc_merge_files.py")}
+    generation_inputs = {"job_file" : fingerprint_blob(storage_client, "spark", "dataproc_merge_files.py")}
+    record_stage(storage_client, "spark", DIRECTORY, "merge_meta_bucket", inputs, [])
+
+    upload_job_file(storage_client, tmp_path, b"print('merge')\n")
+    manifest = load_run_manifest(storage_client, "spark", DIRECTORY)
+    assert stage_is_complete(manifest, "merge_meta_bucket",
+                             {"job_file" : fingerprint_content(storage_client, "spark", "dataproc_merge_files.py")})
+    # the generation changed with the upload
+    assert fingerprint_blob(storage_client, "spark", "dataproc_merge_files.py") != generation_inputs["job_file"]
+
+    upload_job_file(storage_client, tmp_path, b"print('merge v2')\n")
+    assert not stage_is_complete(manifest, "merge_meta_bucket",
+                                 {"job_file" : fingerprint_content(storage_client, "spark", "dataproc_merge_files.py")})
+    assert fingerprint_content(storage_client, "spark", "missing.py") is None
+
+
+def test_join_plan_is_recorded_with_the_stage(tmp_path):
+    (tmp_path / "spark").mkdir()
+    storage_client = LocalStorageClient(str(tmp_path))
+    join_plan = {"df1_bytes" : 2**30, "df2_bytes" : 2**20, "hot_keys" : ["t3_a", "t3_b"], "strategy" : "broadcast",
+                 "timings" : {"analysis_seconds" : 1.5, "write_seconds" : 30.0}}
+    record_stage(storage_client, "spark", DIRECTORY, "merge_meta_bucket", {}, [], {"join_plan" : join_plan})
+    manifest = load_run_manifest(storage_client, "spark", DIRECTORY)
+    assert manifest["stages"]["merge_meta_bucket"]["join_plan"] == join_plan
+    assert stage_is_complete(manifest, "merge_meta_bucket", {})
+    assert join_plan_attributes(join_plan) == {"join_strategy" : "broadcast", "df1_bytes" : 2**30, "df2_bytes" : 2**20,
+                                               "hot_keys" : 2, "analysis_seconds" : 1.5, "write_seconds" : 30.0}
@@ -0,0 +1,65 @@
+import pandas as pd
+import pytest
+
+from etl import scrape_scheduler
+
+# Idea:
+# The scheduler is deterministic, so small volumes give a plan that can be worked out by hand
+#   lpt          -> the largest subreddit first, onto the connection with the least expected rows
+#   ties         -> broken by the subreddit order
+#   estimates    -> the first source with an estimate wins, the unknown subreddits count as the median
+#   history      -> the rows per day of the last lookback days
+
+
+def test_lpt_schedule_packs_the_largest_first():
+    volumes = {"a" : 7.0, "b" : 5.0, "c" : 4.0, "d" : 3.0, "e" : 3.0}
+    schedule = scrape_scheduler.lpt_schedule(list(volumes), volumes, 2)
+    assert schedule["assignments"] == {"a" : 0, "b" : 1, "c" : 1, "d" : 0, "e" : 1}
+    assert schedule["loads"] == [10.0, 12.0]
+    # the round robin plan puts a, c and e on the same connection
+    assert scrape_scheduler.round_robin_schedule(list(volumes), volumes, 2)["loads"] == [14.0, 8.0]
+
+
+def test_lpt_schedule_ties_follow_the_subreddit_order():
+    volumes = {"x" : 1.0, "y" : 1.0, "z" : 1.0}
+    schedule = scrape_scheduler.lpt_schedule(["z", "x", "y"], volumes, 2)
+    assert schedule["assignments"] == {"z" : 0, "x" : 1, "y" : 0}
+    assert schedule["loads"] == [2.0, 1.0]
+
+
+def test_lpt_schedule_more_connections_than_subreddits():
+    volumes = {"a" : 2.0, "b" : 1.0}
+    schedule = scrape_scheduler.lpt_schedule(list(volumes), volumes, 3)
+    assert schedule["assignments"] == {"a" : 0, "b" : 1}
+    assert schedule["loads"] == [2.0, 1.0, 0.0]
+
+
+def test_lpt_schedule_without_connections():
+    with pytest.raises(ValueError):
+        scrape_scheduler.lpt_schedule(["a"], {"a" : 1.0}, 0)
+
+
+def test_estimate_volumes():
+    manifest = {"a" : 10.0}
+    history = {"a" : 1.0, "b" : 2.0, "c" : 6.0}
+    volumes = scrape_scheduler.estimate_volumes(["a", "b", "c", "d"], manifest, history)
+    # the manifest wins for a, d has no estimate and gets the median of 2, 6 and 10
+    assert volumes == {"a" : 10.0, "b" : 2.0, "c" : 6.0, "d" : 6.0}
+    assert scrape_scheduler.estimate_volumes(["a"], {}, {}) == {"a" : 1.0}
+
+
+def test_history_volumes_lookback():
+    history_df = pd.DataFrame({
+        "subreddit" : ["a", "a", "a", "b"],
+        "date" : ["2024-01-01", "2024-01-09", "2024-01-10", "2024-01-10"],
+        "n_posts" : [100, 4, 6, None],
+        "n_comments" : [100, 6, 4, 8]
+    })
+    # 2024-01-01 is outside the last 2 days
+    assert scrape_scheduler.history_volumes(history_df, lookback_days=2) == {"a" : 10.0, "b" : 4.0}
+    assert scrape_scheduler.history_volumes(None) == {}
+
+
+def test_directory_days():
+    assert scrape_scheduler.directory_days("2024-01-01-2024-01-07") == 7
+    assert scrape_scheduler.directory_days("2024-02-28-2024-03-01") == 3
@@ -0,0 +1,67 @@
+import pytest
+
+from etl.local_storage import LocalStorageClient
+from etl import segment_log
+from etl.segment_log import SegmentLog
+
+# Idea:
+# A rerun(or a retry) of the scraper writes to the image log of the run before it
+#   the stale _CLOSED  -> a consumer with the token of the new run keeps waiting instead of returning at once
+#   the reset          -> the producer drops the _CLOSED and the offsets, the new segments come after the old ones
+# The log runs on the local storage client, a consumer is read one segment at a time
+
+PREFIX = "streams/2024-01-01-2024-01-02/ucla/image_meta"
+
+
+@pytest.fixture
+def storage_client(tmp_path) -> LocalStorageClient:
+    (tmp_path / "image").mkdir()
+    return LocalStorageClient(str(tmp_path))
+
+
+@pytest.fixture
+def segment_path(tmp_path) -> str:
+    local_path = tmp_path / "segment.parquet"
+    local_path.write_bytes(b"segment")
+    return str(local_path)
+
+
+def produce(storage_client, segment_path : str, token : str, n_segments : int) -> SegmentLog:
+    producer = SegmentLog(storage_client, "image", PREFIX, token)
+    producer.reset()
+    for _ in range(n_segments):
+        producer.append(segment_path)
+    producer.close()
+    return producer
+
+
+def test_consumer_ignores_the_close_of_an_earlier_run(storage_client, segment_path):
+    produce(storage_client, segment_path, "run1", 2)
+    assert [offset for offset, _ in SegmentLog(storage_client, "image", PREFIX, "run1").consume("c", 0)] == [0, 1]
+    # the consumer of the next run starts before its producer, the _CLOSED of run1 does not end it
+    consumer = SegmentLog(storage_client, "image", PREFIX, "run2")
+    assert consumer.closed_segments() is None
+    with pytest.raises(TimeoutError):
+        list(consumer.consume("c", 0, idle_timeout_seconds = 0))
+
+
+def test_reset_drops_the_close_and_the_offsets(storage_client, segment_path):
+    produce(storage_client, segment_path, "run1", 2)
+    list(SegmentLog(storage_client, "image", PREFIX, "run1").consume("c", 0))
+    producer = SegmentLog(storage_client, "image", PREFIX, "run2")
+    producer.reset()
+    assert SegmentLog(storage_client, "image", PREFIX).closed_segments() is None
+    assert producer.committed("c") == 0
+    # the segments of run1 stay, run2 appends after them and the consumer reads them all again(at least once)
+    assert producer.append(segment_path) == 2
+    producer.close()
+    assert [offset for offset, _ in SegmentLog(storage_client, "image", PREFIX, "run2").consume("c", 0)] == [0, 1, 2]
+    # a reset of an empty log has nothing to delete
+    SegmentLog(storage_client, "image", "streams/empty").reset()
+
+
+def test_waiting_consumer_prints_a_heartbeat(storage_client, capsys, monkeypatch):
+    monkeypatch.setattr(segment_log, "HEARTBEAT_SECONDS", 0.0)
+    with pytest.raises(TimeoutError):
+        list(SegmentLog(storage_client, "image", PREFIX, "run1").consume("c", 0.01, idle_timeout_seconds = 0.05))
+    assert f"waiting for segment 0 of {PREFIX}" in capsys.readouterr().out
@@ -0,0 +1,65 @@
+import importlib.util
+
+import pytest
+
+from etl.ssh_connections import register_ssh_connections, SSH_LOGIN
+
+if importlib.util.find_spec("airflow") is None:
+    pytest.skip("the ssh connections are registered in the airflow metadata db", allow_module_level=True)
+
+# Idea:
+# Register the ssh connections twice in a temporary sqlite airflow metadata db(like benchmarks/ssh_connection_registration.py)
+#   the same hosts -> nothing changes, a connection is never added twice
+#   a moved VM     -> only its host is updated
+#   a new extra    -> every connection is updated
+# The metadata db is set in the environment and the orm is configured again, so the db of the image is never touched,
+# the environment and the orm are restored after every test
+
+EXTRA = '{"key_file": "/opt/airflow/ssh/id_rsa", "pulic_key": "ssh-rsa AAAA", "port": 22}'
+HOSTS = {"ssh_0" : "10.0.0.2", "ssh_1" : "10.0.0.3", "ssh_image_0" : "10.0.0.4", "ssh_gpu" : "10.0.0.5"}
+
+
+@pytest.fixture
+def metadata_db(tmp_path, monkeypatch):
+    """A new sqlite airflow metadata db with its tables, the environment and the orm of the session are restored after"""
+    monkeypatch.setenv("AIRFLOW__DATABASE__SQL_ALCHEMY_CONN", f"sqlite:///{tmp_path / 'airflow.db'}")
+    monkeypatch.setenv("AIRFLOW__CORE__LOAD_EXAMPLES", "False")
+    from airflow import settings
+    from airflow.utils import db
+    settings.configure_vars()
+    settings.configure_orm()
+    db.initdb(load_connections=False)
+    yield
+    settings.dispose_orm()
+    monkeypatch.undo()
+    settings.configure_vars()
+    settings.configure_orm()
+
+
+def stored_connections() -> dict:
+    """conn_id -> (host, login, extra) of every connection in the metadata db, fails on a duplicate conn_id"""
+    from airflow.models import Connection
+    from airflow.utils.session import create_session
+    with create_session() as session:
+        rows = [(conn.conn_id, conn.host, conn.login, conn.extra) for conn in session.query(Connection)]
+    conn_ids = [row[0] for row in rows]
+    assert len(conn_ids) == len(set(conn_ids))
+    return {conn_id : (host, login, extra) for conn_id, host, login, extra in rows}
+
+
+def test_register_twice_is_idempotent(metadata_db):
+    assert sorted(register_ssh_connections(HOSTS, EXTRA)["added"]) == sorted(HOSTS)
+    result = register_ssh_connections(HOSTS, EXTRA)
+    assert result["added"] == [] and result["updated"] == [] and sorted(result["unchanged"]) == sorted(HOSTS)
+    assert stored_connections() == {conn_id : (host, SSH_LOGIN, EXTRA) for conn_id, host in HOSTS.items()}
+
+
+def test_register_updates_the_moved_hosts(metadata_db):
+    register_ssh_connections(HOSTS, EXTRA)
+    moved_hosts = dict(HOSTS, ssh_1 = "10.0.0.9")
+    result = register_ssh_connections(moved_hosts, EXTRA)
+    assert result["added"] == [] and result["updated"] == ["ssh_1"]
+    assert stored_connections() == {conn_id : (host, SSH_LOGIN, EXTRA) for conn_id, host in moved_hosts.items()}
+    new_extra = EXTRA.replace("id_rsa", "id_ed25519")
+    assert sorted(register_ssh_connections(moved_hosts, new_extra)["updated"]) == sorted(HOSTS)
+    assert stored_connections() == {conn_id : (host, SSH_LOGIN, new_extra) for conn_id, host in moved_hosts.items()}
@@ -0,0 +1,28 @@
+from etl.trace_summary import latest_finisher_chain
+
+# Idea:
+# Two spans that ran side by side are not a chain, only a span that ended by the start of the next one(within the
+# clock skew, scaled to the span durations) is its predecessor, so the shares of the chain never pass 100%
+
+
+def root_span(span_id : str, start : float, end : float) -> dict:
+    return {"span_id" : span_id, "parent_span_id" : None, "name" : span_id, "start" : start, "end" : end,
+            "duration" : end - start, "error" : None}
+
+
+def chain_shares(chain : list[dict]) -> float:
+    run_seconds = chain[-1]["end"] - chain[0]["start"]
+    return sum((span_dict["duration"] + span_dict["wait_seconds"]) / run_seconds for span_dict in chain)
+
+
+def test_concurrent_spans_are_not_chained():
+    chain = latest_finisher_chain([root_span("a", 0.0, 2.0), root_span("b", 1.5, 3.5)])
+    assert [span_dict["span_id"] for span_dict in chain] == ["b"]
+    assert chain_shares(chain) <= 1.0
+
+
+def test_back_to_back_spans_within_the_clock_skew_are_chained():
+    chain = latest_finisher_chain([root_span("a", 0.0, 10.0), root_span("b", 9.8, 20.0), root_span("c", 25.0, 30.0)])
+    assert [span_dict["span_id"] for span_dict in chain] == ["a", "b", "c"]
+    assert chain[-1]["wait_seconds"] == 5.0
+    assert abs(chain_shares(chain) - 1.0) < 0.05
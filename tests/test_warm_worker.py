@@ -0,0 +1,95 @@
+import json
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+from etl import tracing, warm_worker
+
+# Idea:
+# A worker runs one job at a time, the jobs of the other subreddits of the VM wait for the lock
+#   a queued job -> sends a heartbeat line, the ssh command of its task is never silent for cmd_timeout
+#   a client gone while queued -> the job is dropped, a retried task does not run it a second time
+# The worker serves a small module whose main(argv) blocks until the test releases it
+
+JOB_MODULE = """
+import threading
+started, release, runs = threading.Event(), threading.Event(), []
+
+def main(argv):
+    runs.append(argv)
+    started.set()
+    release.wait(10)
+    print("done", *argv)
+"""
+
+
+@pytest.fixture
+def worker(tmp_path, monkeypatch):
+    (tmp_path / "blocking_job.py").write_text(JOB_MODULE)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    # the services import the copy of etl/tracing.py
+    monkeypatch.setitem(sys.modules, "tracing", tracing)
+    monkeypatch.setattr(warm_worker, "QUEUE_HEARTBEAT_SECONDS", 0.05)
+    # a new module(and new events) for every test
+    monkeypatch.delitem(sys.modules, "blocking_job", raising = False)
+    socket_path = str(tmp_path / "worker.sock")
+    threading.Thread(target = warm_worker.serve, args = ("blocking_job", socket_path), daemon = True).start()
+    # the worker binds its socket after the import
+    deadline = time.time() + 5
+    while not os.path.exists(socket_path) and time.time() < deadline:
+        time.sleep(0.01)
+    blocking_job = sys.modules["blocking_job"]
+    yield socket_path, blocking_job
+    blocking_job.release.set()
+
+
+def submit_in_thread(socket_path : str, argv : list[str]) -> dict:
+    """Send the job like warm_worker.submit and collect its messages(redirect_stdout is not per thread)"""
+    result = {"messages" : []}
+
+    def run():
+        with warm_worker.connect(socket_path) as sock:
+            sock.sendall((json.dumps({"argv" : argv}) + "\n").encode())
+            for line in sock.makefile("r"):
+                result["messages"].append(json.loads(line))
+                if "exit" in result["messages"][-1]:
+                    return
+    result["thread"] = threading.Thread(target = run, daemon = True)
+    result["thread"].start()
+    return result
+
+
+def output_of(result : dict) -> str:
+    return "".join(message.get("log", "") for message in result["messages"])
+
+
+def test_queued_job_sends_a_heartbeat(worker):
+    socket_path, blocking_job = worker
+    first = submit_in_thread(socket_path, ["first"])
+    assert blocking_job.started.wait(5)
+    second = submit_in_thread(socket_path, ["second"])
+    time.sleep(0.3)
+    blocking_job.release.set()
+    for result in [first, second]:
+        result["thread"].join(5)
+        assert result["messages"][-1]["exit"] == 0
+    assert "queued behind the running job" in output_of(second) and "done second" in output_of(second)
+    assert "queued" not in output_of(first)
+    assert blocking_job.runs == [["first"], ["second"]]
+
+
+def test_queued_job_of_a_gone_client_is_dropped(worker):
+    socket_path, blocking_job = worker
+    first = submit_in_thread(socket_path, ["first"])
+    assert blocking_job.started.wait(5)
+    sock = warm_worker.connect(socket_path)
+    sock.sendall((json.dumps({"argv" : ["gone"]}) + "\n").encode())
+    sock.close()
+    time.sleep(0.3)
+    blocking_job.release.set()
+    first["thread"].join(5)
+    time.sleep(0.2)
+    assert blocking_job.runs == [["first"]]